@@ -0,0 +1,54 @@
+# coding: utf-8
+# Data loading benchmark: `get_batch_data` on synthetic 800x600 images, with and without augmentation.
+
+from __future__ import division, print_function
+
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+
+from benchmarks.common import measure
+from utils.data_utils import get_batch_data
+
+NUM_CLASS = 1
+ANCHORS = np.array([[10, 13], [16, 30], [33, 23], [30, 61], [62, 45], [59, 119], [116, 90], [156, 198], [373, 326]],
+                   np.float32)
+
+
+def write_synthetic_set(directory, num_images=8, width=800, height=600, nV=8, seed=0):
+    '''
+    Random JPEG images and their annotation lines in the final_train.txt format.
+    '''
+    rng = np.random.RandomState(seed)
+    lines = []
+    for i in range(num_images):
+        img = rng.randint(0, 256, (height, width, 3)).astype(np.uint8)
+        path = os.path.join(directory, '{}.jpg'.format(i))
+        cv2.imwrite(path, img)
+        x_min, y_min = rng.uniform(50, 300), rng.uniform(50, 200)
+        x_max, y_max = x_min + rng.uniform(100, 400), y_min + rng.uniform(100, 300)
+        keypoints = np.c_[rng.uniform(x_min, x_max, nV), rng.uniform(y_min, y_max, nV)].reshape(-1)
+        lines.append('{} {} {} {} 0 {:.1f} {:.1f} {:.1f} {:.1f} {}'.format(
+            i, path, width, height, x_min, y_min, x_max, y_max, ' '.join('{:.1f}'.format(v) for v in keypoints)))
+    return np.array(lines)
+
+
+def bench_batch_data(batch_size=8, img_size=(416, 416), nV=8, repeat=10, warmup=2):
+    '''
+    `get_batch_data` in 'val' mode (letterbox only) and 'train' mode (color distortion, expansion,
+    random interpolation).
+    '''
+    directory = tempfile.mkdtemp(prefix='deepurl_bench_')
+    try:
+        lines = write_synthetic_set(directory, num_images=batch_size, nV=nV)
+        results = {}
+        for mode in ('val', 'train'):
+            results['data_{}_b{}'.format(mode, batch_size)] = measure(
+                lambda: get_batch_data(lines, NUM_CLASS, list(img_size), ANCHORS, mode.encode('utf-8'), nV=nV),
+                repeat=repeat, warmup=warmup, items=batch_size)
+        return results
+    finally:
+        shutil.rmtree(directory)
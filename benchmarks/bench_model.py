@@ -0,0 +1,96 @@
+# coding: utf-8
+# TensorFlow benchmarks: forward pass, gpu_nms and the keypoint decoding, with randomly initialized weights.
+
+from __future__ import division, print_function
+
+import numpy as np
+
+from benchmarks.common import tf, measure, skipped, synthetic_boxes, synthetic_feature_maps
+
+NUM_CLASS = 1
+NV = 8
+ANCHORS = np.array([[10, 13], [16, 30], [33, 23], [30, 61], [62, 45], [59, 119], [116, 90], [156, 198], [373, 326]],
+                   np.float32)
+
+
+def _session():
+    config = tf.ConfigProto()
+    config.gpu_options.allow_growth = True
+    return tf.Session(config=config)
+
+
+def bench_forward(sizes=(320, 416, 608), batch_sizes=(1, 4, 8), repeat=10, warmup=2):
+    '''
+    `yolov3.forward` (both heads) at every input size and batch size.
+    '''
+    names = ['forward_{}_b{}'.format(size, batch_size) for size in sizes for batch_size in batch_sizes]
+    if tf is None:
+        return dict((name, skipped('tensorflow is not installed')) for name in names)
+    from model import yolov3
+
+    results = {}
+    graph = tf.Graph()
+    with graph.as_default():
+        fetches = {}
+        for i, size in enumerate(sizes):
+            input_data = tf.placeholder(tf.float32, [None, size, size, 3])
+            with tf.variable_scope('yolov3', reuse=i > 0):
+                feature_maps = yolov3(NUM_CLASS, ANCHORS, nV=NV).forward(input_data, False)
+            fetches[size] = (input_data, feature_maps)
+        init = tf.global_variables_initializer()
+
+    with graph.as_default(), _session() as sess:
+        sess.run(init)
+        for size in sizes:
+            input_data, feature_maps = fetches[size]
+            for batch_size in batch_sizes:
+                img = np.random.uniform(0, 1, (batch_size, size, size, 3)).astype(np.float32)
+                results['forward_{}_b{}'.format(size, batch_size)] = measure(
+                    lambda: sess.run(feature_maps, feed_dict={input_data: img}), repeat=repeat, warmup=warmup,
+                    items=batch_size)
+    return results
+
+
+def bench_gpu_nms(num_boxes=10647, repeat=20, warmup=3):
+    '''
+    `gpu_nms` on the number of boxes of a 416x416 input.
+    '''
+    if tf is None:
+        return {'nms_gpu_nms': skipped('tensorflow is not installed')}
+    from utils.nms_utils import gpu_nms
+
+    boxes_np, scores_np = synthetic_boxes(num_boxes, class_num=NUM_CLASS)
+    graph = tf.Graph()
+    with graph.as_default():
+        boxes = tf.placeholder(tf.float32, [1, None, 4])
+        scores = tf.placeholder(tf.float32, [1, None, NUM_CLASS])
+        nms = gpu_nms(boxes, scores, NUM_CLASS, max_boxes=1, score_thresh=0.3, nms_thresh=0.4)
+    with graph.as_default(), _session() as sess:
+        return {'nms_gpu_nms': measure(lambda: sess.run(nms, feed_dict={boxes: boxes_np, scores: scores_np}),
+                                       repeat=repeat, warmup=warmup)}
+
+
+def bench_pose_decode(size=416, batch_size=1, repeat=20, warmup=3):
+    '''
+    `PoseRegressionLoss.predict` and `predict_topk` on random feature maps.
+    '''
+    names = ['decode_predict', 'decode_predict_topk']
+    if tf is None:
+        return dict((name, skipped('tensorflow is not installed')) for name in names)
+    from pose_loss import PoseRegressionLoss
+
+    pose_maps = synthetic_feature_maps((size, size), batch_size, NUM_CLASS, NV)[3:]
+    graph = tf.Graph()
+    with graph.as_default():
+        inputs = [tf.placeholder(tf.float32, feature_map.shape) for feature_map in pose_maps]
+        pose_loss = PoseRegressionLoss(batch_size, num_classes=NUM_CLASS, nV=NV)
+        predict = pose_loss.predict(inputs, None, None, num_classes=NUM_CLASS)
+        boxes = tf.constant(np.tile([[[100., 100., 300., 300.]]], (batch_size, 1, 1)), tf.float32)
+        num_boxes = tf.ones([batch_size], tf.int32)
+        predict_topk = pose_loss.predict_topk(inputs, boxes, num_boxes, [size, size], k=12)
+    feed_dict = dict(zip(inputs, pose_maps))
+    with graph.as_default(), _session() as sess:
+        return {'decode_predict': measure(lambda: sess.run(predict, feed_dict=feed_dict), repeat=repeat,
+                                          warmup=warmup, items=batch_size),
+                'decode_predict_topk': measure(lambda: sess.run(predict_topk, feed_dict=feed_dict), repeat=repeat,
+                                               warmup=warmup, items=batch_size)}
@@ -0,0 +1,82 @@
+# coding: utf-8
+# NumPy/OpenCV benchmarks: cpu_nms/py_nms, the NumPy decoding of test_video_dnn.py and the PnP.
+
+from __future__ import division, print_function
+
+import numpy as np
+
+from benchmarks.common import measure, synthetic_boxes, synthetic_feature_maps
+from utils.nms_utils import cpu_nms, py_nms
+from utils.dnn_utils import predict
+from utils.misc_utils import get_3D_corners, compute_projection, solve_pnp
+from utils.calib_utils import get_camera
+
+NUM_CLASS = 1
+ANCHORS = np.array([[10, 13], [16, 30], [33, 23], [30, 61], [62, 45], [59, 119], [116, 90], [156, 198], [373, 326]],
+                   np.float32)
+
+
+def bench_cpu_nms(num_boxes=10647, repeat=20, warmup=3):
+    '''
+    `cpu_nms` and `py_nms` on the number of boxes of a 416x416 input.
+    '''
+    boxes, scores = synthetic_boxes(num_boxes, class_num=NUM_CLASS)
+    # py_nms alone, on the boxes which pass the score threshold of cpu_nms
+    mask = scores[0, :, 0] >= 0.3
+    return {'nms_cpu_nms': measure(lambda: cpu_nms(boxes, scores, NUM_CLASS, max_boxes=1, score_thresh=0.3,
+                                                   iou_thresh=0.4), repeat=repeat, warmup=warmup),
+            'nms_py_nms': measure(lambda: py_nms(boxes[0][mask], scores[0, :, 0][mask], max_boxes=1, iou_thresh=0.4),
+                                  repeat=repeat, warmup=warmup)}
+
+
+def bench_numpy_decode(sizes=(320, 416, 608), nV=8, repeat=20, warmup=3):
+    '''
+    `utils.dnn_utils.predict` (box decoding, cpu_nms, keypoint decoding) on random feature maps.
+    '''
+    results = {}
+    for size in sizes:
+        feature_maps = synthetic_feature_maps((size, size), 1, NUM_CLASS, nV)
+        results['decode_numpy_{}'.format(size)] = measure(
+            lambda: predict(feature_maps, ANCHORS, [size, size], NUM_CLASS, nV=nV), repeat=repeat, warmup=warmup)
+    return results
+
+
+def synthetic_candidates(num_cells, intrinsics, nV=8, noise=2.0, outliers=0.2, seed=0):
+    '''
+    Keypoint candidates of `num_cells` cells for a box-shaped object 2 m in front of the camera: the
+    projected 3D corners plus pixel noise, a fraction of them replaced by random outliers.
+    return: x, y, conf [num_cells, nV], selected [num_cells], gt_corners [nV, 3]
+    '''
+    rng = np.random.RandomState(seed)
+    vertices = np.c_[rng.uniform(-0.3, 0.3, (100, 3)), np.ones((100, 1))].transpose()
+    corners3D = get_3D_corners(vertices)[:, :nV]
+    gt_corners = np.array(np.transpose(corners3D[:3, :]), dtype='float32')
+    rt = np.c_[np.eye(3), [[0.1], [-0.05], [2.0]]]
+    proj = compute_projection(corners3D, rt, intrinsics)
+
+    x = proj[0][np.newaxis] + rng.normal(0, noise, (num_cells, nV))
+    y = proj[1][np.newaxis] + rng.normal(0, noise, (num_cells, nV))
+    wrong = rng.uniform(0, 1, (num_cells, nV)) < outliers
+    x[wrong] = rng.uniform(0, intrinsics[0, 2] * 2, wrong.sum())
+    y[wrong] = rng.uniform(0, intrinsics[1, 2] * 2, wrong.sum())
+    conf = rng.uniform(0.3, 1.0, (num_cells, nV))
+    selected = rng.uniform(0, 1, num_cells) < 0.1
+    selected[0] = True
+    return x, y, conf, selected, gt_corners
+
+
+def bench_pnp(best_counts=(4, 8, 12, 24), methods=('ransac', 'prosac'), num_cells=3549, nV=8, repeat=20,
+              warmup=3):
+    '''
+    `solve_pnp` for every candidate count (bestCnt) and method, on the 13*13+26*26+52*52 cells of a
+    416x416 input.
+    '''
+    intrinsics = get_camera('aqua_pool').K
+    x, y, conf, selected, gt_corners = synthetic_candidates(num_cells, intrinsics, nV=nV)
+    results = {}
+    for method in methods:
+        for best_cnt in best_counts:
+            results['pnp_{}_k{}'.format(method, best_cnt)] = measure(
+                lambda: solve_pnp(x, y, conf, gt_corners, selected, intrinsics, bestCnt=best_cnt, nV=nV,
+                                  method=method), repeat=repeat, warmup=warmup)
+    return results
@@ -0,0 +1,61 @@
+# coding: utf-8
+# Timing helpers shared by the benchmarks.
+
+from __future__ import division, print_function
+
+import time
+import numpy as np
+
+try:
+    import tensorflow as tf
+except ImportError:
+    # the TensorFlow benchmarks are skipped, the NumPy/OpenCV ones still run
+    tf = None
+
+
+def measure(fn, repeat=20, warmup=3, items=1):
+    '''
+    Run `fn` `warmup` times, then time `repeat` calls.
+    items: number of items (images, boxes, ...) one call processes, for the throughput
+    return: dict with mean_ms, p50_ms, p95_ms, min_ms and items_per_s (from the median)
+    '''
+    for _ in range(warmup):
+        fn()
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - start
+    p50, p95 = np.percentile(times, [50, 95])
+    return {'mean_ms': times.mean() * 1000, 'p50_ms': p50 * 1000, 'p95_ms': p95 * 1000,
+            'min_ms': times.min() * 1000, 'items_per_s': items / p50 if p50 > 0 else 0., 'repeat': repeat}
+
+
+def skipped(reason):
+    return {'skipped': reason}
+
+
+def synthetic_feature_maps(input_size, batch_size=1, class_num=1, nV=8, seed=0):
+    '''
+    Random detection and pose feature maps of a `input_size` (width, height) input, NHWC, in the order
+    returned by `yolov3.forward`.
+    '''
+    rng = np.random.RandomState(seed)
+    feature_maps = []
+    for channels in (3 * (5 + class_num), nV * 3 + class_num):
+        for stride in (32, 16, 8):
+            shape = (batch_size, input_size[1] // stride, input_size[0] // stride, channels)
+            feature_maps.append(rng.normal(0, 1, shape).astype(np.float32))
+    return feature_maps
+
+
+def synthetic_boxes(num_boxes, image_size=416, class_num=1, seed=0):
+    '''
+    Random boxes [1, N, 4] (x_min, y_min, x_max, y_max) and scores [1, N, class_num] in [0, 1].
+    '''
+    rng = np.random.RandomState(seed)
+    centers = rng.uniform(0, image_size, (num_boxes, 2))
+    sizes = rng.uniform(10, image_size / 2., (num_boxes, 2))
+    boxes = np.concatenate((centers - sizes / 2, centers + sizes / 2), axis=1).astype(np.float32)
+    scores = rng.uniform(0, 1, (num_boxes, class_num)).astype(np.float32)
+    return boxes[np.newaxis], scores[np.newaxis]
@@ -0,0 +1,134 @@
+# coding: utf-8
+# Runs the benchmarks, writes the results to a JSON file and compares them with a stored baseline.
+#
+#     python -m benchmarks.run --output baseline.json
+#     python -m benchmarks.run --baseline baseline.json --output current.json
+
+from __future__ import division, print_function
+
+import sys
+import json
+import time
+import argparse
+import platform
+
+import numpy as np
+import cv2
+
+from benchmarks.common import tf
+
+GROUPS = ('forward', 'nms', 'decode', 'pnp', 'data')
+
+parser = argparse.ArgumentParser(description="DeepURL CPU benchmarks.")
+parser.add_argument("--groups", nargs='*', type=str, default=list(GROUPS), choices=GROUPS,
+                    help="The benchmark groups to run.")
+parser.add_argument("--repeat", type=int, default=20,
+                    help="Number of timed calls of every benchmark.")
+parser.add_argument("--warmup", type=int, default=3,
+                    help="Number of untimed calls before the timed ones.")
+parser.add_argument("--output", type=str, default=None,
+                    help="JSON file the results are written to.")
+parser.add_argument("--baseline", type=str, default=None,
+                    help="JSON file of a previous run to compare the results with.")
+parser.add_argument("--tolerance", type=float, default=0.1,
+                    help="Relative slowdown of the median time reported as a regression.")
+parser.add_argument("--fail_on_regression", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to exit with status 1 if a benchmark regressed.")
+
+
+def run_group(group, repeat, warmup):
+    if group == 'forward':
+        from benchmarks.bench_model import bench_forward
+        # the forward pass is much slower, fewer calls are enough
+        return bench_forward(repeat=max(repeat // 2, 1), warmup=min(warmup, 2))
+    if group == 'nms':
+        from benchmarks.bench_model import bench_gpu_nms
+        from benchmarks.bench_postprocess import bench_cpu_nms
+        results = bench_cpu_nms(repeat=repeat, warmup=warmup)
+        results.update(bench_gpu_nms(repeat=repeat, warmup=warmup))
+        return results
+    if group == 'decode':
+        from benchmarks.bench_model import bench_pose_decode
+        from benchmarks.bench_postprocess import bench_numpy_decode
+        results = bench_numpy_decode(repeat=repeat, warmup=warmup)
+        results.update(bench_pose_decode(repeat=repeat, warmup=warmup))
+        return results
+    if group == 'pnp':
+        from benchmarks.bench_postprocess import bench_pnp
+        return bench_pnp(repeat=repeat, warmup=warmup)
+    if group == 'data':
+        from benchmarks.bench_data import bench_batch_data
+        return bench_batch_data(repeat=max(repeat // 2, 1), warmup=min(warmup, 2))
+    raise ValueError('Unknown benchmark group: {}'.format(group))
+
+
+def environment():
+    return {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'platform': platform.platform(),
+            'processor': platform.processor(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'opencv': cv2.__version__, 'tensorflow': tf.__version__ if tf is not None else None}
+
+
+def print_results(results):
+    print('{:<28}{:>10}{:>10}{:>10}{:>12}'.format('benchmark', 'p50 ms', 'p95 ms', 'min ms', 'items/s'))
+    for name in sorted(results):
+        stats = results[name]
+        if 'skipped' in stats:
+            print('{:<28}skipped: {}'.format(name, stats['skipped']))
+            continue
+        print('{:<28}{:>10.3f}{:>10.3f}{:>10.3f}{:>12.1f}'.format(name, stats['p50_ms'], stats['p95_ms'],
+                                                                  stats['min_ms'], stats['items_per_s']))
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Compare the median times of the benchmarks which ran with the ones of `baseline`.
+    return: names of the benchmarks more than `tolerance` slower than the baseline
+    '''
+    regressions = []
+    print('{:<28}{:>12}{:>12}{:>9}'.format('benchmark', 'base p50', 'p50', 'ratio'))
+    for name in sorted(results):
+        current, base = results[name], baseline.get(name)
+        if base is None or 'skipped' in current or 'skipped' in base:
+            print('{:<28}{:>12}{:>12}{:>9}'.format(name, 'n/a' if base is None or 'skipped' in base else
+                                                   '{:.3f}'.format(base['p50_ms']),
+                                                   'n/a' if 'skipped' in current else
+                                                   '{:.3f}'.format(current['p50_ms']), '-'))
+            continue
+        ratio = current['p50_ms'] / base['p50_ms'] if base['p50_ms'] > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            flag = '  faster'
+        print('{:<28}{:>12.3f}{:>12.3f}{:>9.2f}{}'.format(name, base['p50_ms'], current['p50_ms'], ratio, flag))
+    return regressions
+
+
+def main():
+    args = parser.parse_args()
+
+    results = {}
+    for group in args.groups:
+        print('Running the {} benchmarks...'.format(group))
+        results.update(run_group(group, args.repeat, args.warmup))
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': environment(), 'results': results}, f, indent=2, sort_keys=True)
+        print('Results written to {}'.format(args.output))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print('\nComparison with {} ({}):'.format(args.baseline, baseline['meta']['date']))
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print('{} regression(s): {}'.format(len(regressions), ', '.join(regressions)))
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
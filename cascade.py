@@ -0,0 +1,125 @@
+# coding: utf-8
+# Two-stage coarse-to-fine inference: the detection head alone finds the AUV on a small version of
+# the image, then the keypoint head runs on a crop around that box, at a higher resolution.
+# Both passes share the weights of the checkpoint, only the inputs differ.
+
+from __future__ import division, print_function
+
+import numpy as np
+import cv2
+import tensorflow as tf
+
+from model import yolov3
+from pose_loss import PoseRegressionLoss
+from utils.data_aug import letterbox_resize
+from utils.nms_utils import batch_nms
+from utils.tracking_utils import compute_roi
+
+
+class CascadeModel(object):
+    '''
+    det_size, pose_size: network input sizes of the two stages, [width, height] format
+    '''
+
+    def __init__(self, num_class, anchors, nV=8, det_size=(320, 320), pose_size=(416, 416), score_thresh=0.25,
+                 nms_thresh=0.35, k=12, padding=0.25):
+        self.det_size = tuple(det_size)
+        self.pose_size = tuple(pose_size)
+        self.padding = padding
+
+        # stage 2: keypoint head only, gated by the stage 1 box mapped into the crop.
+        # Built first: it creates the variables of both heads (see `yolov3.forward`), stage 1 reuses them.
+        self.pose_input = tf.placeholder(tf.float32, [None, self.pose_size[1], self.pose_size[0], 3],
+                                         name='pose_input')
+        self.pose_boxes = tf.placeholder(tf.float32, [None, 1, 4], name='pose_boxes')
+        self.pose_num_boxes = tf.placeholder(tf.int32, [None], name='pose_num_boxes')
+        pose_model = yolov3(num_class, anchors, nV=nV)
+        with tf.variable_scope('yolov3'):
+            pose_feature_maps = pose_model.forward(self.pose_input, False, heads='pose')
+        pose_loss = PoseRegressionLoss(1, num_classes=1, nV=nV)
+        self.pose_outputs = pose_loss.predict_topk(pose_feature_maps, self.pose_boxes, self.pose_num_boxes,
+                                                   [self.pose_size[1], self.pose_size[0]], k=k)
+
+        # stage 1: detection head only
+        self.det_input = tf.placeholder(tf.float32, [None, self.det_size[1], self.det_size[0], 3], name='det_input')
+        det_model = yolov3(num_class, anchors, nV=nV)
+        with tf.variable_scope('yolov3', reuse=True):
+            det_feature_maps = det_model.forward(self.det_input, False, heads='detection')
+        pred_boxes, pred_confs, pred_probs = det_model.predict(det_feature_maps)
+        self.det_outputs = batch_nms(pred_boxes, pred_confs * pred_probs, max_boxes=1, score_thresh=score_thresh,
+                                     nms_thresh=nms_thresh)
+
+    def detect(self, sess, img_batch):
+        '''
+        img_batch: [N, h, w, 3] float32 images letterboxed to det_size
+        return: boxes [N, 1, 4] in det_size input pixels, scores [N, 1], labels [N, 1], num_boxes [N]
+        '''
+        return sess.run(self.det_outputs, feed_dict={self.det_input: img_batch})
+
+    def crop(self, img_ori, box):
+        '''
+        Crop of `img_ori` around `box` (image pixels), letterboxed to pose_size.
+        The whole image is used if the crop would cover most of it.
+        return:
+            img: [h, w, 3] float32 network input
+            box: [4] the box in the network input pixels
+            mapping: (resize_ratio, dw, dh, x0, y0), image = (input - (dw, dh)) / resize_ratio + (x0, y0)
+        '''
+        height_ori, width_ori = img_ori.shape[:2]
+        roi = compute_roi(np.reshape(box, (2, 2)), (width_ori, height_ori), self.pose_size, padding=self.padding,
+                          min_size=self.pose_size[0], max_coverage=1.)
+        x0, y0, x1, y1 = (0, 0, width_ori, height_ori) if roi is None else roi
+
+        img_resize, resize_ratio, dw, dh = letterbox_resize(img_ori[y0:y1, x0:x1], self.pose_size[0],
+                                                            self.pose_size[1])
+        img = cv2.cvtColor(img_resize, cv2.COLOR_BGR2RGB)
+        img = np.asarray(img, np.float32) / 255.
+
+        box = np.asarray(box, np.float32)
+        box_input = np.array([(box[0] - x0) * resize_ratio + dw, (box[1] - y0) * resize_ratio + dh,
+                              (box[2] - x0) * resize_ratio + dw, (box[3] - y0) * resize_ratio + dh], np.float32)
+        return img, box_input, (resize_ratio, dw, dh, x0, y0)
+
+    def keypoints(self, sess, crop_batch, box_batch):
+        '''
+        crop_batch: [N, h, w, 3], box_batch: [N, 4], from `crop`
+        return: x, y, conf, each [N, k, nV], x and y normalized to pose_size
+        '''
+        box_batch = np.asarray(box_batch, np.float32).reshape(-1, 1, 4)
+        return sess.run(self.pose_outputs, feed_dict={self.pose_input: crop_batch, self.pose_boxes: box_batch,
+                                                      self.pose_num_boxes: np.ones(len(box_batch), np.int32)})
+
+    def predict(self, sess, img_batch, img_ori_batch, det_mappings):
+        '''
+        Both stages for a batch of images.
+        img_batch: images letterboxed to det_size, img_ori_batch: the original images
+        det_mappings: (resize_ratio, dw, dh) of the letterbox of every image
+        return: one (boxes, scores, labels, x, y, conf) per image, boxes and keypoints in the original
+            image pixels. Images without detection get empty boxes and None keypoints.
+        '''
+        boxes_b, scores_b, labels_b, num_boxes_b = self.detect(sess, img_batch)
+
+        results = [None] * len(img_batch)
+        crops, crop_boxes, crop_ids, crop_mappings = [], [], [], []
+        for k in range(len(img_batch)):
+            n = num_boxes_b[k]
+            boxes_ = boxes_b[k, :n].copy()
+            resize_ratio, dw, dh = det_mappings[k]
+            boxes_[:, [0, 2]] = (boxes_[:, [0, 2]] - dw) / resize_ratio
+            boxes_[:, [1, 3]] = (boxes_[:, [1, 3]] - dh) / resize_ratio
+            results[k] = (boxes_, scores_b[k, :n], labels_b[k, :n], None, None, None)
+            if n > 0:
+                img, box_input, mapping = self.crop(img_ori_batch[k], boxes_[0])
+                crops.append(img)
+                crop_boxes.append(box_input)
+                crop_ids.append(k)
+                crop_mappings.append(mapping)
+
+        if crops:
+            x_b, y_b, conf_b = self.keypoints(sess, np.asarray(crops), crop_boxes)
+            for i, k in enumerate(crop_ids):
+                resize_ratio, dw, dh, x0, y0 = crop_mappings[i]
+                x_ = (x_b[i] * self.pose_size[0] - dw) / resize_ratio + x0
+                y_ = (y_b[i] * self.pose_size[1] - dh) / resize_ratio + y0
+                results[k] = results[k][:3] + (x_, y_, conf_b[i])
+        return results
@@ -0,0 +1,213 @@
+# coding: utf-8
+# Scores every `model-epoch_N` checkpoint saved by train.py on a test image list: the graph is built once, the
+# test images are read from the cache of letterboxed network inputs (`utils.eval_set_utils`), then every
+# checkpoint is restored in turn and evaluated.
+#     python eval_checkpoints.py --image_list data/my_data/pool_test.txt --checkpoint_dir ./checkpoint/ --stride 4
+
+from __future__ import division, print_function
+
+import tensorflow as tf
+import numpy as np
+import argparse
+import glob
+import json
+import os
+import re
+import time
+
+from utils.misc_utils import parse_anchors, read_class_names, get_3D_corners
+from utils.calib_utils import get_camera
+from utils.nms_utils import batch_nms
+from utils.pipeline_utils import PipelineRunner
+from utils.eval_utils import mesh_diameter, evaluate_candidates, PoseErrorStats
+from utils.pose_eval_utils import PoseEvaluator, keypoints_from_lines
+from utils.eval_set_utils import eval_cache_dir, open_eval_cache, to_image_pixels
+
+from model import yolov3
+from tqdm import tqdm
+from pose_loss import PoseRegressionLoss
+
+from utils.meshply import MeshPly
+
+parser = argparse.ArgumentParser(description="DeepURL evaluation of every checkpoint of a training.")
+parser.add_argument("--image_list", type=str, default='./data/my_data/pool_test.txt',
+                    help="The path of the test image list.")
+parser.add_argument("--anchor_path", type=str, default="./data/yolo_anchors.txt",
+                    help="The path of the anchor txt file.")
+parser.add_argument("--new_size", nargs='*', type=int, default=[416, 416],
+                    help="Resize the input image with `new_size`, size format: [width, height]")
+parser.add_argument("--class_name_path", type=str, default="./data/aqua.names",
+                    help="The path of the class names.")
+parser.add_argument("--checkpoint_dir", type=str, default="./checkpoint/",
+                    help="The directory of the model-epoch_N checkpoints of train.py.")
+parser.add_argument("--epochs", nargs='*', type=int, default=None,
+                    help="Only evaluate the checkpoints of these epochs, all of them by default.")
+parser.add_argument("--stride", type=int, default=1,
+                    help="Only evaluate every stride-th image, for a quick first scoring. The ground truth poses "
+                         "and the input cache of the subset are computed and cached separately.")
+parser.add_argument("--input_cache_dir", type=str, default=None,
+                    help="Directory of the cache of the letterboxed test images, next to --image_list by default.")
+parser.add_argument("--mesh_path", type=str, default='aqua_glass_removed.ply',
+                    help="Aqua Mesh Model")
+parser.add_argument("--nV", type=int, default=8,
+                    help="Number of keypoints of the labels.")
+parser.add_argument("--metric_vertices", type=int, default=1000,
+                    help="Number of mesh vertices (farthest point sampling) of the 2D and 3D vertex metrics, "
+                         "0 for the full mesh.")
+parser.add_argument("--letterbox_resize", type=lambda x: (str(x).lower() == 'true'), default=True,
+                    help="Whether to use the letterbox resize.")
+parser.add_argument("--camera", type=str, default="aqua_pool",
+                    help="Name of the camera calibration in --calib_dir.")
+parser.add_argument("--calib_dir", type=str, default="./data/calibration",
+                    help="The directory of the camera calibration files.")
+parser.add_argument("--batch_size", type=int, default=8,
+                    help="Number of images fed to the network in one sess.run.")
+parser.add_argument("--num_preprocess_threads", type=int, default=4,
+                    help="Number of threads decoding and resizing the images.")
+parser.add_argument("--num_postprocess_threads", type=int, default=4,
+                    help="Number of threads running PnP.")
+parser.add_argument("--pnp_method", type=str, default='ransac', choices=['ransac', 'prosac'],
+                    help="'ransac': OpenCV's RANSAC, 'prosac': sample the most confident keypoints first.")
+parser.add_argument("--pnp_refine", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to refine the pose with Levenberg-Marquardt on the PnP inliers.")
+parser.add_argument("--select_metric", type=str, default='acc10', choices=['acc10', 'acc5cm5deg', 'acc3d10'],
+                    help="Metric the best checkpoint is selected by.")
+parser.add_argument("--output", type=str, default=None,
+                    help="JSON file the table is written to.")
+args = parser.parse_args()
+
+args.anchors = parse_anchors(args.anchor_path)
+args.num_class = len(read_class_names(args.class_name_path))
+
+
+def list_checkpoints(checkpoint_dir):
+    '''
+    return: sorted list of (epoch, checkpoint prefix) of the model-epoch_N checkpoints
+    '''
+    checkpoints = []
+    for index_file in glob.glob(os.path.join(checkpoint_dir, 'model-epoch_*.index')):
+        match = re.match(r'model-epoch_(\d+)\.index$', os.path.basename(index_file))
+        if match:
+            checkpoints.append((int(match.group(1)), index_file[:-len('.index')]))
+    return sorted(checkpoints)
+
+
+checkpoints = list_checkpoints(args.checkpoint_dir)
+if args.epochs:
+    checkpoints = [(epoch, path) for epoch, path in checkpoints if epoch in args.epochs]
+assert checkpoints, 'No model-epoch_N checkpoint in {}'.format(args.checkpoint_dir)
+
+# with --stride, the ground truth poses and the network inputs are only computed for the subset, with their own
+# caches, so a first quick scoring does not decode and solve the whole list
+lines = open(args.image_list, 'r').readlines()[::args.stride]
+rows = np.arange(len(lines))
+subset_suffix = '_every{}'.format(args.stride) if args.stride > 1 else ''
+
+height = 600
+width = 800
+
+mesh = MeshPly(args.mesh_path)
+vertices = mesh.points
+corners3D = get_3D_corners(vertices)
+ref_corners = np.array(np.transpose(corners3D[:3, :]), dtype='float32')
+diam = mesh_diameter(mesh.vertices, os.path.splitext(args.mesh_path)[0] + '_diameter.npz')
+
+camera = get_camera(args.camera, (width, height), calib_dir=args.calib_dir)
+evaluator = PoseEvaluator(keypoints_from_lines(lines, args.nV), ref_corners, corners3D, vertices, camera.K,
+                          gt_cache=os.path.splitext(args.image_list)[0] + '_gt_poses{}.npz'.format(subset_suffix),
+                          num_vertices=args.metric_vertices,
+                          vertex_cache=os.path.splitext(args.mesh_path)[0] + '_metric_vertices.npz')
+print(evaluator.describe())
+
+# the network inputs of all the checkpoints, decoded once and, without --stride, shared with
+# test_image_list.py --input_cache True
+start = time.perf_counter()
+input_cache = open_eval_cache((args.input_cache_dir or eval_cache_dir(args.image_list, args.new_size,
+                                                                      args.letterbox_resize)) + subset_suffix,
+                              lines, (width, height), args.new_size, letterbox=args.letterbox_resize,
+                              num_threads=args.num_preprocess_threads)
+images, letterbox_params = input_cache['images'], input_cache['letterbox']
+print('Network inputs of {} images ready in {:.1f} s'.format(len(lines), time.perf_counter() - start))
+
+config = tf.ConfigProto()
+config.gpu_options.allow_growth = True
+
+with tf.Session(config=config) as sess:
+    input_data = tf.placeholder(tf.float32, [None, args.new_size[1], args.new_size[0], 3], name='input_data')
+    pose_loss = PoseRegressionLoss(args.batch_size, num_classes=1, nV=args.nV)
+
+    yolo_model = yolov3(args.num_class, args.anchors, nV=args.nV)
+    with tf.variable_scope('yolov3'):
+        pred_feature_maps = yolo_model.forward(input_data, False)
+    yolo_features = [pred_feature_maps[0], pred_feature_maps[1], pred_feature_maps[2]]
+    pose_features = [pred_feature_maps[3], pred_feature_maps[4], pred_feature_maps[5]]
+
+    pred_boxes, pred_confs, pred_probs = yolo_model.predict(yolo_features)
+    pred_scores = pred_confs * pred_probs
+    boxes, scores, labels, num_boxes = batch_nms(pred_boxes, pred_scores, max_boxes=1, score_thresh=0.25,
+                                                 nms_thresh=0.35)
+    x, y, conf = pose_loss.predict_topk(pose_features, boxes, num_boxes, [args.new_size[1], args.new_size[0]], k=12)
+
+    saver = tf.train.Saver()
+
+    def preprocess(index):
+        return index, np.asarray(images[rows[index]], np.float32) / 255.
+
+    def inference(batch):
+        num_boxes_b, x_b, y_b, conf_b = sess.run([num_boxes, x, y, conf],
+                                                 feed_dict={input_data: np.asarray([pre[1] for pre in batch])})
+        return [(num_boxes_b[k], x_b[k], y_b[k], conf_b[k]) for k in range(len(batch))]
+
+    def postprocess(pre, out):
+        index = pre[0]
+        num_boxes_, x_, y_, conf_ = out
+        if num_boxes_ == 0:
+            return {'valid': False, 'corner_dist': None, 'errors': None, 'pnp': None}
+        x_, y_ = to_image_pixels(x_, y_, letterbox_params[rows[index]], args.new_size, (width, height))
+        return evaluate_candidates(x_, y_, conf_, ref_corners, camera.K, method=args.pnp_method,
+                                   refine=args.pnp_refine)
+
+    runner = PipelineRunner(preprocess, inference, postprocess, batch_size=args.batch_size,
+                            num_preprocess_threads=args.num_preprocess_threads,
+                            num_postprocess_threads=args.num_postprocess_threads)
+
+    table = []
+    for epoch, checkpoint in checkpoints:
+        start = time.perf_counter()
+        saver.restore(sess, checkpoint)
+        stats = PoseErrorStats()
+        pose_rows, R_pr, t_pr = [], [], []
+        for index, result in enumerate(tqdm(runner.run(range(len(rows))), total=len(rows),
+                                            desc='epoch {}'.format(epoch))):
+            if not result['valid']:
+                stats.add(result)
+                continue
+            stats.add_pnp(result['pnp'])
+            pose_rows.append(rows[index])
+            R_pr.append(result['R'])
+            t_pr.append(result['t'])
+        if pose_rows:
+            stats.extend(evaluator.errors(R_pr, t_pr, pose_rows))
+        summary = stats.summary(len(rows), diam)
+        summary['epoch'] = epoch
+        summary['checkpoint'] = checkpoint
+        summary['seconds'] = time.perf_counter() - start
+        table.append(summary)
+
+print('{} images, every {} of {}'.format(len(rows), args.stride, args.image_list))
+print('{:>8}{:>10}{:>12}{:>10}{:>10}{:>12}{:>10}{:>10}{:>10}{:>10}'.format(
+    'epoch', 'acc10', 'acc5cm5deg', 'acc3d10', 'mean 2d', 'mean corner', 'trans', 'angle', 'errors', 'seconds'))
+best = max(range(len(table)), key=lambda i: table[i][args.select_metric])
+for i, s in enumerate(table):
+    print('{:>8}{:>10.2f}{:>12.2f}{:>10.2f}{:>10.2f}{:>12.2f}{:>10.4f}{:>10.3f}{:>10}{:>10.1f}{}'.format(
+        s['epoch'], s['acc10'], s['acc5cm5deg'], s['acc3d10'], s['mean_2d'], s['mean_corner'], s['trans'],
+        s['angle'], s['errors'], s['seconds'], '  *' if i == best else ''))
+print('Best {}: {}'.format(args.select_metric, table[best]['checkpoint']))
+
+if args.output:
+    results = [dict((key, value if isinstance(value, str) else float(value)) for key, value in s.items())
+               for s in table]
+    with open(args.output, 'w') as f:
+        json.dump({'image_list': args.image_list, 'stride': args.stride, 'images': len(rows),
+                   'best': table[best]['checkpoint'], 'results': results}, f, indent=2)
+    print('Table written to {}'.format(args.output))
@@ -0,0 +1,90 @@
+# coding: utf-8
+# Recomputes PnP and the metrics of test_image_list.py from the network outputs written by
+# `test_image_list.py --dump_dir`, without TensorFlow and without running the network again.
+
+from __future__ import division, print_function
+
+import os
+import numpy as np
+import argparse
+import logging
+
+from utils.misc_utils import get_3D_corners
+from utils.calib_utils import get_camera
+from utils.eval_utils import mesh_diameter, evaluate_candidates, PoseErrorStats
+from utils.pose_eval_utils import PoseEvaluator, keypoints_from_lines
+from utils.prediction_store import PredictionStore
+
+from tqdm import tqdm
+
+from utils.meshply import MeshPly
+
+parser = argparse.ArgumentParser(description="DeepURL evaluation of stored predictions.")
+parser.add_argument("--store_dir", type=str, required=True,
+                    help="The directory written by `test_image_list.py --dump_dir`.")
+parser.add_argument("--mesh_path", type=str, default='aqua_glass_removed.ply',
+                    help="Aqua Mesh Model")
+parser.add_argument("--camera", type=str, default=None,
+                    help="Name of the camera calibration in --calib_dir, the one of the dump by default.")
+parser.add_argument("--calib_dir", type=str, default="./data/calibration",
+                    help="The directory of the camera calibration files.")
+parser.add_argument("--use_gt", type=lambda x: (str(x).lower() == 'true'), default=True,
+                    help="Whether to use ground truth to calculate error.")
+parser.add_argument("--metric_vertices", type=int, default=1000,
+                    help="Number of mesh vertices (farthest point sampling) of the 2D and 3D vertex metrics, "
+                         "0 for the full mesh.")
+parser.add_argument("--best_cnt", type=int, default=12,
+                    help="Number of candidates of every keypoint used for PnP, at most the k of the dump.")
+parser.add_argument("--conf_thresh", type=float, default=0.5,
+                    help="Minimum confidence (logit) of the keypoint candidates used for PnP.")
+parser.add_argument("--pnp_method", type=str, default='ransac', choices=['ransac', 'prosac'],
+                    help="'ransac': OpenCV's RANSAC, 'prosac': sample the most confident keypoints first.")
+parser.add_argument("--pnp_refine", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to refine the pose with Levenberg-Marquardt on the PnP inliers.")
+parser.add_argument("--reproj_thresh", type=float, default=8.0,
+                    help="Inlier threshold of the PnP in pixels.")
+parser.add_argument("--max_iters", type=int, default=100,
+                    help="Maximum number of PnP hypotheses.")
+args = parser.parse_args()
+
+store = PredictionStore(args.store_dir)
+nV = store.meta['nV']
+assert args.best_cnt <= store.meta['k'], 'The dump only has {} candidates per keypoint'.format(store.meta['k'])
+
+mesh = MeshPly(args.mesh_path)
+vertices = mesh.points
+corners3D = get_3D_corners(vertices)
+ref_corners = np.array(np.transpose(corners3D[:3, :]), dtype='float32')
+diam = mesh_diameter(mesh.vertices, os.path.splitext(args.mesh_path)[0] + '_diameter.npz')
+
+camera = get_camera(args.camera or store.meta['camera'], store.meta['image_size'], calib_dir=args.calib_dir)
+
+stats = PoseErrorStats()
+# rows with a pose and their poses, evaluated all at once after the PnP loop
+pose_rows, R_pr, t_pr = [], [], []
+for i in tqdm(range(len(store))):
+    if store['num_boxes'][i] == 0:
+        stats.add({'valid': False, 'corner_dist': None, 'errors': None, 'pnp': None})
+        continue
+    result = evaluate_candidates(store['x'][i, :args.best_cnt], store['y'][i, :args.best_cnt],
+                                 store['conf'][i, :args.best_cnt], ref_corners, camera.K,
+                                 conf_thresh=args.conf_thresh, method=args.pnp_method, refine=args.pnp_refine,
+                                 reproj_thresh=args.reproj_thresh, max_iters=args.max_iters)
+    if not (args.use_gt and result['valid']):
+        stats.add(result)
+        continue
+    stats.add_pnp(result['pnp'])
+    pose_rows.append(i)
+    R_pr.append(result['R'])
+    t_pr.append(result['t'])
+
+if args.use_gt:
+    if pose_rows:
+        evaluator = PoseEvaluator(keypoints_from_lines(store.lines, nV), ref_corners, corners3D, vertices, camera.K,
+                                  gt_cache=os.path.join(args.store_dir, 'gt_poses.npz'),
+                                  num_vertices=args.metric_vertices,
+                                  vertex_cache=os.path.splitext(args.mesh_path)[0] + '_metric_vertices.npz')
+        print(evaluator.describe())
+        stats.extend(evaluator.errors(R_pr, t_pr, pose_rows))
+    stats.report(len(store), diam, logging.error)
+stats.report_pnp(args.pnp_method + (' + LM' if args.pnp_refine else ''), logging.error)
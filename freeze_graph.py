@@ -0,0 +1,52 @@
+# coding: utf-8
+# Freeze a trained DeepURL checkpoint into a single GraphDef.
+# The frozen graph only contains the forward pass, i.e. the six feature maps of `yolov3.forward`,
+# so it can be loaded through `cv2.dnn.readNetFromTensorflow` and decoded with utils/dnn_utils.py.
+
+from __future__ import division, print_function
+
+import argparse
+import tensorflow as tf
+
+from model import yolov3
+from utils.misc_utils import parse_anchors, read_class_names
+
+parser = argparse.ArgumentParser(description="DeepURL: freeze a checkpoint for OpenCV DNN inference.")
+parser.add_argument("--checkpoint_dir", type=str, default="/home/bjoshi/deep_localization/checkpoint",
+                    help="The path of the weights to restore.")
+parser.add_argument("--output_path", type=str, default="./data/deepurl_frozen.pb",
+                    help="The path of the frozen graph to write.")
+parser.add_argument("--anchor_path", type=str, default="./data/yolo_anchors.txt",
+                    help="The path of the anchor txt file.")
+parser.add_argument("--new_size", nargs='*', type=int, default=[416, 416],
+                    help="The network input size of the frozen graph, size format: [width, height]")
+parser.add_argument("--class_name_path", type=str, default="./data/aqua.names",
+                    help="The path of the class names.")
+parser.add_argument("--nV", type=int, default=8,
+                    help="Number of corner points used for PnP.")
+
+args = parser.parse_args()
+
+args.anchors = parse_anchors(args.anchor_path)
+args.classes = read_class_names(args.class_name_path)
+args.num_class = len(args.classes)
+
+with tf.Session() as sess:
+    input_data = tf.placeholder(tf.float32, [1, args.new_size[1], args.new_size[0], 3], name='input_data')
+
+    yolo_model = yolov3(args.num_class, args.anchors, nV=args.nV)
+    with tf.variable_scope('yolov3'):
+        pred_feature_maps = yolo_model.forward(input_data, False)
+
+    saver = tf.train.Saver()
+    checkpoint = tf.train.latest_checkpoint(args.checkpoint_dir)
+    saver.restore(sess, checkpoint)
+
+    output_nodes = [feature_map.op.name for feature_map in pred_feature_maps]
+    # fold the variables into constants and drop everything that is not needed by the feature maps
+    graph_def = tf.graph_util.convert_variables_to_constants(sess, sess.graph.as_graph_def(), output_nodes)
+    graph_def = tf.graph_util.remove_training_nodes(graph_def, protected_nodes=output_nodes)
+
+    with tf.gfile.GFile(args.output_path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    print('Frozen graph of {} has been saved to {}'.format(checkpoint, args.output_path))
@@ -0,0 +1,118 @@
+# coding: utf-8
+# Generates a synthetic dataset in the format of the DeepURL label files, so the data loader, the training
+# step and the evaluation can be run and benchmarked without the synthetic/pool datasets:
+#     output_dir/images/*.jpg
+#     output_dir/final_train.txt    index path width height label x_min y_min x_max y_max x1 y1 ... (train.py)
+#     output_dir/pool_test.txt      index path width height label x1 y1 ...                     (test_image_list.py)
+#     output_dir/poses_{train,test}.txt   index fx fy cx cy r11 ... r33 t1 t2 t3, the ground truth of every image
+#     output_dir/synthetic_box.ply  the object model for --mesh_path, unless --mesh_path is given here
+
+from __future__ import division, print_function
+
+import numpy as np
+import argparse
+import cv2
+import os
+
+from utils.calib_utils import get_camera
+from utils.misc_utils import compute_projection
+from utils.synthetic_utils import box_vertices, write_box_ply, keypoints_3d, sample_intrinsics, sample_pose, \
+    render_background, render_box, render_silhouette, projected_bbox, keypoints_visible, label_line
+
+from tqdm import tqdm
+
+from utils.meshply import MeshPly
+
+parser = argparse.ArgumentParser(description="DeepURL synthetic dataset generator.")
+parser.add_argument("--output_dir", type=str, default="./data/synthetic",
+                    help="The directory of the images and the label files.")
+parser.add_argument("--num_train", type=int, default=1000,
+                    help="Number of images of final_train.txt.")
+parser.add_argument("--num_test", type=int, default=200,
+                    help="Number of images of pool_test.txt.")
+parser.add_argument("--image_size", nargs='*', type=int, default=[800, 600],
+                    help="Size of the generated images, format: [width, height].")
+parser.add_argument("--camera", type=str, default="aqua_pool",
+                    help="Name of the camera calibration in --calib_dir, rescaled to --image_size.")
+parser.add_argument("--calib_dir", type=str, default="./data/calibration",
+                    help="The directory of the camera calibration files.")
+parser.add_argument("--focal_jitter", type=float, default=0.,
+                    help="Random relative change of the focal length of every image. Keep 0 for the images "
+                         "evaluated with the fixed --camera of the test scripts.")
+parser.add_argument("--center_jitter", type=float, default=0.,
+                    help="Random shift of the principal point of every image, relative to the image size.")
+parser.add_argument("--distance", nargs=2, type=float, default=[1.5, 6.],
+                    help="Range of the distance of the object to the camera in meters.")
+parser.add_argument("--roll", nargs=2, type=float, default=[-30., 30.],
+                    help="Range of the roll of the object in degrees.")
+parser.add_argument("--pitch", nargs=2, type=float, default=[-30., 30.],
+                    help="Range of the pitch of the object in degrees.")
+parser.add_argument("--yaw", nargs=2, type=float, default=[-180., 180.],
+                    help="Range of the yaw of the object in degrees.")
+parser.add_argument("--object", type=str, default='box', choices=['box', 'mesh'],
+                    help="'box': a box of --box_size with textured faces, 'mesh': the silhouette of --mesh_path.")
+parser.add_argument("--box_size", nargs=3, type=float, default=[0.65, 0.45, 0.15],
+                    help="Size of the box in meters (x, y, z), about the size of an Aqua.")
+parser.add_argument("--mesh_path", type=str, default=None,
+                    help="Object model for --object mesh.")
+parser.add_argument("--nV", type=int, default=9, choices=[8, 9],
+                    help="Number of keypoints written: the 8 corners, and the center if 9.")
+parser.add_argument("--seed", type=int, default=0,
+                    help="Seed of the random generator.")
+args = parser.parse_args()
+
+if args.object == 'mesh':
+    assert args.mesh_path, 'Set --mesh_path for --object mesh'
+    mesh = MeshPly(args.mesh_path)
+    vertices = mesh.points
+    triangles = np.array(mesh.indices)
+else:
+    vertices = box_vertices(args.box_size)
+keypoints = keypoints_3d(vertices, nV=args.nV)
+
+image_size = tuple(args.image_size)
+camera_K = get_camera(args.camera, image_size, calib_dir=args.calib_dir).K
+rng = np.random.RandomState(args.seed)
+
+image_dir = os.path.join(args.output_dir, 'images')
+if not os.path.exists(image_dir):
+    os.makedirs(image_dir)
+if args.object == 'box':
+    write_box_ply(os.path.join(args.output_dir, 'synthetic_box.ply'), args.box_size)
+
+
+def generate(split, num_images, label_file, with_bbox):
+    label_lines, pose_lines = [], []
+    for i in tqdm(range(num_images), desc=split):
+        K = sample_intrinsics(camera_K, rng, args.focal_jitter, args.center_jitter)
+        # the whole object has to be in the image
+        while True:
+            rt = sample_pose(rng, K, image_size, args.distance, args.roll, args.pitch, args.yaw)
+            if keypoints_visible(keypoints, rt, K, image_size):
+                break
+
+        img = render_background(rng, image_size[0], image_size[1])
+        if args.object == 'box':
+            img = render_box(img, vertices, rt, K, rng)
+        else:
+            img = render_silhouette(img, vertices, triangles, rt, K, rng)
+        img = cv2.GaussianBlur(img, (3, 3), 0)
+
+        path = os.path.abspath(os.path.join(image_dir, '{}_{:06d}.jpg'.format(split, i)))
+        cv2.imwrite(path, img)
+        bbox = projected_bbox(vertices, rt, K, image_size)
+        keypoints_2d = compute_projection(keypoints, rt, K)
+        label_lines.append(label_line(i, path, image_size, bbox, keypoints_2d, with_bbox=with_bbox))
+        pose_lines.append(' '.join([str(i)] + ['{:.6f}'.format(v) for v in
+                                               [K[0, 0], K[1, 1], K[0, 2], K[1, 2]] + list(rt[:, :3].reshape(-1)) +
+                                               list(rt[:, 3])]))
+
+    with open(os.path.join(args.output_dir, label_file), 'w') as f:
+        f.write('\n'.join(label_lines) + '\n')
+    with open(os.path.join(args.output_dir, 'poses_{}.txt'.format(split)), 'w') as f:
+        f.write('\n'.join(pose_lines) + '\n')
+
+
+generate('train', args.num_train, 'final_train.txt', with_bbox=True)
+generate('test', args.num_test, 'pool_test.txt', with_bbox=False)
+print('Synthetic dataset written to {}'.format(args.output_dir))
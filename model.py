@@ -28,7 +28,16 @@ class yolov3(object):
         self.use_static_shape = use_static_shape
         self.nV = nV
 
-    def forward(self, inputs, is_training=False, reuse=False):
+    def forward(self, inputs, is_training=False, reuse=False, heads='all'):
+        '''
+        heads: 'all' returns the three detection feature maps followed by the three pose feature maps,
+            'detection' or 'pose' only the three feature maps of that head, so each head can be run on its own
+            input. Note that the last pose feature map is computed from the last detection feature map,
+            so with 'pose' that part of the detection head is still built (but not its other outputs).
+            The layers of all the scales are always built, slim names them in order. To run some scales only,
+            decode and fetch only their feature maps (see `predict`).
+        '''
+        assert heads in ('all', 'detection', 'pose'), 'Unsupported heads: {}'.format(heads)
         # the input img_size, form: [height, weight]
         # it will be used later
         self.img_size = tf.shape(inputs)[1:3]
@@ -78,6 +87,9 @@ class yolov3(object):
                                                 activation_fn=None, biases_initializer=tf.zeros_initializer())
                     feature_map_3 = tf.identity(feature_map_3, name='feature_map_3')
 
+                if heads == 'detection':
+                    return feature_map_1, feature_map_2, feature_map_3
+
                 with tf.variable_scope('yolov3_head_singleshot'):
                     inter1, net = yolo_block(route_3, 512)
                     feature_map_21 = slim.conv2d(net, self.nV * 3 + self.class_num, 1,
@@ -105,6 +117,8 @@ class yolov3(object):
                                                 activation_fn=None, biases_initializer=tf.zeros_initializer())
                     feature_map_23 = tf.identity(feature_map_23, name='feature_map_23')
 
+            if heads == 'pose':
+                return feature_map_21, feature_map_22, feature_map_23
             return feature_map_1, feature_map_2, feature_map_3, feature_map_21, feature_map_22, feature_map_23
 
     def reorg_layer(self, feature_map, anchors):
@@ -166,16 +180,17 @@ class yolov3(object):
         return x_y_offset, boxes, conf_logits, prob_logits
 
 
-    def predict(self, feature_maps):
+    def predict(self, feature_maps, scales=(0, 1, 2)):
         '''
         Receive the returned feature_maps from `forward` function,
         the produce the output predictions at the test stage.
+        scales: the scales of `feature_maps`, 0: feature_map_1 (13*13 for a 416*416 input), 1: feature_map_2,
+            2: feature_map_3. Only the given scales are decoded, and TF only runs the layers the fetched
+            outputs depend on: leaving out scale 2 skips the 52*52 branch of the head at inference.
         '''
-        feature_map_1, feature_map_2, feature_map_3 = feature_maps
-
-        feature_map_anchors = [(feature_map_1, self.anchors[6:9]),
-                               (feature_map_2, self.anchors[3:6]),
-                               (feature_map_3, self.anchors[0:3])]
+        assert len(feature_maps) == len(scales), 'One feature map per scale expected'
+        feature_map_anchors = [(feature_map, self.anchors[6 - 3 * scale:9 - 3 * scale])
+                               for feature_map, scale in zip(feature_maps, scales)]
         reorg_results = [self.reorg_layer(feature_map, anchors) for (feature_map, anchors) in feature_map_anchors]
 
         def _reshape(result):
@@ -199,7 +214,7 @@ class yolov3(object):
             confs_list.append(confs)
             probs_list.append(probs)
         
-        # collect results on three scales
+        # collect results on the (three) scales
         # take 416*416 input image for example:
         # shape: [N, (13*13+26*26+52*52)*3, 4]
         boxes = tf.concat(boxes_list, axis=1)
@@ -0,0 +1,122 @@
+# coding: utf-8
+# Load generator for pose_server.py: `concurrency` clients send the same image as fast as they can,
+# the request latencies and the throughput are printed at the end.
+
+from __future__ import division, print_function
+
+import argparse
+import json
+import socket
+import threading
+import time
+import http.client
+
+import numpy as np
+import cv2
+
+parser = argparse.ArgumentParser(description="DeepURL pose server load generator.")
+parser.add_argument("--input_image", type=str, default='data/demo_data/1569602875264787299.jpg',
+                    help="The image sent in every request.")
+parser.add_argument("--host", type=str, default="127.0.0.1",
+                    help="Address of the server.")
+parser.add_argument("--port", type=int, default=8080,
+                    help="Port of the server.")
+parser.add_argument("--socket", type=str, default=None,
+                    help="Unix socket of the server, instead of --host/--port.")
+parser.add_argument("--concurrency", type=int, default=4,
+                    help="Number of clients sending requests at the same time.")
+parser.add_argument("--num_requests", type=int, default=200,
+                    help="Total number of requests.")
+parser.add_argument("--shm", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to pass the decoded frame in shared memory instead of the encoded image.")
+args = parser.parse_args()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path):
+        http.client.HTTPConnection.__init__(self, 'localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def connect():
+    if args.socket:
+        return UnixHTTPConnection(args.socket)
+    return http.client.HTTPConnection(args.host, args.port)
+
+
+img_ori = cv2.imread(args.input_image)
+assert img_ori is not None, 'Could not read the image {}'.format(args.input_image)
+encoded = cv2.imencode('.jpg', img_ori)[1].tobytes()
+
+latencies = []
+batch_sizes = []
+errors = []
+lock = threading.Lock()
+remaining = [args.num_requests]
+
+
+def client():
+    shm = None
+    if args.shm:
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(create=True, size=img_ori.nbytes)
+        np.ndarray(img_ori.shape, dtype=np.uint8, buffer=shm.buf)[:] = img_ori
+        body = json.dumps({'shm': shm.name, 'shape': list(img_ori.shape)}).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+    else:
+        body = encoded
+        headers = {'Content-Type': 'image/jpeg'}
+
+    conn = connect()
+    try:
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            start = time.time()
+            try:
+                conn.request('POST', '/pose', body=body, headers=headers)
+                response = conn.getresponse()
+                content = json.loads(response.read().decode('utf-8'))
+            except (http.client.HTTPException, socket.error) as e:
+                with lock:
+                    errors.append(str(e))
+                conn.close()
+                conn = connect()
+                continue
+            elapsed = (time.time() - start) * 1000
+            with lock:
+                if response.status != 200:
+                    errors.append(content.get('error'))
+                else:
+                    latencies.append(elapsed)
+                    batch_sizes.append(content['batch_size'])
+    finally:
+        conn.close()
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+start = time.time()
+threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+elapsed = time.time() - start
+
+print('Requests: {}, errors: {}'.format(len(latencies), len(errors)))
+if latencies:
+    print('Throughput: {:.1f} requests/s'.format(len(latencies) / elapsed))
+    print('Latency (ms): mean {:.1f}, p50 {:.1f}, p95 {:.1f}, p99 {:.1f}'.format(
+        np.mean(latencies), *np.percentile(latencies, [50, 95, 99])))
+    print('Mean batch size: {:.2f}'.format(np.mean(batch_sizes)))
+if errors:
+    print('First error: {}'.format(errors[0]))
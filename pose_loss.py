@@ -2,7 +2,6 @@ import time
 from utils import *
 import tensorflow as tf
 import numpy as np
-from utils.misc_utils import get_bbox_mask
 
 class PoseRegressionLoss():
     def __init__(self, batch_size, num_classes=1, nV=9):
@@ -78,101 +77,165 @@ class PoseRegressionLoss():
         return [loss, loss_x, loss_y, loss_conf, nProposals, nCorrect]
 
 
-    def predict(self, outputs, bboxes, scores, num_classes=1):
-
-        def reorg(output):
-            # Parameters
-            batch = output.shape[0]
-            h = output.shape[1]
-            w = output.shape[2]
-
-            # use some broadcast tricks to get the mesh coordinates
-            grid_x = tf.range(h, dtype=tf.int32)
-            grid_y = tf.range(w, dtype=tf.int32)
-
-            grid_x, grid_y = tf.meshgrid(grid_x, grid_y)
-
-            grid_x = tf.cast(grid_x, tf.float32)
-            grid_y = tf.cast(grid_y, tf.float32)
-
-            conf = output[..., 2*self.nV:3*self.nV]
-
-            output = tf.transpose(output, [0, 3, 1, 2])
-            x = output[:, 0:self.nV, ...]
-            y = output[:, self.nV:2*self.nV, ...]
-
-            predx = (x + grid_x) / tf.cast(w, tf.float32)
-            predy = (y + grid_y) / tf.cast(h, tf.float32)
+    def reorg(self, output):
+        '''
+        Decode the keypoints of one scale.
+        output: [N, h, w, nV*3+1]
+        return: predx, predy, conf, each [N, h*w, nV]. predx and predy are normalized to the network
+            input size, conf are the raw logits.
+        '''
+        # Parameters
+        h, w = output.get_shape().as_list()[1:3]
 
-            predx = tf.transpose(predx, [0, 2, 3, 1])
-            predy = tf.transpose(predy, [0, 2, 3, 1])
+        # use some broadcast tricks to get the mesh coordinates
+        grid_x = tf.range(h, dtype=tf.int32)
+        grid_y = tf.range(w, dtype=tf.int32)
 
-            #Ignoring batch size and assuming single image
-            #Need to fix later
+        grid_x, grid_y = tf.meshgrid(grid_x, grid_y)
 
-            predx = tf.reshape(predx, [h, w, self.nV])
-            predy = tf.reshape(predy, [h, w, self.nV])
-            conf = tf.reshape(conf, [h, w, self.nV])
+        grid_x = tf.cast(grid_x, tf.float32)
+        grid_y = tf.cast(grid_y, tf.float32)
 
-            return predx, predy, conf
+        conf = output[..., 2*self.nV:3*self.nV]
 
-        bbox_masks = get_bbox_mask(bboxes)
+        output = tf.transpose(output, [0, 3, 1, 2])
+        x = output[:, 0:self.nV, ...]
+        y = output[:, self.nV:2*self.nV, ...]
+
+        predx = (x + grid_x) / tf.cast(w, tf.float32)
+        predy = (y + grid_y) / tf.cast(h, tf.float32)
+
+        predx = tf.transpose(predx, [0, 2, 3, 1])
+        predy = tf.transpose(predy, [0, 2, 3, 1])
+
+        # shape: [N, h*w, nV]
+        predx = tf.reshape(predx, [-1, h * w, self.nV])
+        predy = tf.reshape(predy, [-1, h * w, self.nV])
+        conf = tf.reshape(conf, [-1, h * w, self.nV])
+
+        return predx, predy, conf
+
+    def box_gate(self, outputs, bboxes, num_boxes, img_size):
+        '''
+        Mark the cells of every scale that fall inside one of the detected boxes,
+        the same cells `get_bbox_mask` marks for training.
+        bboxes: [N, B, 4], (x_min, y_min, x_max, y_max) in network input pixels, e.g. from `batch_nms`
+        num_boxes: [N], number of valid boxes per image
+        img_size: network input size, [h, w] format
+        return: [N, 13*13+26*26+52*52] bool
+        '''
+        img_size = tf.cast(img_size, tf.float32)
+        # [N, B, 1]
+        valid = tf.expand_dims(tf.sequence_mask(num_boxes, tf.shape(bboxes)[1]), -1)
+
+        gate_list = []
+        for output in outputs:
+            h, w = output.get_shape().as_list()[1:3]
+            stride_y = img_size[0] / h
+            stride_x = img_size[1] / w
+
+            # [N, B, 1]
+            x1 = tf.floor(bboxes[..., 0:1] / stride_x)
+            y1 = tf.floor(bboxes[..., 1:2] / stride_y)
+            x2 = tf.floor(bboxes[..., 2:3] / stride_x)
+            y2 = tf.floor(bboxes[..., 3:4] / stride_y)
+
+            cols = tf.range(w, dtype=tf.float32)
+            rows = tf.range(h, dtype=tf.float32)
+            # [N, B, w] & [N, B, h]
+            inside_x = tf.logical_and(tf.logical_and(cols >= x1, cols <= x2), valid)
+            inside_y = tf.logical_and(rows >= y1, rows <= y2)
+            # [N, B, h, w] ==> [N, h*w], union over the boxes
+            inside = tf.logical_and(tf.expand_dims(inside_y, 3), tf.expand_dims(inside_x, 2))
+            gate_list.append(tf.reshape(tf.reduce_any(inside, axis=1), [-1, h * w]))
+
+        return tf.concat(gate_list, axis=1)
+
+    def select(self, pred_x, pred_y, pred_conf, gate=None, radius=0.3):
+        '''
+        Select the cells whose mean keypoint position is within `radius` of the most confident cell.
+        Only the cells in `gate` ([N, M] bool) are considered if it is given.
+        return: selected, [N, M] bool
+        '''
+        total_max_count = tf.shape(pred_x)[1]
+        mean_x = tf.reduce_mean(pred_x, axis=2)    #average x position
+        mean_y = tf.reduce_mean(pred_y, axis=2)     #average y position
+        mean_conf = tf.reduce_mean(pred_conf, axis=2)   #average 2D confs
+        if gate is not None:
+            mean_conf = tf.where(gate, mean_conf, tf.fill(tf.shape(mean_conf), -np.inf))
+
+        # shape: [N]
+        max_conf_idx = tf.argmax(mean_conf, axis=1)
+
+        # shape: [N, M, 2]
+        center_xy = tf.stack([mean_x, mean_y], axis=2)
+        # pick the center of the most confident cell of every image, shape: [N, 1, 2]
+        max_conf_mask = tf.one_hot(max_conf_idx, total_max_count, dtype=tf.float32)
+        ref_xy = tf.reduce_sum(center_xy * tf.expand_dims(max_conf_mask, -1), axis=1, keepdims=True)
+        selected = tf.linalg.norm(center_xy - ref_xy, axis=2) < radius
+        if gate is not None:
+            selected = tf.logical_and(selected, gate)
+
+        return selected
 
-        for i in range(len(outputs)):
-            reorg_results = [reorg(output) for output in outputs]
+    def predict(self, outputs, bboxes, scores, num_classes=1):
+        '''
+        Decode the keypoint candidates of every cell in the three scales.
+        The batch dimension is kept, take 416*416 input image for example:
+            pred_x, pred_y: [N, 13*13+26*26+52*52, nV], normalized to the network input size
+            pred_conf: [N, 13*13+26*26+52*52, nV]
+            selected: [N, 13*13+26*26+52*52], cells close to the most confident cell of each image
+        '''
+        reorg_results = [self.reorg(output) for output in outputs]
 
         x_list, y_list, confs_list = [], [], []
-
-        if bbox_masks is not None:
-            for i, result in enumerate(reorg_results):
-                x, y, conf = result
-                mask = bbox_masks[i]
-                # mask = tf.expand_dims(mask, axis=0)
-                # mask = tf.tile(mask, [self.batch_size, 1, 1])
-
-                # print(conf.shape)
-                conf = tf.sigmoid(conf)
-                pred_x = tf.boolean_mask(x, mask)
-                pred_y = tf.boolean_mask(y, mask)
-                pred_conf = tf.boolean_mask(conf, mask)
-
-                x_list.append(pred_x)
-                y_list.append(pred_y)
-                confs_list.append(pred_conf)
-
-        else:
-            for i, result in enumerate(reorg_results):
-                x, y, conf = result
-                w = x.shape[0]
-                h = x.shape[1]
-
-                x = tf.reshape(x, [h*w, self.nV])
-                y = tf.reshape(y, [h*w, self.nV])
-                conf = tf.reshape(conf, [h * w, self.nV])
-                x_list.append(x)
-                y_list.append(y)
-                confs_list.append(conf)
+        for x, y, conf in reorg_results:
+            x_list.append(x)
+            y_list.append(y)
+            confs_list.append(conf)
 
         # collect results on three scales
         # take 416*416 input image for example:
-        # shape: [inside_masks, self.nV]
-        pred_x = tf.concat(x_list, axis=0)
-        pred_y = tf.concat(y_list, axis=0)
-        pred_conf = tf.concat(confs_list, axis=0)
-
-        total_max_count = pred_x.shape[0]
-        mean_x  = tf.reduce_mean(pred_x, axis=1)    #average x position
-        mean_y = tf.reduce_mean(pred_y, axis=1)     #average y position
-        mean_conf = tf.reduce_mean(pred_conf, axis=1)   #average 2D confs
+        # shape: [N, 13*13+26*26+52*52, self.nV]
+        pred_x = tf.concat(x_list, axis=1)
+        pred_y = tf.concat(y_list, axis=1)
+        pred_conf = tf.concat(confs_list, axis=1)
 
-        max_conf_idx = tf.arg_max(mean_conf, 0)
-
-        center_xy = tf.transpose(tf.stack([mean_x, mean_y]), [1, 0])
-        ref_xy = tf.tile(tf.reshape(center_xy[max_conf_idx], [1, -1]), [total_max_count, 1])
-        selected = tf.linalg.norm(center_xy - ref_xy, axis=1) < 0.3
+        selected = self.select(pred_x, pred_y, pred_conf)
 
         return pred_x, pred_y, pred_conf, selected
 
+    def predict_topk(self, outputs, bboxes, num_boxes, img_size, k=12, radius=0.3):
+        '''
+        Like `predict`, but the cells are gated by the detected boxes and only the k most confident
+        selected cells of every keypoint are returned, so only a few dozen candidates leave the graph.
+        bboxes, num_boxes: output of `batch_nms`
+        img_size: network input size, [h, w] format
+        return:
+            pred_x, pred_y: [N, k, nV], normalized to the network input size
+            pred_conf: [N, k, nV], raw logits sorted in descending order along k. Cells that are
+                not selected get a very low confidence, so they never pass the 0.5 cut of the PnP.
+        '''
+        pred_x, pred_y, pred_conf = [tf.concat(t, axis=1) for t in zip(*[self.reorg(output) for output in outputs])]
+
+        gate = self.box_gate(outputs, bboxes, num_boxes, img_size)
+        selected = self.select(pred_x, pred_y, pred_conf, gate=gate, radius=radius)
+
+        # [N, M, nV] ==> [N, nV, M]
+        pred_conf = tf.where(tf.tile(tf.expand_dims(selected, -1), [1, 1, self.nV]),
+                             pred_conf, tf.fill(tf.shape(pred_conf), -1e10))
+        pred_x = tf.transpose(pred_x, [0, 2, 1])
+        pred_y = tf.transpose(pred_y, [0, 2, 1])
+        pred_conf = tf.transpose(pred_conf, [0, 2, 1])
+
+        # [N, nV, k]
+        top_conf, top_idx = tf.nn.top_k(pred_conf, k=k)
+        top_x = tf.gather(pred_x, top_idx, batch_dims=2)
+        top_y = tf.gather(pred_y, top_idx, batch_dims=2)
+
+        # [N, nV, k] ==> [N, k, nV]
+        return tf.transpose(top_x, [0, 2, 1]), tf.transpose(top_y, [0, 2, 1]), tf.transpose(top_conf, [0, 2, 1])
+
     def build_targets(self, pred_x, pred_y, target, bbox_mask, grid_x, grid_y):
 
         nB = pred_x.shape[0]
@@ -0,0 +1,269 @@
+# coding: utf-8
+# Long-running pose estimation service: the graph is built and the checkpoint restored once, and the
+# images of concurrent clients are run through the network in micro-batches.
+#
+# POST /pose with an encoded image (JPEG, PNG, ...) as body, or with a JSON body
+#     {"shm": name, "shape": [height, width, 3]}
+# for a BGR uint8 frame in a shared memory block (multiprocessing.shared_memory) written by the client.
+# The response is a JSON object with the boxes, the keypoints and the PnP pose [R|t].
+# GET /stats returns the number of requests and batches served so far.
+
+from __future__ import division, print_function
+
+import tensorflow as tf
+import numpy as np
+import argparse
+import cv2
+import os
+import json
+import time
+import itertools
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.misc_utils import *
+from utils.calib_utils import get_camera
+from utils.nms_utils import batch_nms
+from utils.pipeline_utils import MicroBatcher
+from utils.timing_utils import create_timer
+from utils.data_aug import letterbox_resize
+
+from model import yolov3
+from pose_loss import PoseRegressionLoss
+
+from utils.meshply import MeshPly
+
+parser = argparse.ArgumentParser(description="DeepURL pose estimation server.")
+parser.add_argument("--host", type=str, default="127.0.0.1",
+                    help="Address the HTTP server listens on.")
+parser.add_argument("--port", type=int, default=8080,
+                    help="Port the HTTP server listens on.")
+parser.add_argument("--socket", type=str, default=None,
+                    help="Serve HTTP on this Unix socket instead of --host/--port.")
+parser.add_argument("--anchor_path", type=str, default="./data/yolo_anchors.txt",
+                    help="The path of the anchor txt file.")
+parser.add_argument("--new_size", nargs='*', type=int, default=[416, 416],
+                    help="Resize the input image with `new_size`, size format: [width, height]")
+parser.add_argument("--class_name_path", type=str, default="./data/aqua.names",
+                    help="The path of the class names.")
+parser.add_argument("--checkpoint_dir", type=str, default="/home/bjoshi/deep_localization/checkpoint",
+                    help="The path of the weights to restore.")
+parser.add_argument("--mesh_path", type=str, default='aqua_glass_removed.ply',
+                    help="Aqua Mesh Model")
+parser.add_argument("--nV", type=int, default=8,
+                    help="Number of corner points used for PnP.")
+parser.add_argument("--camera", type=str, default="aqua_pool",
+                    help="Name of the camera calibration in --calib_dir.")
+parser.add_argument("--calib_dir", type=str, default="./data/calibration",
+                    help="The directory of the camera calibration files.")
+parser.add_argument("--max_batch_size", type=int, default=8,
+                    help="Maximum number of images in one sess.run.")
+parser.add_argument("--max_latency", type=float, default=5,
+                    help="Maximum time in ms a request waits for other requests to fill its batch.")
+parser.add_argument("--pnp_method", type=str, default='ransac', choices=['ransac', 'prosac'],
+                    help="'ransac': OpenCV's RANSAC, 'prosac': sample the most confident keypoints first.")
+parser.add_argument("--pnp_refine", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to refine the pose with Levenberg-Marquardt on the PnP inliers.")
+parser.add_argument("--timing", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to time the stages of every request and print their percentiles at exit.")
+parser.add_argument("--timing_file", type=str, default=None,
+                    help="With --timing, JSON lines file of the per-request stage timings.")
+parser.add_argument("--metrics_port", type=int, default=0,
+                    help="With --timing, serve the running stage percentiles on http://127.0.0.1:port/metrics.")
+args = parser.parse_args()
+
+args.anchors = parse_anchors(args.anchor_path)
+args.classes = read_class_names(args.class_name_path)
+args.num_class = len(args.classes)
+
+config = tf.ConfigProto()
+config.gpu_options.allow_growth = True
+
+mesh = MeshPly(args.mesh_path)
+vertices = mesh.points
+corners3D = get_3D_corners(vertices)
+gt_corners = np.array(np.transpose(corners3D[:3, :]), dtype='float32')
+
+input_size = tuple(args.new_size)
+input_data = tf.placeholder(tf.float32, [None, input_size[1], input_size[0], 3], name='input_data')
+pose_loss = PoseRegressionLoss(args.max_batch_size, num_classes=1, nV=args.nV)
+
+yolo_model = yolov3(args.num_class, args.anchors, nV=args.nV)
+with tf.variable_scope('yolov3'):
+    pred_feature_maps = yolo_model.forward(input_data, False)
+yolo_features = [pred_feature_maps[0], pred_feature_maps[1], pred_feature_maps[2]]
+pose_features = [pred_feature_maps[3], pred_feature_maps[4], pred_feature_maps[5]]
+
+pred_boxes, pred_confs, pred_probs = yolo_model.predict(yolo_features)
+pred_scores = pred_confs * pred_probs
+boxes, scores, labels, num_boxes = batch_nms(pred_boxes, pred_scores, max_boxes=1, score_thresh=0.3,
+                                             nms_thresh=0.4)
+# box-gated top-k keypoint candidates, [N, k, nV]
+x, y, conf = pose_loss.predict_topk(pose_features, boxes, num_boxes, [input_size[1], input_size[0]], k=12)
+
+sess = tf.Session(config=config)
+saver = tf.train.Saver()
+saver.restore(sess, tf.train.latest_checkpoint(args.checkpoint_dir))
+
+
+timer = create_timer(args.timing, args.timing_file, args.metrics_port)
+request_ids = itertools.count()
+
+
+def run_batch(items):
+    '''
+    MicroBatcher callback: one sess.run for the letterboxed images of the batch.
+    items: (request_id, img) pairs
+    '''
+    start = time.perf_counter()
+    imgs = [img for _, img in items]
+    boxes_b, scores_b, labels_b, num_boxes_b, x_b, y_b, conf_b = sess.run(
+        [boxes, scores, labels, num_boxes, x, y, conf], feed_dict={input_data: np.asarray(imgs)})
+    timer.add('sess_run', time.perf_counter() - start, [request_id for request_id, _ in items])
+    # only the first num_boxes entries of the padded NMS output are valid
+    return [(boxes_b[i, :num_boxes_b[i]], scores_b[i, :num_boxes_b[i]], labels_b[i, :num_boxes_b[i]],
+             x_b[i], y_b[i], conf_b[i], len(imgs)) for i in range(len(imgs))]
+
+
+# warm up: the first sess.run is much slower than the next ones
+sess.run(boxes, feed_dict={input_data: np.zeros((1, input_size[1], input_size[0], 3), np.float32)})
+batcher = MicroBatcher(run_batch, max_batch_size=args.max_batch_size, max_latency=args.max_latency / 1000.)
+
+
+def read_shared_frame(request):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=request['shm'])
+    try:
+        frame = np.ndarray(tuple(request['shape']), dtype=np.uint8, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+    return frame
+
+
+def estimate_pose(request_id, img_ori):
+    '''
+    Letterbox, micro-batched network, PnP in the calling (request) thread.
+    '''
+    start = time.time()
+    height_ori, width_ori = img_ori.shape[:2]
+    with timer.stage('letterbox', request_id):
+        img_resize, resize_ratio, dw, dh = letterbox_resize(img_ori, input_size[0], input_size[1])
+    with timer.stage('feed', request_id):
+        img = cv2.cvtColor(img_resize, cv2.COLOR_BGR2RGB)
+        img = np.asarray(img, np.float32) / 255.
+
+    network_start = time.time()
+    boxes_, scores_, labels_, x_, y_, conf_, batch_size = batcher.submit((request_id, img)).result()
+    network_end = time.time()
+
+    response = {'boxes': [], 'scores': [], 'labels': [], 'keypoints': None, 'R': None, 't': None, 'rt': None,
+                'batch_size': batch_size}
+    if len(boxes_) > 0:
+        # back to the image pixels, the network input being a letterboxed view of the camera
+        camera = get_camera(args.camera, (width_ori, height_ori), calib_dir=args.calib_dir)
+        input_camera = camera.letterboxed(input_size, resize_ratio, dw, dh)
+        with timer.stage('nms_decode', request_id):
+            boxes_ = boxes_.copy()
+            boxes_[:, [0, 2]], boxes_[:, [1, 3]] = camera.image_pixels(input_camera, boxes_[:, [0, 2]],
+                                                                       boxes_[:, [1, 3]])
+            x_, y_ = camera.image_pixels(input_camera, x_ * input_size[0], y_ * input_size[1])
+
+        with timer.stage('pnp', request_id):
+            rot, trans, transform = solve_pnp_candidates(x_, y_, conf_, gt_corners, camera.K,
+                                                         method=args.pnp_method, refine=args.pnp_refine)
+        response['boxes'] = boxes_.tolist()
+        response['scores'] = scores_.tolist()
+        response['labels'] = [args.classes[label] for label in labels_]
+        # the most confident candidate of every keypoint
+        response['keypoints'] = np.stack((x_[0], y_[0]), axis=1).tolist()
+        if transform is not None:
+            response['R'] = np.asarray(rot).tolist()
+            response['t'] = np.asarray(trans).reshape(3).tolist()
+            response['rt'] = np.asarray(transform).tolist()
+
+    end = time.time()
+    response['timing'] = {'network': (network_end - network_start) * 1000,
+                          'total': (end - start) * 1000}
+    return response
+
+
+class PoseRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive: every response has a Content-Length
+    protocol_version = 'HTTP/1.1'
+
+    def send_json(self, code, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/stats':
+            self.send_json(404, {'error': 'Unknown path: {}'.format(self.path)})
+            return
+        self.send_json(200, {'requests': batcher.item_count, 'batches': batcher.batch_count,
+                             'mean_batch_size': batcher.item_count / max(batcher.batch_count, 1)})
+
+    def do_POST(self):
+        if self.path != '/pose':
+            self.send_json(404, {'error': 'Unknown path: {}'.format(self.path)})
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        request_id = next(request_ids)
+        # the timings of the request are released whatever happens, or the timer keeps them forever
+        try:
+            self.handle_pose(body, request_id)
+        finally:
+            timer.frame_done(request_id)
+
+    def handle_pose(self, body, request_id):
+        try:
+            with timer.stage('decode', request_id):
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    img_ori = read_shared_frame(json.loads(body.decode('utf-8')))
+                else:
+                    img_ori = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+            if img_ori is None or img_ori.ndim != 3:
+                raise ValueError('Could not decode the image')
+        except Exception as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        try:
+            response = estimate_pose(request_id, img_ori)
+        except Exception as e:
+            # sess.run errors come back through the batcher future, PnP errors from OpenCV
+            self.send_json(500, {'error': str(e)})
+            return
+        with timer.stage('encode', request_id):
+            self.send_json(200, response)
+
+    def log_message(self, format, *args):
+        # one line per request would be too much under load
+        pass
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+if args.socket:
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    server = UnixHTTPServer(args.socket, PoseRequestHandler)
+    print('Serving on {}'.format(args.socket))
+else:
+    server = ThreadingHTTPServer((args.host, args.port), PoseRequestHandler)
+    print('Serving on http://{}:{}'.format(args.host, args.port))
+
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    server.server_close()
+    batcher.close()
+    sess.close()
+    timer.report()
+    timer.close()
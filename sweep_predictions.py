@@ -0,0 +1,142 @@
+# coding: utf-8
+# Evaluates a grid of post-processing parameters on the predictions written by `test_image_list.py --dump_dir`,
+# in a process pool, and prints the accuracies of every configuration with the Pareto front of
+# accuracy vs. PnP time.
+#     python sweep_predictions.py --store_dir predictions --best_cnt 4 8 12 --pnp_method ransac prosac
+
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import argparse
+from multiprocessing import Pool
+
+import numpy as np
+
+from utils.eval_utils import mesh_diameter, PoseErrorStats
+from utils.prediction_store import PredictionStore
+from utils.sweep_utils import PNP_FLAGS, RAW_PARAMS, parameter_grid, init_worker, evaluate_chunk, pareto_front
+
+from tqdm import tqdm
+
+from utils.meshply import MeshPly
+
+parser = argparse.ArgumentParser(description="DeepURL post-processing parameter sweep.")
+parser.add_argument("--store_dir", type=str, required=True,
+                    help="The directory written by `test_image_list.py --dump_dir`.")
+parser.add_argument("--mesh_path", type=str, default='aqua_glass_removed.ply',
+                    help="Aqua Mesh Model")
+parser.add_argument("--camera", type=str, default=None,
+                    help="Name of the camera calibration in --calib_dir, the one of the dump by default.")
+parser.add_argument("--calib_dir", type=str, default="./data/calibration",
+                    help="The directory of the camera calibration files.")
+parser.add_argument("--metric_vertices", type=int, default=1000,
+                    help="Number of mesh vertices (farthest point sampling) of the 2D and 3D vertex metrics, "
+                         "0 for the full mesh.")
+parser.add_argument("--score_thresh", nargs='*', type=float, default=None,
+                    help="Score thresholds of the NMS. Needs a dump with --dump_raw True.")
+parser.add_argument("--nms_thresh", nargs='*', type=float, default=None,
+                    help="IoU thresholds of the NMS, only matter with --max_boxes > 1. Needs --dump_raw True.")
+parser.add_argument("--max_boxes", nargs='*', type=int, default=None,
+                    help="Number of boxes kept by the NMS, the keypoints are gated by all of them. "
+                         "Needs --dump_raw True.")
+parser.add_argument("--radius", nargs='*', type=float, default=None,
+                    help="Radius of the keypoint cell selection, relative to the input size. Needs --dump_raw True.")
+parser.add_argument("--best_cnt", nargs='*', type=int, default=[12],
+                    help="Number of candidates of every keypoint used for PnP.")
+parser.add_argument("--conf_thresh", nargs='*', type=float, default=[0.5],
+                    help="Minimum confidence (logit) of the keypoint candidates used for PnP.")
+parser.add_argument("--pnp_method", nargs='*', type=str, default=['ransac'], choices=['ransac', 'prosac'],
+                    help="PnP methods.")
+parser.add_argument("--pnp_refine", nargs='*', type=lambda x: (str(x).lower() == 'true'), default=[False],
+                    help="Whether to refine the pose with Levenberg-Marquardt on the PnP inliers.")
+parser.add_argument("--pnp_flags", nargs='*', type=str, default=['epnp'], choices=sorted(PNP_FLAGS),
+                    help="Minimal solver of the PnP hypotheses.")
+parser.add_argument("--reproj_thresh", nargs='*', type=float, default=[8.0],
+                    help="Inlier thresholds of the PnP in pixels.")
+parser.add_argument("--stride", type=int, default=1,
+                    help="Only evaluate every stride-th image, for a quick first sweep.")
+parser.add_argument("--num_workers", type=int, default=os.cpu_count(),
+                    help="Number of worker processes.")
+parser.add_argument("--chunk_size", type=int, default=256,
+                    help="Number of images of one task of the pool.")
+parser.add_argument("--pareto_metric", type=str, default='acc10', choices=['acc10', 'acc5cm5deg', 'acc3d10'],
+                    help="Accuracy of the Pareto front.")
+parser.add_argument("--output", type=str, default=None,
+                    help="JSON file the table is written to.")
+
+
+def main():
+    args = parser.parse_args()
+    store = PredictionStore(args.store_dir)
+    meta = store.meta
+
+    params = []
+    raw_values = [(name, getattr(args, name)) for name in RAW_PARAMS]
+    if 'raw_x' in store:
+        # the values of the dump by default
+        defaults = {'score_thresh': meta['score_thresh'], 'nms_thresh': meta['nms_thresh'], 'max_boxes': 1,
+                    'radius': 0.3}
+        params += [(name, values if values else [defaults[name]]) for name, values in raw_values]
+    elif any(values for _, values in raw_values):
+        sys.exit('{} need a dump written with --dump_raw True'.format(', '.join(RAW_PARAMS)))
+    elif max(args.best_cnt) > meta['k']:
+        sys.exit('The dump only has {} candidates per keypoint'.format(meta['k']))
+    params += [('best_cnt', args.best_cnt), ('conf_thresh', args.conf_thresh), ('pnp_method', args.pnp_method),
+               ('pnp_refine', args.pnp_refine), ('pnp_flags', args.pnp_flags),
+               ('reproj_thresh', args.reproj_thresh)]
+    configs = parameter_grid(params)
+
+    rows = np.arange(0, len(store), args.stride)
+    chunks = [rows[i:i + args.chunk_size] for i in range(0, len(rows), args.chunk_size)]
+    tasks = [(index, config, chunk) for index, config in enumerate(configs) for chunk in chunks]
+    print('{} configurations x {} images, {} tasks on {} workers'.format(len(configs), len(rows), len(tasks),
+                                                                        args.num_workers))
+
+    stats = [PoseErrorStats() for _ in configs]
+    # caches the ground truth poses and the decimated vertices before the workers start
+    print(init_worker(args.store_dir, args.mesh_path, args.camera, args.calib_dir, args.metric_vertices).describe())
+    pool = Pool(args.num_workers, initializer=init_worker,
+                initargs=(args.store_dir, args.mesh_path, args.camera, args.calib_dir, args.metric_vertices))
+    try:
+        results = pool.imap_unordered(evaluate_chunk, tasks)
+        for index, failures, pnp_infos, errors in tqdm(results, total=len(tasks)):
+            for result in failures:
+                stats[index].add(result)
+            for info in pnp_infos:
+                stats[index].add_pnp(info)
+            if errors is not None:
+                stats[index].extend(errors)
+    finally:
+        pool.close()
+        pool.join()
+
+    diam = mesh_diameter(MeshPly(args.mesh_path).vertices,
+                         os.path.splitext(args.mesh_path)[0] + '_diameter.npz')
+    summaries = [s.summary(len(rows), diam) for s in stats]
+    # configurations without any PnP (no detection) come last
+    pnp_times = [s['pnp_time'] if np.isfinite(s['pnp_time']) else np.inf for s in summaries]
+    front = pareto_front([s[args.pareto_metric] for s in summaries], pnp_times)
+
+    names = [name for name, _ in params]
+    header = ''.join('{:>14}'.format(name) for name in names) + \
+             '{:>10}{:>12}{:>10}{:>10}{:>10}{:>8}'.format('acc10', 'acc5cm5deg', 'acc3d10', 'mean 2d', 'pnp ms', 'front')
+    print(header)
+    order = sorted(range(len(configs)), key=lambda i: pnp_times[i])
+    for i in order:
+        s = summaries[i]
+        print(''.join('{:>14}'.format(str(configs[i][name])) for name in names) +
+              '{:>10.2f}{:>12.2f}{:>10.2f}{:>10.2f}{:>10.3f}{:>8}'.format(
+                  s['acc10'], s['acc5cm5deg'], s['acc3d10'], s['mean_2d'], s['pnp_time'], '*' if front[i] else ''))
+
+    if args.output:
+        table = [dict(list(configs[i].items()) + [(key, float(value)) for key, value in summaries[i].items()] +
+                      [('pareto', bool(front[i]))]) for i in order]
+        with open(args.output, 'w') as f:
+            json.dump({'store_dir': args.store_dir, 'images': len(rows), 'results': table}, f, indent=2)
+        print('Table written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,9 +11,18 @@ import logging
 import time
 
 from utils.misc_utils import *
+from utils.calib_utils import get_camera
+from utils.nms_utils import batch_nms
+from utils.pipeline_utils import PipelineRunner
+from utils.pnp_utils import pnp_from_candidates
+from utils.timing_utils import create_timer
+from cascade import CascadeModel
 from utils.plot_utils import get_color_table, plot_one_box, draw_demo_img_corners
 from utils.eval_utils import *
+from utils.pose_eval_utils import PoseEvaluator, keypoints_from_lines
+from utils.prediction_store import PredictionStore, topk_columns, raw_columns
 from utils.data_utils import letterbox_resize
+from utils.eval_set_utils import eval_cache_dir, open_eval_cache
 
 from model import yolov3
 from tqdm import tqdm
@@ -40,10 +49,55 @@ parser.add_argument("--use_gt", type=lambda x: (str(x).lower() == 'true'), defau
                     help="Whether to use ground truth to calculate error.")
 parser.add_argument("--nV", type=int, default=8,
                     help="Whether to use ground truth to calculate error.")
+parser.add_argument("--metric_vertices", type=int, default=1000,
+                    help="Number of mesh vertices (farthest point sampling) of the 2D and 3D vertex metrics, "
+                         "0 for the full mesh.")
 parser.add_argument("--letterbox_resize", type=lambda x: (str(x).lower() == 'true'), default=True,
                     help="Whether to use the letterbox resize.")
+parser.add_argument("--camera", type=str, default="aqua_pool",
+                    help="Name of the camera calibration in --calib_dir.")
+parser.add_argument("--calib_dir", type=str, default="./data/calibration",
+                    help="The directory of the camera calibration files.")
+parser.add_argument("--cascade", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to find the box with the detection head at `cascade_det_size` first, then run the "
+                         "keypoint head on a crop around it at `new_size`.")
+parser.add_argument("--cascade_det_size", nargs='*', type=int, default=[320, 320],
+                    help="Input size of the detection stage of the cascade, size format: [width, height]")
+parser.add_argument("--cascade_padding", type=float, default=0.25,
+                    help="Margin around the box in the crop of the cascade, relative to the box size.")
+parser.add_argument("--batch_size", type=int, default=8,
+                    help="Number of images fed to the network in one sess.run.")
+parser.add_argument("--num_preprocess_threads", type=int, default=4,
+                    help="Number of threads decoding and resizing the images.")
+parser.add_argument("--num_postprocess_threads", type=int, default=4,
+                    help="Number of threads running PnP, the error metrics and the drawing.")
+parser.add_argument("--queue_size", type=int, default=32,
+                    help="Maximum number of images waiting between two pipeline stages.")
+parser.add_argument("--pnp_method", type=str, default='ransac', choices=['ransac', 'prosac'],
+                    help="'ransac': OpenCV's RANSAC, 'prosac': sample the most confident keypoints first.")
+parser.add_argument("--pnp_refine", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to refine the pose with Levenberg-Marquardt on the PnP inliers.")
+parser.add_argument("--timing", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to time the stages of every image and print their percentiles at the end.")
+parser.add_argument("--timing_file", type=str, default=None,
+                    help="With --timing, JSON lines file of the per-image stage timings.")
+parser.add_argument("--metrics_port", type=int, default=0,
+                    help="With --timing, serve the running stage percentiles on http://127.0.0.1:port/metrics.")
+parser.add_argument("--input_cache", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to read the letterboxed network inputs from a memory-mapped cache, written on the "
+                         "first run. The images are then only decoded for --save_video.")
+parser.add_argument("--input_cache_dir", type=str, default=None,
+                    help="Directory of the --input_cache, next to --image_list by default.")
+parser.add_argument("--dump_dir", type=str, default=None,
+                    help="Directory of a prediction store the network outputs of every image are written to, "
+                         "for eval_predictions.py.")
+parser.add_argument("--dump_raw", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="With --dump_dir, also write the boxes before NMS and the keypoints of every cell "
+                         "(about 0.5 MB per image), to tune the NMS thresholds and the keypoint selection.")
 
 args = parser.parse_args()
+assert not (args.dump_raw and args.cascade), '--dump_raw is not supported with --cascade'
+assert not (args.input_cache and args.cascade), '--input_cache is not supported with --cascade'
 
 args.anchors = parse_anchors(args.anchor_path)
 args.classes = read_class_names(args.class_name_path)
@@ -60,7 +114,7 @@ height = 600
 width = 800
 
 mesh = MeshPly(args.mesh_path)
-vertices = np.c_[np.array(mesh.vertices), np.ones((len(mesh.vertices), 1))].transpose()
+vertices = mesh.points
 corners3D = get_3D_corners(vertices)
 #for 9 points
 #gt_corners = np.array(np.transpose(np.concatenate((np.zeros((3, 1)), corners3D[:3, :]), axis=1)),dtype='float32')
@@ -68,237 +122,262 @@ corners3D = get_3D_corners(vertices)
 #for 8 points
 ref_corners = np.array(np.transpose(corners3D[:3, :]),dtype='float32')
 points = np.concatenate(( corners3D, np.array([0.0, 0.0, 0.0, 1.0]).reshape(4, 1)), axis=1)
-diam = calc_pts_diameter(np.array(mesh.vertices))
+diam = mesh_diameter(mesh.vertices, os.path.splitext(args.mesh_path)[0] + '_diameter.npz')
 if args.save_video:
     fourcc = cv2.VideoWriter_fourcc('m', 'p', '4', 'v')
     videoWriter = cv2.VideoWriter('video_result_pool_latest.mp4', fourcc, 20, (width, height))
 
-intrinsics = get_camera_intrinsic()
-# intrinsics = get_old_pool_intrinsics()
+# the images are resized to (width, height) before the network
+camera = get_camera(args.camera, (width, height), calib_dir=args.calib_dir)
+intrinsics = camera.K
+if args.use_gt:
+    # the errors of all the images are computed at the end, the ground truth poses are cached next to the list
+    evaluator = PoseEvaluator(keypoints_from_lines(lines, args.nV), ref_corners, corners3D, vertices, intrinsics,
+                              gt_cache=os.path.splitext(args.image_list)[0] + '_gt_poses.npz',
+                              num_vertices=args.metric_vertices,
+                              vertex_cache=os.path.splitext(args.mesh_path)[0] + '_metric_vertices.npz')
+    print(evaluator.describe())
+# network input size of the whole images
+input_size = args.cascade_det_size if args.cascade else args.new_size
+input_cache = None
+if args.input_cache:
+    input_cache = open_eval_cache(args.input_cache_dir or eval_cache_dir(args.image_list, input_size,
+                                                                         args.letterbox_resize),
+                                  lines, (width, height), input_size, letterbox=args.letterbox_resize,
+                                  num_threads=args.num_preprocess_threads)
 with tf.Session(config=config) as sess:
-    input_data = tf.placeholder(tf.float32, [1, args.new_size[1], args.new_size[0], 3], name='input_data')
-    pose_loss = PoseRegressionLoss(1, num_classes=1, nV=args.nV)
+    if args.cascade:
+        cascade = CascadeModel(args.num_class, args.anchors, nV=args.nV, det_size=args.cascade_det_size,
+                               pose_size=args.new_size, score_thresh=0.25, nms_thresh=0.35, k=12,
+                               padding=args.cascade_padding)
+    else:
+        input_data = tf.placeholder(tf.float32, [None, args.new_size[1], args.new_size[0], 3], name='input_data')
+        pose_loss = PoseRegressionLoss(args.batch_size, num_classes=1, nV=args.nV)
 
-    yolo_model = yolov3(args.num_class, args.anchors, nV=args.nV)
-    with tf.variable_scope('yolov3'):
-        pred_feature_maps = yolo_model.forward(input_data, False)
-    yolo_features = [pred_feature_maps[0], pred_feature_maps[1], pred_feature_maps[2]]
-    pose_features = [pred_feature_maps[3], pred_feature_maps[4], pred_feature_maps[5]]
+        yolo_model = yolov3(args.num_class, args.anchors, nV=args.nV)
+        with tf.variable_scope('yolov3'):
+            pred_feature_maps = yolo_model.forward(input_data, False)
+        yolo_features = [pred_feature_maps[0], pred_feature_maps[1], pred_feature_maps[2]]
+        pose_features = [pred_feature_maps[3], pred_feature_maps[4], pred_feature_maps[5]]
 
 
-    pred_boxes, pred_confs, pred_probs = yolo_model.predict(yolo_features)
+        pred_boxes, pred_confs, pred_probs = yolo_model.predict(yolo_features)
 
-    pred_scores = pred_confs * pred_probs
+        pred_scores = pred_confs * pred_probs
 
-    boxes, scores, labels = gpu_nms(pred_boxes, pred_scores, args.num_class, max_boxes=1, score_thresh=0.25,
-                                    nms_thresh=0.35)
+        boxes, scores, labels, num_boxes = batch_nms(pred_boxes, pred_scores, max_boxes=1, score_thresh=0.25,
+                                                     nms_thresh=0.35)
 
-    x, y, conf, selected = pose_loss.predict(pose_features,  boxes, scores, num_classes=1)
+        # box-gated top-k keypoint candidates, [N, k, nV]
+        x, y, conf = pose_loss.predict_topk(pose_features, boxes, num_boxes, [args.new_size[1], args.new_size[0]], k=12)
+        raw_fetches = []
+        if args.dump_raw:
+            # keypoints of every cell, [N, 13*13+26*26+52*52, nV]
+            raw_fetches = [pred_boxes, pred_scores] + \
+                          [tf.concat(t, axis=1) for t in zip(*[pose_loss.reorg(f) for f in pose_features])]
 
     saver = tf.train.Saver()
     checkpoint = tf.train.latest_checkpoint(args.checkpoint_dir)
     saver.restore(sess, checkpoint)
 
     #Error calculation stats
-    eps = 1e-5
-    testing_error_trans = 0.0
-    testing_error_angle = 0.0
-    testing_error_pixel = 0.0
-    preds_corners2D = []
-    gts_corners2D = []
-    errs_corner2D = []
-    errs_trans = []
-    errs_angle = []
-    errs_2d = []
-    errs_3d = []
-
-    roll_err = 0.0
-    pitch_err = 0.0
-    yaw_err = 0.0
-    count = 0
-    error_count = 0
-
-    for line in tqdm(lines):
-        line = line.strip()
-        line_arr = line.split(' ')
-        filename = line_arr[1]
-
-
-        img_ori = cv2.imread(filename)
-        # print(filename)
-        img_ori = cv2.resize(img_ori, (width, height))
-
-        # cv2.imshow('Image', img_ori)
-        # cv2.waitKey(0)
-        if args.letterbox_resize:
-            img_resize, resize_ratio, dw, dh = letterbox_resize(img_ori, args.new_size[0], args.new_size[1])
-        else:
-            height_ori, width_ori = img_ori.shape[:2]
-            img_resize = cv2.resize(img_ori, tuple(args.new_size))
-
-
-        img = cv2.cvtColor(img_resize, cv2.COLOR_BGR2RGB)
-        img = np.asarray(img, np.float32)
-        img = img[np.newaxis, :] / 255.
-
-        boxes_, scores_, labels_, x_, y_, conf_, selected_ = sess.run([boxes, scores, labels, x, y, conf, selected ], feed_dict={input_data: img})
-
-        if args.letterbox_resize:
-            x_ = (x_ * args.new_size[0] - dw ) / resize_ratio
-            y_ = (y_ * args.new_size[1] - dh ) / resize_ratio
-        else:
-            x_ = x_ * args.new_size[0]
-            y_ = y_ * args.new_size[1]
+    stats = PoseErrorStats()
+
+    store = None
+    if args.dump_dir:
+        columns = topk_columns(1, 12, args.nV)
+        if args.dump_raw:
+            num_cells = sum((args.new_size[0] // stride) * (args.new_size[1] // stride) for stride in (32, 16, 8))
+            columns.update(raw_columns(num_cells * 3, num_cells, args.num_class, args.nV))
+        store = PredictionStore.create(args.dump_dir, lines, columns, meta={
+            'image_list': args.image_list, 'image_size': [width, height], 'new_size': args.new_size,
+            'letterbox_resize': args.letterbox_resize or args.cascade, 'nV': args.nV, 'k': 12,
+            'score_thresh': 0.25, 'nms_thresh': 0.35, 'cascade': args.cascade, 'camera': args.camera,
+            'checkpoint': checkpoint})
+
+    timer = create_timer(args.timing, args.timing_file, args.metrics_port)
+
+    def preprocess(row):
+        line_arr = lines[row].strip().split(' ')
+        # the line index identifies the image in the timings
+        image_id = line_arr[0]
+
+        if input_cache is not None:
+            img_ori = None
+            # the image is only needed to draw the results
+            if args.save_video:
+                with timer.stage('decode', image_id):
+                    img_ori = cv2.resize(cv2.imread(line_arr[1]), (width, height))
+            with timer.stage('feed', image_id):
+                img = np.asarray(input_cache['images'][row], np.float32) / 255.
+            resize_ratio, dw, dh = input_cache['letterbox'][row]
+            if not args.letterbox_resize:
+                resize_ratio, dw, dh = None, None, None
+            return line_arr, img_ori, img, (resize_ratio, dw, dh)
+
+        with timer.stage('decode', image_id):
+            img_ori = cv2.imread(line_arr[1])
+            img_ori = cv2.resize(img_ori, (width, height))
+
+        with timer.stage('letterbox', image_id):
+            if args.letterbox_resize or args.cascade:
+                img_resize, resize_ratio, dw, dh = letterbox_resize(img_ori, input_size[0], input_size[1])
+            else:
+                img_resize = cv2.resize(img_ori, tuple(input_size))
+                resize_ratio, dw, dh = None, None, None
+
+        with timer.stage('feed', image_id):
+            img = cv2.cvtColor(img_resize, cv2.COLOR_BGR2RGB)
+            img = np.asarray(img, np.float32) / 255.
+
+        return line_arr, img_ori, img, (resize_ratio, dw, dh)
+
+    def inference(batch):
+        image_ids = [pre[0][0] for pre in batch]
+        start = time.perf_counter()
+        img_batch = np.asarray([pre[2] for pre in batch])
+        if args.cascade:
+            # boxes and keypoints come back in the image pixels
+            outputs = cascade.predict(sess, img_batch, [pre[1] for pre in batch], [pre[3] for pre in batch])
+            timer.add('sess_run', time.perf_counter() - start, image_ids)
+            return outputs
+        boxes_b, scores_b, labels_b, num_boxes_b, x_b, y_b, conf_b, raw_b = sess.run(
+            [boxes, scores, labels, num_boxes, x, y, conf, raw_fetches], feed_dict={input_data: img_batch})
+        timer.add('sess_run', time.perf_counter() - start, image_ids)
+        # only the first num_boxes entries of the padded NMS output are valid
+        return [(boxes_b[k, :num_boxes_b[k]], scores_b[k, :num_boxes_b[k]], labels_b[k, :num_boxes_b[k]],
+                 x_b[k], y_b[k], conf_b[k], [raw[k] for raw in raw_b]) for k in range(len(batch))]
+
+    def postprocess(pre, out):
+        '''
+        PnP and drawing of one image.
+        return: dict with the annotated image, whether a pose was found and the pose.
+        '''
+        line_arr, img_ori, _, (resize_ratio, dw, dh) = pre
+        image_id = line_arr[0]
+        boxes_, scores_, labels_, x_, y_, conf_ = out[:6]
+        # the images are resized to (width, height)
+        height_ori, width_ori = height, width
+        result = {'image_id': image_id, 'img': img_ori, 'valid': False, 'corner_dist': None, 'errors': None,
+                  'pnp': None, 'prediction': None, 'R': None, 't': None}
+
+        # the cascade already returns the keypoints and the boxes in the image pixels
+        if not args.cascade:
+            with timer.stage('nms_decode', image_id):
+                if args.letterbox_resize:
+                    x_ = (x_ * args.new_size[0] - dw ) / resize_ratio
+                    y_ = (y_ * args.new_size[1] - dh ) / resize_ratio
+                    boxes_[:, [0, 2]] = (boxes_[:, [0, 2]] - dw) / resize_ratio
+                    boxes_[:, [1, 3]] = (boxes_[:, [1, 3]] - dh) / resize_ratio
+                else:
+                    x_ = x_ * args.new_size[0]
+                    y_ = y_ * args.new_size[1]
+                    boxes_[:, [0, 2]] *= (width_ori / float(args.new_size[0]))
+                    boxes_[:, [1, 3]] *= (height_ori / float(args.new_size[1]))
+
+        if store is not None:
+            # padded to the single box of the NMS
+            prediction = {'num_boxes': len(boxes_), 'boxes': np.zeros((1, 4), np.float32),
+                          'scores': np.zeros(1, np.float32), 'labels': np.zeros(1, np.int32),
+                          'x': x_, 'y': y_, 'conf': conf_,
+                          'letterbox': [resize_ratio, dw, dh] if resize_ratio is not None else [0., 0., 0.]}
+            prediction['boxes'][:len(boxes_)] = boxes_[:1]
+            prediction['scores'][:len(boxes_)] = scores_[:1]
+            prediction['labels'][:len(boxes_)] = labels_[:1]
+            if len(out) > 6 and out[6]:
+                prediction.update(zip(['raw_boxes', 'raw_scores', 'raw_x', 'raw_y', 'raw_conf'], out[6]))
+            result['prediction'] = prediction
 
         if len(boxes_) == 0:
             print('No bounding box detected')
-            error_count += 1
-            continue
-
-        rot, trans, transform = solve_pnp(x_, y_, conf_, ref_corners, selected_, intrinsics, nV=args.nV)
-        if transform is not None:
-            intrinsics = np.array(get_camera_intrinsic(), dtype=np.float32)
-            bbox_3d = compute_projection(corners3D, transform, intrinsics)
-            corners2D_pr = np.transpose(bbox_3d)
-            # print(corners2D_pr)
-
+            return result
+
+        start = time.time()
+        with timer.stage('pnp', image_id):
+            rot, trans, transform, pnp_info = pnp_from_candidates(x_, y_, conf_, ref_corners, intrinsics,
+                                                                  method=args.pnp_method, refine=args.pnp_refine)
+        pnp_info['time'] = time.time() - start
+        result['pnp'] = pnp_info
+        if transform is None:
+            return result
+        result['R'], result['t'] = rot, trans
+
+        result['valid'] = True
+        if img_ori is None:
+            return result
+        corners2D_pr = np.transpose(camera.project(corners3D, transform))
+        if args.use_gt:
+            target = line_arr[5:args.nV*2+5]
+            target = [float(x) for x in target]
+            box_gt = np.array(target).reshape(args.nV, 2)
+            # the frames the evaluation counts as errors (see `batch_pose_errors`) are not written to the video
+            if np.mean(np.linalg.norm(box_gt[:8] - corners2D_pr, axis=1)) > evaluator.max_corner_dist:
+                print('More than 100 reprojection error')
+                result['img'] = None
+                return result
+
+        with timer.stage('draw', image_id):
             try:
-                # img_resize = draw_demo_img_corners(img_resize, corners2D_pr, (0, 0, 255), nV=8)
-                # cv2.imshow("Image", img_resize)
-                # cv2.waitKey(0)
-                # cv2.destroyAllWindows()
-
                 img_ori = draw_demo_img_corners(img_ori, corners2D_pr, (0, 0, 255), nV=8)
-                # cv2.imshow("Image", img_ori)
-                # cv2.waitKey(0)
             except:
                 print("Something went wrong")
-
             if args.use_gt:
-                # label_file = filename.replace('images', 'labels').replace('.png', '.txt').replace(
-				# '.jpg', '.txt').replace('.jpeg', '.txt').strip()
-                # if os.path.isfile(label_file):
-                target = line_arr[5:args.nV*2+5]
-                target = [float(x) for x in target]
-                box_gt = np.array(target).reshape(args.nV, 2)
-                # box_gt[:, 0] = box_gt[:, 0] * width
-                # box_gt[:, 1] = box_gt[:, 1] * height
-                # print(box_gt)
                 img_ori = draw_demo_img_corners(img_ori, box_gt, (0, 255, 0), nV=8)
-                # Compute [R|t] by pnp
-                R_gt, t_gt = pnp(
-                    np.array(ref_corners, dtype='float32'), box_gt, np.array(intrinsics, dtype='float32'))
-
-                # Compute translation error
-                trans_dist = np.sqrt(np.sum(np.square(t_gt - trans)))
-
-                corner_norm = np.linalg.norm(box_gt - corners2D_pr, axis=1)
-                corner_dist = np.mean(corner_norm)
-                errs_corner2D.append(corner_dist)
-
-                if corner_dist > 100:
-                    print('More than 100 reprojection error')
-                    error_count += 1
-                    continue
-
-                errs_trans.append(trans_dist)
-
-                # Compute angle error
-                angle_dist = calcAngularDistancetrace(R_gt, rot)
-                errs_angle.append(angle_dist)
-
-                indiv_angles = calcAngularDistance(R_gt, rot)
-                roll_err += indiv_angles[0]
-                pitch_err += indiv_angles[1]
-                yaw_err += indiv_angles[2]
-
-                # Compute pixel error
-                Rt_gt = np.concatenate((R_gt, t_gt), axis=1)
-                Rt_pr = np.concatenate((rot, trans), axis=1)
-                proj_2d_gt = compute_projection(vertices, Rt_gt, intrinsics)
-                proj_2d_pred = compute_projection(vertices, Rt_pr, intrinsics)
-                norm = np.linalg.norm(proj_2d_gt - proj_2d_pred, axis=0)
-                pixel_dist = np.mean(norm)
-                errs_2d.append(pixel_dist)
-
-                # print('Pixel Dist: ', pixel_dist)
-
-                # Compute 3D distances
-                transform_3d_gt = compute_transformation(vertices, Rt_gt)
-                transform_3d_pred = compute_transformation(vertices, Rt_pr)
-                norm3d = np.linalg.norm(transform_3d_gt - transform_3d_pred, axis=0)
-                vertex_dist = np.mean(norm3d)
-                errs_3d.append(vertex_dist)
-
-                testing_error_trans += trans_dist
-                testing_error_angle += angle_dist
-                testing_error_pixel += pixel_dist
-                count = count + 1
-
-        else:
-            error_count += 1
+            for i in range(len(boxes_)):
+                x0, y0, x1, y1 = boxes_[i]
+                plot_one_box(img_ori, [x0, y0, x1, y1],
+                             label=args.classes[labels_[i]] + ', {:.2f}%'.format(scores_[i] * 100), color=(0, 255, 0))
+
+        result['img'] = img_ori
+        return result
+
+    runner = PipelineRunner(preprocess, inference, postprocess, batch_size=args.batch_size,
+                            num_preprocess_threads=args.num_preprocess_threads,
+                            num_postprocess_threads=args.num_postprocess_threads,
+                            queue_size=args.queue_size)
+
+    # rows of `lines` with a pose and their poses, evaluated all at once at the end
+    pose_rows, R_pr, t_pr = [], [], []
+    # the results come back in the order of `lines`
+    for row, result in enumerate(tqdm(runner.run(range(len(lines))), total=len(lines))):
+        if store is not None and result['prediction'] is not None:
+            store.write(row, **result['prediction'])
+
+        if not result['valid']:
+            stats.add(result)
+            timer.frame_done(result['image_id'])
             continue
-
-
-        # rescale the coordinates to the original image
-        if args.letterbox_resize:
-            boxes_[:, [0, 2]] = (boxes_[:, [0, 2]] - dw) / resize_ratio
-            boxes_[:, [1, 3]] = (boxes_[:, [1, 3]] - dh) / resize_ratio
+        if args.use_gt:
+            stats.add_pnp(result['pnp'])
+            pose_rows.append(row)
+            R_pr.append(result['R'])
+            t_pr.append(result['t'])
         else:
-            boxes_[:, [0, 2]] *= (width_ori / float(args.new_size[0]))
-            boxes_[:, [1, 3]] *= (height_ori / float(args.new_size[1]))
-
-        # print("Print Boxes", boxes_)
-        for i in range(len(boxes_)):
-            x0, y0, x1, y1 = boxes_[i]
-            plot_one_box(img_ori, [x0, y0, x1, y1],
-                         label=args.classes[labels_[i]] + ', {:.2f}%'.format(scores_[i] * 100), color=(0, 255, 0))
-        # cv2.imshow('Image', img_ori)
-        # k = cv2.waitKey(0) & 0XFF
-        # if k ==ord('q'):
-        #     break
-        # cv2.destroyAllWindows()
-
-        if args.save_video:
-            videoWriter.write(img_ori)
+            stats.add(result)
+
+        if args.save_video and result['img'] is not None:
+            with timer.stage('encode', result['image_id']):
+                videoWriter.write(result['img'])
+        timer.frame_done(result['image_id'])
 
 if args.use_gt:
-    px_threshold = 10
-    acc = len(np.where(np.array(errs_2d) <= px_threshold)[0]) * 100. / (len(lines))
-    acc15 = len(np.where(np.array(errs_2d) <= 15)[0]) * 100. / (len(lines))
-    acc20 = len(np.where(np.array(errs_2d) <= 20)[0]) * 100. / (len(lines))
-    acc5cm5deg = len(np.where((np.array(errs_trans) <= 0.05) & (np.array(errs_angle) <= 5))[0]) * 100. / (
-            len(errs_trans) + eps)
-    acc3d10 = len(np.where(np.array(errs_3d) <= diam * 0.1)[0]) * 100. / (len(lines) + eps)
-    acc5cm5deg = len(np.where((np.array(errs_trans) <= 0.05) & (np.array(errs_angle) <= 5))[0]) * 100. / (
-            len(errs_trans) + eps)
-    corner_acc = len(np.where(np.array(errs_corner2D) <= px_threshold)[0]) * 100. / (len(lines) + eps)
-    mean_err_2d = np.mean(errs_2d)
-    mean_corner_err_2d = np.mean(errs_corner2D)
-
-    # Print test statistics
-    logging.error('Correct Predictions: %d' % len(errs_2d))
-    logging.error('Results of {}'.format('Aqua'))
-    logging.error('   Acc using {} px 2D Projection = {:.4f}%'.format(px_threshold, acc))
-    logging.error('   Acc using {} px 2D Projection = {:.4f}%'.format(15, acc15))
-    logging.error('   Acc using {} px 2D Projection = {:.4f}%'.format(20, acc20))
-
-    logging.error('   Acc using 10% threshold - {} vx 3D Transformation = {:.4f}%'.format(diam * 0.1, acc3d10))
-    logging.error('   Acc using 5 cm 5 degree metric = {:.4f}%'.format(acc5cm5deg))
-    logging.error("   Mean 2D pixel error is %f, Mean vertex error is %f, mean corner error is %f" % (
-        mean_err_2d, np.mean(errs_3d), mean_corner_err_2d))
-    logging.error('   Translation error: %f m, angle error: %f degree, pixel error: % f pix' % (
-        testing_error_trans / count, testing_error_angle / count, testing_error_pixel / count))
-    logging.error('Correct prediction: %f' % (count/len(lines)))
-    logging.error('Roll error: %f' % (roll_err/count))
-    logging.error('Pitch error: %f' % (pitch_err/count))
-    logging.error('Yaw error: %f' % (yaw_err/count))
-
-    print('Total errors: ', error_count)
+    if pose_rows:
+        metrics_start = time.perf_counter()
+        stats.extend(evaluator.errors(R_pr, t_pr, pose_rows))
+        timer.add('metrics', time.perf_counter() - metrics_start)
+    stats.report(len(lines), diam, logging.error)
+
+stats.report_pnp(args.pnp_method + (' + LM' if args.pnp_refine else ''), logging.error)
+
+if store is not None:
+    store.close()
+    logging.error('Predictions written to {}'.format(args.dump_dir))
 
 if args.save_video:
     videoWriter.release()
 
+timer.report(logging.error)
+timer.close()
 
 
 cv2.destroyAllWindows()
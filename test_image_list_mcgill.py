@@ -11,6 +11,7 @@ import logging
 import time
 
 from utils.misc_utils import *
+from utils.calib_utils import get_camera
 from utils.nms_utils import gpu_nms
 from utils.plot_utils import get_color_table, plot_one_box, draw_demo_img, draw_demo_img_corners
 from utils.eval_utils import *
@@ -44,6 +45,10 @@ parser.add_argument("--nV", type=int, default=8,
                     help="Whether to use ground truth to calculate error.")
 parser.add_argument("--letterbox_resize", type=lambda x: (str(x).lower() == 'true'), default=True,
                     help="Whether to use the letterbox resize.")
+parser.add_argument("--camera", type=str, default="mcgill",
+                    help="Name of the camera calibration in --calib_dir.")
+parser.add_argument("--calib_dir", type=str, default="./data/calibration",
+                    help="The directory of the camera calibration files.")
 
 args = parser.parse_args()
 
@@ -62,7 +67,7 @@ height = 600
 width = 800
 
 mesh = MeshPly(args.mesh_path)
-vertices = np.c_[np.array(mesh.vertices), np.ones((len(mesh.vertices), 1))].transpose()
+vertices = mesh.points
 corners3D = get_3D_corners(vertices)
 #for 9 points
 #gt_corners = np.array(np.transpose(np.concatenate((np.zeros((3, 1)), corners3D[:3, :]), axis=1)),dtype='float32')
@@ -70,14 +75,14 @@ corners3D = get_3D_corners(vertices)
 #for 8 points
 ref_corners = np.array(np.transpose(corners3D[:3, :]),dtype='float32')
 points = np.concatenate(( corners3D, np.array([0.0, 0.0, 0.0, 1.0]).reshape(4, 1)), axis=1)
-diam = calc_pts_diameter(np.array(mesh.vertices))
+diam = mesh_diameter(mesh.vertices, os.path.splitext(args.mesh_path)[0] + '_diameter.npz')
 if args.save_video:
     fourcc = cv2.VideoWriter_fourcc('m', 'p', '4', 'v')
     videoWriter = cv2.VideoWriter('video_bbd_mcgill.mp4', fourcc, 10, (1920, 1080))
 
-intrinsics = np.array( [584.465957, 0.000000, 379.463729,
-               0.000000, 587.395903, 318.819660,
-               0.000000, 0.000000, 1.000000]).reshape((3,3))
+# the images are resized to (width, height) before the network
+camera = get_camera(args.camera, (width, height), calib_dir=args.calib_dir)
+intrinsics = camera.K
 
 def compose_transform(rotm, trans):
     transform = np.identity(4, dtype=np.float32)
@@ -86,7 +91,6 @@ def compose_transform(rotm, trans):
     return transform
 
 
-# intrinsics = get_old_pool_intrinsics()
 with tf.Session(config=config) as sess:
     input_data = tf.placeholder(tf.float32, [1, args.new_size[1], args.new_size[0], 3], name='input_data')
     pose_loss = PoseRegressionLoss(1, num_classes=1, nV=args.nV)
@@ -106,6 +110,8 @@ with tf.Session(config=config) as sess:
                                     nms_thresh=0.2)
 
     x, y, conf, selected = pose_loss.predict(region_features,  boxes, scores, num_classes=1)
+    # single image: drop the batch dimension
+    x, y, conf, selected = x[0], y[0], conf[0], selected[0]
 
     saver = tf.train.Saver()
     checkpoint = tf.train.latest_checkpoint(args.checkpoint_dir)
@@ -168,7 +174,7 @@ with tf.Session(config=config) as sess:
 
         rot, trans, transform = solve_pnp(x_, y_, conf_, ref_corners, selected_, intrinsics, nV=args.nV)
         if transform is not None:
-            bbox_3d = compute_projection(corners3D, transform, intrinsics)
+            bbox_3d = camera.project(corners3D, transform)
             corners2D_pr = np.transpose(bbox_3d)
             # print(corners2D_pr)
 
@@ -192,7 +198,7 @@ with tf.Session(config=config) as sess:
                     unreal_real = compose_transform(np.array([[1, 0, 0], [0, -1, 0], [0, 0, 1]]), np.array([0, 0, 0]))
                     final = np.dot(unreal_cam, transform).dot(unreal_real)
 
-                    bbox_3d = compute_projection(corners3D, final[:3, :], intrinsics)
+                    bbox_3d = camera.project(corners3D, final[:3, :])
                     box_gt = np.transpose(bbox_3d)
 
 
@@ -239,8 +245,8 @@ with tf.Session(config=config) as sess:
                     trans = np.array(trans).reshape(3,1)
                     Rt_gt = np.concatenate((R_gt, t_gt), axis=1)
                     Rt_pr = np.concatenate((rot, trans), axis=1)
-                    proj_2d_gt = compute_projection(vertices, Rt_gt, intrinsics)
-                    proj_2d_pred = compute_projection(vertices, Rt_pr, intrinsics)
+                    proj_2d_gt = camera.project(vertices, Rt_gt)
+                    proj_2d_pred = camera.project(vertices, Rt_pr)
                     norm = np.linalg.norm(proj_2d_gt - proj_2d_pred, axis=0)
                     pixel_dist = np.mean(norm)
                     errs_2d.append(pixel_dist)
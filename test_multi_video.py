@@ -0,0 +1,253 @@
+# coding: utf-8
+# Several cameras, one network: the frames of all the video streams are batched together in one sess.run.
+# Every stream has its own calibration, output video and pose log.
+
+from __future__ import division, print_function
+
+import tensorflow as tf
+import numpy as np
+import argparse
+import cv2
+import os
+import time
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.misc_utils import *
+from utils.calib_utils import get_camera
+from utils.nms_utils import batch_nms
+from utils.stream_utils import VideoStream, StreamScheduler
+from utils.timing_utils import create_timer
+from utils.plot_utils import plot_one_box, draw_demo_img_corners
+from utils.data_aug import letterbox_resize
+
+from model import yolov3
+from pose_loss import PoseRegressionLoss
+
+from utils.meshply import MeshPly
+
+parser = argparse.ArgumentParser(description="DeepURL multi-camera video procedure.")
+parser.add_argument("--input_videos", nargs='+', type=str, required=True,
+                    help="The video files, stream URLs or camera indices.")
+parser.add_argument("--cameras", nargs='+', type=str, default=['gopro_hero7'],
+                    help="Calibration name of every stream in --calib_dir, or one for all of them.")
+parser.add_argument("--stream_names", nargs='*', type=str, default=None,
+                    help="Names of the streams in the outputs. Defaults to stream0, stream1, ...")
+parser.add_argument("--calib_dir", type=str, default="./data/calibration",
+                    help="The directory of the camera calibration files.")
+parser.add_argument("--output_dir", type=str, default="./multi_video_results",
+                    help="Directory of the output videos and pose logs.")
+parser.add_argument("--anchor_path", type=str, default="./data/yolo_anchors.txt",
+                    help="The path of the anchor txt file.")
+parser.add_argument("--new_size", nargs='*', type=int, default=[416, 416],
+                    help="Resize the input image with `new_size`, size format: [width, height]")
+parser.add_argument("--class_name_path", type=str, default="./data/aqua.names",
+                    help="The path of the class names.")
+parser.add_argument("--checkpoint_dir", type=str, default="/home/bjoshi/deep_localization/checkpoint",
+                    help="The path of the weights to restore.")
+parser.add_argument("--save_video", type=lambda x: (str(x).lower() == 'true'), default=True,
+                    help="Whether to save the video detection results.")
+parser.add_argument("--mesh_path", type=str, default='/home/bjoshi/singleshotv3-tf/aqua_glass_removed.ply',
+                    help="Aqua Mesh Model")
+parser.add_argument("--nV", type=int, default=8,
+                    help="Number of corner points used for PnP.")
+parser.add_argument("--rectify", type=lambda x: (str(x).lower() == 'true'), default=True,
+                    help="Whether to undistort the keypoints before PnP (the network runs on the raw frames).")
+parser.add_argument("--batch_size", type=int, default=4,
+                    help="Maximum number of frames, from all the streams, in one sess.run.")
+parser.add_argument("--max_pending", type=int, default=2,
+                    help="Decoded frames waiting for the network per stream.")
+parser.add_argument("--realtime", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Read the video files at their frame rate, like live cameras, and drop the oldest frames "
+                         "of a stream when the network cannot keep up. Otherwise every frame is processed.")
+parser.add_argument("--num_postprocess_threads", type=int, default=4,
+                    help="Number of threads running PnP and the drawing.")
+parser.add_argument("--pnp_method", type=str, default='ransac', choices=['ransac', 'prosac'],
+                    help="'ransac': OpenCV's RANSAC, 'prosac': sample the most confident keypoints first.")
+parser.add_argument("--pnp_refine", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to refine the pose with Levenberg-Marquardt on the PnP inliers.")
+parser.add_argument("--timing", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to time the stages of every frame and print their percentiles at the end.")
+parser.add_argument("--timing_file", type=str, default=None,
+                    help="With --timing, JSON lines file of the per-frame stage timings.")
+parser.add_argument("--metrics_port", type=int, default=0,
+                    help="With --timing, serve the running stage percentiles on http://127.0.0.1:port/metrics.")
+args = parser.parse_args()
+
+args.anchors = parse_anchors(args.anchor_path)
+args.classes = read_class_names(args.class_name_path)
+args.num_class = len(args.classes)
+
+num_streams = len(args.input_videos)
+if len(args.cameras) == 1:
+    args.cameras = args.cameras * num_streams
+assert len(args.cameras) == num_streams, 'One camera per stream, or one for all of them'
+if not args.stream_names:
+    args.stream_names = ['stream{}'.format(i) for i in range(num_streams)]
+assert len(args.stream_names) == num_streams, 'One name per stream'
+
+config = tf.ConfigProto()
+config.gpu_options.allow_growth = True
+
+mesh = MeshPly(args.mesh_path)
+vertices = mesh.points
+corners3D = get_3D_corners(vertices)
+gt_corners = np.array(np.transpose(corners3D[:3, :]), dtype='float32')
+points = np.concatenate((corners3D, np.array([0.0, 0.0, 0.0, 1.0]).reshape(4, 1)), axis=1)
+
+streams = [VideoStream(name, source, max_pending=args.max_pending, realtime=args.realtime)
+           for name, source in zip(args.stream_names, args.input_videos)]
+cameras = [get_camera(name, (stream.width, stream.height), calib_dir=args.calib_dir)
+           for name, stream in zip(args.cameras, streams)]
+
+if not os.path.exists(args.output_dir):
+    os.makedirs(args.output_dir)
+writers = [None] * num_streams
+if args.save_video:
+    fourcc = cv2.VideoWriter_fourcc('m', 'p', '4', 'v')
+    writers = [cv2.VideoWriter(os.path.join(args.output_dir, stream.name + '.mp4'), fourcc, stream.fps,
+                               (stream.width, stream.height)) for stream in streams]
+# one line per processed frame: frame id, then R (row-major) and t, or nan without pose
+pose_logs = [open(os.path.join(args.output_dir, stream.name + '_poses.txt'), 'w') for stream in streams]
+
+input_size = tuple(args.new_size)
+input_data = tf.placeholder(tf.float32, [None, input_size[1], input_size[0], 3], name='input_data')
+pose_loss = PoseRegressionLoss(args.batch_size, num_classes=1, nV=args.nV)
+
+yolo_model = yolov3(args.num_class, args.anchors, nV=args.nV)
+with tf.variable_scope('yolov3'):
+    pred_feature_maps = yolo_model.forward(input_data, False)
+yolo_features = [pred_feature_maps[0], pred_feature_maps[1], pred_feature_maps[2]]
+pose_features = [pred_feature_maps[3], pred_feature_maps[4], pred_feature_maps[5]]
+
+pred_boxes, pred_confs, pred_probs = yolo_model.predict(yolo_features)
+pred_scores = pred_confs * pred_probs
+boxes, scores, labels, num_boxes = batch_nms(pred_boxes, pred_scores, max_boxes=1, score_thresh=0.3,
+                                             nms_thresh=0.4)
+# box-gated top-k keypoint candidates, [N, k, nV]
+x, y, conf = pose_loss.predict_topk(pose_features, boxes, num_boxes, [input_size[1], input_size[0]], k=12)
+
+
+timer = create_timer(args.timing, args.timing_file, args.metrics_port)
+
+
+def frame_key(index, frame_id):
+    # frames are identified by stream and frame number in the timings
+    return '{}:{}'.format(streams[index].name, frame_id)
+
+
+def preprocess(index, frame_id, img_ori):
+    key = frame_key(index, frame_id)
+    with timer.stage('letterbox', key):
+        img_resize, resize_ratio, dw, dh = letterbox_resize(img_ori, input_size[0], input_size[1])
+    with timer.stage('feed', key):
+        img = cv2.cvtColor(img_resize, cv2.COLOR_BGR2RGB)
+        img = np.asarray(img, np.float32) / 255.
+    return img, (resize_ratio, dw, dh)
+
+
+def postprocess(index, frame_id, img_ori, mapping, out):
+    '''
+    PnP with the calibration of stream `index`, and drawing.
+    return: the frame and the pose (rot, trans), None if there is none.
+    '''
+    camera = cameras[index]
+    key = frame_key(index, frame_id)
+    resize_ratio, dw, dh = mapping
+    boxes_, scores_, labels_, x_, y_, conf_ = out
+    if len(boxes_) == 0:
+        return img_ori, None
+
+    # back to the frame coordinates
+    with timer.stage('nms_decode', key):
+        x_ = (x_ * input_size[0] - dw) / resize_ratio
+        y_ = (y_ * input_size[1] - dh) / resize_ratio
+        boxes_[:, [0, 2]] = (boxes_[:, [0, 2]] - dw) / resize_ratio
+        boxes_[:, [1, 3]] = (boxes_[:, [1, 3]] - dh) / resize_ratio
+        if args.rectify:
+            x_, y_ = camera.undistort_points(x_, y_)
+
+    with timer.stage('pnp', key):
+        rot, trans, transform = solve_pnp_candidates(x_, y_, conf_, gt_corners, camera.K,
+                                                     method=args.pnp_method, refine=args.pnp_refine)
+
+    with timer.stage('draw', key):
+        for i in range(len(boxes_)):
+            x0, y0, x1, y1 = boxes_[i]
+            plot_one_box(img_ori, [x0, y0, x1, y1],
+                         label=args.classes[labels_[i]] + ', {:.2f}%'.format(scores_[i] * 100), color=(0, 255, 0),
+                         line_thickness=16)
+        if transform is None:
+            return img_ori, None
+
+        corners2D_pr = np.transpose(camera.project(points, transform, distort=args.rectify))
+        img_ori = draw_demo_img_corners(img_ori, corners2D_pr, (0, 0, 255), nV=8, thickness=16)
+    return img_ori, (rot, trans)
+
+
+def write_result(index, frame_id, future):
+    img_ori, pose = future.result()
+    if pose is None:
+        pose_logs[index].write('{} {}\n'.format(frame_id, ' '.join(['nan'] * 12)))
+    else:
+        values = np.concatenate((np.asarray(pose[0]).reshape(9), np.asarray(pose[1]).reshape(3)))
+        pose_logs[index].write('{} {}\n'.format(frame_id, ' '.join('{:.6f}'.format(v) for v in values)))
+        detected_counts[index] += 1
+    if writers[index] is not None:
+        with timer.stage('encode', frame_key(index, frame_id)):
+            writers[index].write(img_ori)
+    timer.frame_done(frame_key(index, frame_id))
+
+
+detected_counts = [0] * num_streams
+scheduler = StreamScheduler(streams, batch_size=args.batch_size)
+post_pool = ThreadPoolExecutor(max_workers=args.num_postprocess_threads)
+
+with tf.Session(config=config) as sess:
+    saver = tf.train.Saver()
+    saver.restore(sess, tf.train.latest_checkpoint(args.checkpoint_dir))
+
+    scheduler.start()
+    # the results of a batch are written while the network runs on the next one, in the frame order
+    waiting = collections.deque()
+    batch_count = 0
+    try:
+        while True:
+            batch = scheduler.next_batch()
+            if not batch:
+                break
+            inputs = [preprocess(index, frame_id, img_ori) for index, frame_id, img_ori in batch]
+            start = time.perf_counter()
+            boxes_b, scores_b, labels_b, num_boxes_b, x_b, y_b, conf_b = sess.run(
+                [boxes, scores, labels, num_boxes, x, y, conf],
+                feed_dict={input_data: np.asarray([img for img, _ in inputs])})
+            timer.add('sess_run', time.perf_counter() - start,
+                      [frame_key(index, frame_id) for index, frame_id, _ in batch])
+            batch_count += 1
+
+            while waiting:
+                write_result(*waiting.popleft())
+            for k, (index, frame_id, img_ori) in enumerate(batch):
+                # only the first num_boxes entries of the padded NMS output are valid
+                n = num_boxes_b[k]
+                out = (boxes_b[k, :n], scores_b[k, :n], labels_b[k, :n], x_b[k], y_b[k], conf_b[k])
+                waiting.append((index, frame_id,
+                                post_pool.submit(postprocess, index, frame_id, img_ori, inputs[k][1], out)))
+        while waiting:
+            write_result(*waiting.popleft())
+    finally:
+        scheduler.stop()
+        post_pool.shutdown(wait=True)
+        for writer in writers:
+            if writer is not None:
+                writer.release()
+        for pose_log in pose_logs:
+            pose_log.close()
+        timer.close()
+
+print('Batches: {}, mean batch size: {:.2f}'.format(
+    batch_count, sum(stream.processed for stream in streams) / float(max(batch_count, 1))))
+for stream, detected in zip(streams, detected_counts):
+    print('{}: {} frames read, {} processed, {} dropped, {} with a pose'.format(
+        stream.name, stream.read_count, stream.processed, stream.dropped, detected))
+timer.report()
@@ -11,6 +11,8 @@ import logging
 import time
 
 from utils.misc_utils import *
+from utils.calib_utils import get_camera
+from utils.timing_utils import create_timer
 from utils.plot_utils import get_color_table, plot_one_box, draw_demo_img_corners
 from utils.eval_utils import *
 from utils.data_utils import letterbox_resize
@@ -18,6 +20,7 @@ from utils.data_utils import letterbox_resize
 from model import yolov3
 from tqdm import tqdm
 from pose_loss import PoseRegressionLoss
+from cascade import CascadeModel
 
 from utils.meshply import MeshPly
 
@@ -38,8 +41,21 @@ parser.add_argument("--nV", type=int, default=8,
                     help="Number of corner points used for PnP.")
 parser.add_argument("--letterbox_resize", type=lambda x: (str(x).lower() == 'true'), default=True,
                     help="Whether to use the letterbox resize.")
+parser.add_argument("--camera", type=str, default="aqua_pool",
+                    help="Name of the camera calibration in --calib_dir.")
+parser.add_argument("--calib_dir", type=str, default="./data/calibration",
+                    help="The directory of the camera calibration files.")
+parser.add_argument("--cascade", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to find the box with the detection head at `cascade_det_size` first, then run the "
+                         "keypoint head on a crop around it at `new_size`.")
+parser.add_argument("--cascade_det_size", nargs='*', type=int, default=[320, 320],
+                    help="Input size of the detection stage of the cascade, size format: [width, height]")
+parser.add_argument("--cascade_padding", type=float, default=0.25,
+                    help="Margin around the box in the crop of the cascade, relative to the box size.")
 parser.add_argument("--save_result", type=lambda x: (str(x).lower() == 'true'), default=True,
                     help="Whether to save the image detection results.")
+parser.add_argument("--timing", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to print the time of every stage.")
 
 args = parser.parse_args()
 
@@ -56,7 +72,7 @@ height = 600
 width = 800
 
 mesh = MeshPly(args.mesh_path)
-vertices = np.c_[np.array(mesh.vertices), np.ones((len(mesh.vertices), 1))].transpose()
+vertices = mesh.points
 corners3D = get_3D_corners(vertices)
 #for 9 points
 #gt_corners = np.array(np.transpose(np.concatenate((np.zeros((3, 1)), corners3D[:3, :]), axis=1)),dtype='float32')
@@ -64,68 +80,96 @@ corners3D = get_3D_corners(vertices)
 #for 8 points
 ref_corners = np.array(np.transpose(corners3D[:3, :]),dtype='float32')
 points = np.concatenate(( corners3D, np.array([0.0, 0.0, 0.0, 1.0]).reshape(4, 1)), axis=1)
-diam = calc_pts_diameter(np.array(mesh.vertices))
+diam = mesh_diameter(mesh.vertices, os.path.splitext(args.mesh_path)[0] + '_diameter.npz')
 
-intrinsics = get_camera_intrinsic()
-# intrinsics = get_old_pool_intrinsics()
+# the image is resized to (width, height) before the network
+camera = get_camera(args.camera, (width, height), calib_dir=args.calib_dir)
+intrinsics = camera.K
 with tf.Session(config=config) as sess:
-    input_data = tf.placeholder(tf.float32, [1, args.new_size[1], args.new_size[0], 3], name='input_data')
-    pose_loss = PoseRegressionLoss(1, num_classes=1, nV=args.nV)
+    if args.cascade:
+        cascade = CascadeModel(args.num_class, args.anchors, nV=args.nV, det_size=args.cascade_det_size,
+                               pose_size=args.new_size, score_thresh=0.25, nms_thresh=0.35, k=12,
+                               padding=args.cascade_padding)
+    else:
+        input_data = tf.placeholder(tf.float32, [1, args.new_size[1], args.new_size[0], 3], name='input_data')
+        pose_loss = PoseRegressionLoss(1, num_classes=1, nV=args.nV)
 
-    yolo_model = yolov3(args.num_class, args.anchors, nV=args.nV)
-    with tf.variable_scope('yolov3'):
-        pred_feature_maps = yolo_model.forward(input_data, False)
-    yolo_features = [pred_feature_maps[0], pred_feature_maps[1], pred_feature_maps[2]]
-    pose_features = [pred_feature_maps[3], pred_feature_maps[4], pred_feature_maps[5]]
+        yolo_model = yolov3(args.num_class, args.anchors, nV=args.nV)
+        with tf.variable_scope('yolov3'):
+            pred_feature_maps = yolo_model.forward(input_data, False)
+        yolo_features = [pred_feature_maps[0], pred_feature_maps[1], pred_feature_maps[2]]
+        pose_features = [pred_feature_maps[3], pred_feature_maps[4], pred_feature_maps[5]]
 
 
-    pred_boxes, pred_confs, pred_probs = yolo_model.predict(yolo_features)
+        pred_boxes, pred_confs, pred_probs = yolo_model.predict(yolo_features)
 
-    pred_scores = pred_confs * pred_probs
+        pred_scores = pred_confs * pred_probs
 
-    boxes, scores, labels = gpu_nms(pred_boxes, pred_scores, args.num_class, max_boxes=1, score_thresh=0.25,
-                                    nms_thresh=0.35)
+        boxes, scores, labels = gpu_nms(pred_boxes, pred_scores, args.num_class, max_boxes=1, score_thresh=0.25,
+                                        nms_thresh=0.35)
 
-    x, y, conf, selected = pose_loss.predict(pose_features,  boxes, scores, num_classes=1)
+        x, y, conf, selected = pose_loss.predict(pose_features,  boxes, scores, num_classes=1)
+        # single image: drop the batch dimension
+        x, y, conf, selected = x[0], y[0], conf[0], selected[0]
 
     saver = tf.train.Saver()
     checkpoint = tf.train.latest_checkpoint(args.checkpoint_dir)
     saver.restore(sess, checkpoint)
 
 
-    img_ori = cv2.imread(args.input_image)
-    # print(filename)
-    img_ori = cv2.resize(img_ori, (width, height))
+    timer = create_timer(args.timing)
+
+    with timer.stage('decode', 0):
+        img_ori = cv2.imread(args.input_image)
+        # print(filename)
+        img_ori = cv2.resize(img_ori, (width, height))
 
     # cv2.imshow('Image', img_ori)
     # cv2.waitKey(0)
-    if args.letterbox_resize:
-        img_resize, resize_ratio, dw, dh = letterbox_resize(img_ori, args.new_size[0], args.new_size[1])
+    input_size = args.cascade_det_size if args.cascade else args.new_size
+    with timer.stage('letterbox', 0):
+        if args.letterbox_resize or args.cascade:
+            img_resize, resize_ratio, dw, dh = letterbox_resize(img_ori, input_size[0], input_size[1])
+        else:
+            height_ori, width_ori = img_ori.shape[:2]
+            img_resize = cv2.resize(img_ori, tuple(input_size))
+
+
+    with timer.stage('feed', 0):
+        img = cv2.cvtColor(img_resize, cv2.COLOR_BGR2RGB)
+        img = np.asarray(img, np.float32)
+        img = img[np.newaxis, :] / 255.
+
+    if args.cascade:
+        # boxes and keypoints come back in the image pixels
+        with timer.stage('sess_run', 0):
+            boxes_, scores_, labels_, x_, y_, conf_ = cascade.predict(sess, img, [img_ori], [(resize_ratio, dw, dh)])[0]
+        if len(boxes_) == 0:
+            print('No bounding box detected')
+            rot, trans, transform = None, None, None
+        else:
+            with timer.stage('pnp', 0):
+                rot, trans, transform = solve_pnp_candidates(x_, y_, conf_, ref_corners, intrinsics)
     else:
-        height_ori, width_ori = img_ori.shape[:2]
-        img_resize = cv2.resize(img_ori, tuple(args.new_size))
-
-
-    img = cv2.cvtColor(img_resize, cv2.COLOR_BGR2RGB)
-    img = np.asarray(img, np.float32)
-    img = img[np.newaxis, :] / 255.
-
-    boxes_, scores_, labels_, x_, y_, conf_, selected_ = sess.run([boxes, scores, labels, x, y, conf, selected ], feed_dict={input_data: img})
-
-    if args.letterbox_resize:
-        x_ = (x_ * args.new_size[0] - dw ) / resize_ratio
-        y_ = (y_ * args.new_size[1] - dh ) / resize_ratio
-    else:
-        x_ = x_ * args.new_size[0]
-        y_ = y_ * args.new_size[1]
-
-    if len(boxes_) == 0:
-        print('No bounding box detected')
-
-    rot, trans, transform = solve_pnp(x_, y_, conf_, ref_corners, selected_, intrinsics, nV=args.nV)
+        with timer.stage('sess_run', 0):
+            boxes_, scores_, labels_, x_, y_, conf_, selected_ = sess.run([boxes, scores, labels, x, y, conf, selected ], feed_dict={input_data: img})
+
+        with timer.stage('nms_decode', 0):
+            if args.letterbox_resize:
+                x_ = (x_ * args.new_size[0] - dw ) / resize_ratio
+                y_ = (y_ * args.new_size[1] - dh ) / resize_ratio
+            else:
+                x_ = x_ * args.new_size[0]
+                y_ = y_ * args.new_size[1]
+
+        if len(boxes_) == 0:
+            print('No bounding box detected')
+
+        with timer.stage('pnp', 0):
+            rot, trans, transform = solve_pnp(x_, y_, conf_, ref_corners, selected_, intrinsics, nV=args.nV)
+    draw_start = time.perf_counter()
     if transform is not None:
-        intrinsics = np.array(get_camera_intrinsic(), dtype=np.float32)
-        bbox_3d = compute_projection(corners3D, transform, intrinsics)
+        bbox_3d = camera.project(corners3D, transform)
         corners2D_pr = np.transpose(bbox_3d)
         # print(corners2D_pr)
 
@@ -141,27 +185,32 @@ with tf.Session(config=config) as sess:
         except:
             print("Something went wrong")
 
-    # rescale the coordinates to the original image
-    if args.letterbox_resize:
-        boxes_[:, [0, 2]] = (boxes_[:, [0, 2]] - dw) / resize_ratio
-        boxes_[:, [1, 3]] = (boxes_[:, [1, 3]] - dh) / resize_ratio
-    else:
-        boxes_[:, [0, 2]] *= (width_ori / float(args.new_size[0]))
-        boxes_[:, [1, 3]] *= (height_ori / float(args.new_size[1]))
+    # rescale the coordinates to the original image, the cascade already returns them
+    if not args.cascade:
+        if args.letterbox_resize:
+            boxes_[:, [0, 2]] = (boxes_[:, [0, 2]] - dw) / resize_ratio
+            boxes_[:, [1, 3]] = (boxes_[:, [1, 3]] - dh) / resize_ratio
+        else:
+            boxes_[:, [0, 2]] *= (width_ori / float(args.new_size[0]))
+            boxes_[:, [1, 3]] *= (height_ori / float(args.new_size[1]))
 
     # print("Print Boxes", boxes_)
     for i in range(len(boxes_)):
         x0, y0, x1, y1 = boxes_[i]
         plot_one_box(img_ori, [x0, y0, x1, y1],
                      label=args.classes[labels_[i]] + ', {:.2f}%'.format(scores_[i] * 100), color=(0, 255, 0))
+    timer.add('draw', time.perf_counter() - draw_start, 0)
 
     if args.save_result:
         path = os.path.split(args.input_image)[0]
         img_name = os.path.split(args.input_image)[1]
         save_img = path + '/deepurl_result_' + img_name
         print('Saving pose regression results to: {}'.format(save_img))
-        cv2.imwrite(save_img, img_ori)
-    else:
+        with timer.stage('encode', 0):
+            cv2.imwrite(save_img, img_ori)
+    timer.frame_done(0)
+    timer.report()
+    if not args.save_result:
         cv2.imshow('Image', img_ori)
         k = cv2.waitKey(0) & 0XFF
         cv2.destroyAllWindows()
@@ -6,11 +6,19 @@ import tensorflow as tf
 import numpy as np
 import argparse
 import cv2
+import time
 
 from utils.misc_utils import *
-from utils.nms_utils import gpu_nms
+from utils.calib_utils import get_camera
+from utils.nms_utils import batch_nms
+from utils.pipeline_utils import PipelineRunner
+from utils.tracking_utils import RoiTracker
+from utils.filter_utils import PoseFilter
+from utils.motion_utils import FrameDifferenceGate
+from utils.timing_utils import create_timer
 from utils.plot_utils import get_color_table, plot_one_box, draw_demo_img_corners
 from utils.data_aug import letterbox_resize
+from utils.data_utils import select_scales
 
 from model import yolov3
 from tqdm import tqdm
@@ -38,9 +46,74 @@ parser.add_argument("--letterbox_resize", type=lambda x: (str(x).lower() == 'tru
 parser.add_argument("--nV", type=int, default=8,
                     help="Number of corner points used for PnP.")
 parser.add_argument("--rectify", type=lambda x: (str(x).lower() == 'true'), default=True,
-                    help="Rectify images")
+                    help="Correct the lens distortion of the GoPro.")
+parser.add_argument("--rectify_mode", type=str, default='keypoints', choices=['keypoints', 'image'],
+                    help="'keypoints': run the network on the raw frame and undistort the keypoints before PnP, "
+                         "'image': rectify the whole frame before the network.")
+parser.add_argument("--rectify_output", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="With --rectify_mode keypoints, whether to rectify the saved frames as well. "
+                         "Otherwise the pose is drawn on the raw frame.")
+parser.add_argument("--camera", type=str, default="gopro_hero7",
+                    help="Name of the camera calibration in --calib_dir.")
+parser.add_argument("--calib_dir", type=str, default="./data/calibration",
+                    help="The directory of the camera calibration files.")
+parser.add_argument("--track", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to run the network on a crop around the target of the previous frame the network "
+                         "ran on. The whole frame is used until the target is found and whenever it is lost. "
+                         "The frames are then processed one at a time, without the pipeline.")
+parser.add_argument("--roi_size", nargs='*', type=int, default=None,
+                    help="Network input size for the crops, size format: [width, height], multiples of 32. "
+                         "Defaults to `new_size`.")
+parser.add_argument("--roi_padding", type=float, default=0.5,
+                    help="Margin around the target in the crop, relative to the target size.")
+parser.add_argument("--scale_skip", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to only run the scales of the heads the target of the previous frame needs. "
+                         "The 52x52 scale is skipped for large (near) targets. As --track, without the pipeline.")
+parser.add_argument("--scale_margin", type=float, default=0.5,
+                    help="Relative change of the target size between two frames the scale selection allows for.")
+parser.add_argument("--filter", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to filter the PnP poses with a constant-velocity model. The filter predicts the pose "
+                         "of the frames skipped by the network and rejects the PnP outliers.")
+parser.add_argument("--network_every", type=int, default=1,
+                    help="Run the network on every N-th frame only.")
+parser.add_argument("--latency_budget", type=float, default=0,
+                    help="Time budget per frame for the network in ms (e.g. 33 for 30 fps). If set, the frames run "
+                         "through the network are chosen from the measured network time instead of --network_every.")
+parser.add_argument("--diff_gate", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to skip the network on frames that barely differ from the last frame it ran on. "
+                         "The last pose and boxes are reused for those frames.")
+parser.add_argument("--diff_thresh", type=float, default=2.0,
+                    help="Mean absolute gray level difference below which a frame is considered static.")
+parser.add_argument("--diff_width", type=int, default=160,
+                    help="Width of the grayscale thumbnails compared by the frame-difference gate.")
+parser.add_argument("--diff_roi", type=lambda x: (str(x).lower() == 'true'), default=True,
+                    help="With --track, whether to only compare the tracked crop.")
+parser.add_argument("--diff_max_skip", type=int, default=30,
+                    help="The network runs at least every `diff_max_skip` frames, 0 for no limit.")
+parser.add_argument("--batch_size", type=int, default=1,
+                    help="Maximum number of frames fed to the network in one sess.run.")
+parser.add_argument("--num_preprocess_threads", type=int, default=2,
+                    help="Number of threads rectifying and resizing the frames.")
+parser.add_argument("--num_postprocess_threads", type=int, default=2,
+                    help="Number of threads running PnP and the drawing.")
+parser.add_argument("--queue_size", type=int, default=8,
+                    help="Maximum number of frames waiting between two pipeline stages.")
+parser.add_argument("--pnp_method", type=str, default='ransac', choices=['ransac', 'prosac'],
+                    help="'ransac': OpenCV's RANSAC, 'prosac': sample the most confident keypoints first.")
+parser.add_argument("--pnp_refine", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to refine the pose with Levenberg-Marquardt on the PnP inliers.")
+parser.add_argument("--timing", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to time the stages of every frame and print their percentiles at the end.")
+parser.add_argument("--timing_file", type=str, default=None,
+                    help="With --timing, JSON lines file of the per-frame stage timings.")
+parser.add_argument("--metrics_port", type=int, default=0,
+                    help="With --timing, serve the running stage percentiles on http://127.0.0.1:port/metrics.")
 
 args = parser.parse_args()
+if args.roi_size:
+    # the heads assume the 32/16/8 strides of the 13/26/52 grids
+    assert len(args.roi_size) == 2 and args.roi_size[0] % 32 == 0 and args.roi_size[1] % 32 == 0, \
+        '--roi_size must be [width, height], multiples of 32'
 
 args.anchors = parse_anchors(args.anchor_path)
 args.classes = read_class_names(args.class_name_path)
@@ -59,7 +132,7 @@ video_fps = int(vid.get(5))
 
 
 mesh = MeshPly(args.mesh_path)
-vertices = np.c_[np.array(mesh.vertices), np.ones((len(mesh.vertices), 1))].transpose()
+vertices = mesh.points
 corners3D = get_3D_corners(vertices)
 gt_corners = np.array(np.transpose(corners3D[:3, :]),dtype='float32')
 points = np.concatenate(( corners3D, np.array([0.0, 0.0, 0.0, 1.0]).reshape(4, 1)), axis=1)
@@ -68,107 +141,323 @@ if args.save_video:
     fourcc = cv2.VideoWriter_fourcc('m', 'p', '4', 'v')
     videoWriter = cv2.VideoWriter('result_gopro_10136.mp4', fourcc, 30, (video_width, video_height))
 
-with tf.Session(config=config) as sess:
-    input_data = tf.placeholder(tf.float32, [1, args.new_size[1], args.new_size[0], 3], name='input_data')
-    pose_loss = PoseRegressionLoss(1, num_classes=1, nV=args.nV)
+def build_graph(input_size, reuse=False, scale_sets=((0, 1, 2),)):
+    '''
+    Network, NMS and keypoint candidates for inputs of size (width, height).
+    With reuse=True the variables of a previous build are shared.
+    scale_sets: the decoding is built for each of these sets of scales (see `yolov3.predict`), on the same
+        network. Only the layers of the fetched scales run.
+    return: the input placeholder and the fetches of every scale set
+    '''
+    input_data = tf.placeholder(tf.float32, [None, input_size[1], input_size[0], 3], name='input_data')
+    pose_loss = PoseRegressionLoss(args.batch_size, num_classes=1, nV=args.nV)
 
     yolo_model = yolov3(args.num_class, args.anchors, nV=args.nV)
-    with tf.variable_scope('yolov3'):
+    with tf.variable_scope('yolov3', reuse=reuse):
         pred_feature_maps = yolo_model.forward(input_data, False)
-    yolo_features = [pred_feature_maps[0], pred_feature_maps[1], pred_feature_maps[2]]
-    pose_features = [pred_feature_maps[3], pred_feature_maps[4], pred_feature_maps[5]]
 
+    fetches = {}
+    for scales in scale_sets:
+        yolo_features = [pred_feature_maps[scale] for scale in scales]
+        pose_features = [pred_feature_maps[3 + scale] for scale in scales]
+
+        pred_boxes, pred_confs, pred_probs = yolo_model.predict(yolo_features, scales=scales)
+
+        pred_scores = pred_confs * pred_probs
 
-    pred_boxes, pred_confs, pred_probs = yolo_model.predict(yolo_features)
+        boxes, scores, labels, num_boxes = batch_nms(pred_boxes, pred_scores, max_boxes=1, score_thresh=0.3,
+                                                     nms_thresh=0.4)
 
-    pred_scores = pred_confs * pred_probs
+        # box-gated top-k keypoint candidates, [N, k, nV]
+        x, y, conf = pose_loss.predict_topk(pose_features, boxes, num_boxes, [input_size[1], input_size[0]], k=12)
+        fetches[scales] = [boxes, scores, labels, num_boxes, x, y, conf]
 
-    boxes, scores, labels = gpu_nms(pred_boxes, pred_scores, args.num_class, max_boxes=1, score_thresh=0.3,
-                                    nms_thresh=0.4)
+    return input_data, fetches
 
-    x, y, conf, selected = pose_loss.predict(pose_features,  boxes, scores, num_classes=1)
+
+with tf.Session(config=config) as sess:
+    full_size = tuple(args.new_size)
+    roi_size = tuple(args.roi_size) if args.roi_size else full_size
+    # all the scales, or without the 52*52 grid (and its branch of the heads) for large targets
+    all_scales, coarse_scales = (0, 1, 2), (0, 1)
+    scale_sets = (all_scales, coarse_scales) if args.scale_skip else (all_scales,)
+    # input size -> (placeholder, {scales: fetches})
+    graphs = {full_size: build_graph(full_size, scale_sets=scale_sets)}
+    if args.track and roi_size != full_size:
+        graphs[roi_size] = build_graph(roi_size, reuse=True, scale_sets=scale_sets)
 
     saver = tf.train.Saver()
     checkpoint = tf.train.latest_checkpoint(args.checkpoint_dir)
     saver.restore(sess, checkpoint)
 
     error_count = 0
-    intrinsics = get_gopro_instrinsic()
-    dist = get_gopro_distortion()
-
-    for j in tqdm(range(video_frame_cnt)):
-        ret, img_ori = vid.read()
-        if img_ori is None:
-            continue
-
-
-        height_ori, width_ori = img_ori.shape[:2]
-
-        if args.rectify:
-            map1, map2 = cv2.initUndistortRectifyMap(intrinsics, dist, None, None, (width_ori, height_ori),
-                                                     cv2.CV_32FC1)
-            img_ori = cv2.remap(img_ori, map1, map2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
-
-        # cv2.imshow("Image", img_ori)
-        # cv2.waitKey(0)
-
-        if args.letterbox_resize:
-            img_resize, resize_ratio, dw, dh = letterbox_resize(img_ori, args.new_size[0], args.new_size[1])
+    roi_count = 0
+    # calibration of the video resolution, rectification maps are built once
+    camera = get_camera(args.camera, (video_width, video_height), calib_dir=args.calib_dir)
+    intrinsics = camera.K
+    # the network saw the raw frame: only the keypoints are undistorted
+    undistort_keypoints_only = args.rectify and args.rectify_mode == 'keypoints'
+
+    tracker = None
+    if args.track or args.scale_skip:
+        tracker = RoiTracker((video_width, video_height), roi_size, padding=args.roi_padding)
+
+    # the network runs on every `network_every`-th frame, or adaptively to fit in the latency budget
+    network_time = [0.]
+
+    def network_stride():
+        if args.latency_budget > 0 and network_time[0] > 0:
+            return max(1, int(np.ceil(network_time[0] / (args.latency_budget / 1000.))))
+        return args.network_every
+
+    timer = create_timer(args.timing, args.timing_file, args.metrics_port)
+    gate = FrameDifferenceGate(width=args.diff_width, threshold=args.diff_thresh,
+                               max_skip=args.diff_max_skip) if args.diff_gate else None
+
+    def read_frames():
+        # cv2.VideoCapture can only be read sequentially, so the decoding happens here
+        last_run = None
+        for j in range(video_frame_cnt):
+            with timer.stage('decode', j):
+                ret, img_ori = vid.read()
+            if img_ori is None:
+                continue
+            run_network = last_run is None or j - last_run >= network_stride()
+            if run_network and gate is not None:
+                # skip the network if nothing moved since the last frame it ran on
+                roi = tracker.roi() if args.track and args.diff_roi else None
+                run_network = gate.should_run(img_ori, j, roi=roi)
+            if run_network:
+                last_run = j
+            yield j, img_ori, run_network
+
+    def preprocess(frame):
+        j, img_ori, run_network = frame
+        if args.rectify and args.rectify_mode == 'image':
+            with timer.stage('rectify', j):
+                img_ori = camera.rectify(img_ori)
+        if not run_network:
+            return j, img_ori, None, None, False
+
+        # crop around the target of the previous frame the network ran on, if any
+        roi = tracker.roi() if args.track else None
+        if roi is None:
+            input_size = full_size
+            x0, y0 = 0, 0
+            img_crop = img_ori
         else:
-            height_ori, width_ori = img_ori.shape[:2]
-            img_resize = cv2.resize(img_ori, tuple(args.new_size))
-
-        # cv2.imshow("Image", img_resize)
-        # cv2.waitKey(0)
-
-        img = cv2.cvtColor(img_resize, cv2.COLOR_BGR2RGB)
-        img = np.asarray(img, np.float32)
-        img = img[np.newaxis, :] / 255.
+            input_size = roi_size
+            x0, y0, x1, y1 = roi
+            img_crop = img_ori[y0:y1, x0:x1]
+
+        # network input (xi, yi) <==> frame ((xi - dw) / ratio_x + x0, (yi - dh) / ratio_y + y0)
+        with timer.stage('letterbox', j):
+            if args.letterbox_resize or roi is not None:
+                img_resize, resize_ratio, dw, dh = letterbox_resize(img_crop, input_size[0], input_size[1])
+                ratio_x, ratio_y = resize_ratio, resize_ratio
+            else:
+                img_resize = cv2.resize(img_crop, input_size)
+                ratio_x = input_size[0] / float(img_crop.shape[1])
+                ratio_y = input_size[1] / float(img_crop.shape[0])
+                dw, dh = 0, 0
+
+        with timer.stage('feed', j):
+            img = cv2.cvtColor(img_resize, cv2.COLOR_BGR2RGB)
+            img = np.asarray(img, np.float32) / 255.
+
+        # the scales the target of the previous frame needs, at this input resolution
+        scales = all_scales
+        target_size = tracker.target_size() if args.scale_skip else None
+        if target_size is not None:
+            needed = select_scales((target_size[0] * ratio_x, target_size[1] * ratio_y), args.anchors,
+                                   margin=args.scale_margin)
+            if 2 not in needed:
+                scales = coarse_scales
+
+        return j, img_ori, img, (input_size, scales, ratio_x, ratio_y, dw, dh, x0, y0), roi is not None
+
+    def inference(batch):
+        outputs = [None] * len(batch)
+        start = time.time()
+        # full frames and crops may have different input sizes and scales,
+        # the frames skipped by the network have no input
+        for input_size, (input_data, fetches) in graphs.items():
+            for scales, scale_fetches in fetches.items():
+                idx = [k for k, pre in enumerate(batch) if pre[2] is not None and pre[3][:2] == (input_size, scales)]
+                if not idx:
+                    continue
+                run_start = time.perf_counter()
+                img_batch = np.asarray([batch[k][2] for k in idx])
+                boxes_b, scores_b, labels_b, num_boxes_b, x_b, y_b, conf_b = sess.run(
+                    scale_fetches, feed_dict={input_data: img_batch})
+                timer.add('sess_run', time.perf_counter() - run_start, [batch[k][0] for k in idx])
+                # only the first num_boxes entries of the padded NMS output are valid
+                for i, k in enumerate(idx):
+                    outputs[k] = (boxes_b[i, :num_boxes_b[i]], scores_b[i, :num_boxes_b[i]],
+                                  labels_b[i, :num_boxes_b[i]], x_b[i], y_b[i], conf_b[i])
+
+        num_run = sum(out is not None for out in outputs)
+        if num_run > 0:
+            # moving average of the network time per frame
+            elapsed = (time.time() - start) / num_run
+            network_time[0] = elapsed if network_time[0] == 0 else 0.9 * network_time[0] + 0.1 * elapsed
+        return outputs
+
+    def draw_boxes(img_ori, boxes_, scores_, labels_):
+        for i in range(len(boxes_)):
+            x0, y0, x1, y1 = boxes_[i]
+            plot_one_box(img_ori, [x0, y0, x1, y1],
+                         label=args.classes[labels_[i]] + ', {:.2f}%'.format(scores_[i] * 100), color=(0, 255, 0), line_thickness=16)
 
-        boxes_, scores_, labels_, x_, y_, conf_, selected_ = sess.run([boxes, scores, labels, x, y, conf, selected ], feed_dict={input_data: img})
+    def postprocess(pre, out):
+        '''
+        PnP of one frame, its boxes are drawn in the main loop.
+        return: dict with the frame, whether the network ran on it, found the target and used a crop,
+            and the PnP pose (rot, trans), None if it could not be solved.
+        '''
+        j, img_ori, _, mapping, cropped = pre
+        result = {'frame_id': j, 'img': img_ori, 'ran': out is not None, 'detected': False, 'cropped': cropped,
+                  'coarse': out is not None and mapping[1] == coarse_scales, 'pose': None, 'boxes': None}
 
-        if len(boxes_) == 0:
-            error_count += 1
-            continue
+        if undistort_keypoints_only and args.rectify_output:
+            with timer.stage('rectify', j):
+                img_ori = camera.rectify(img_ori)
+            result['img'] = img_ori
 
-        if args.letterbox_resize:
-            x_ = (x_ * args.new_size[0] - dw ) / resize_ratio
-            y_ = (y_ * args.new_size[1] - dh ) / resize_ratio
-        else:
-            x_ = x_ * args.new_size[0]
-            y_ = y_ * args.new_size[1]
+        if out is None:
+            return result
 
-        rot, trans, transform = solve_pnp(x_, y_, conf_, gt_corners, selected_, intrinsics, bestCnt=12, nV=8)
+        input_size, _, ratio_x, ratio_y, dw, dh, x0, y0 = mapping
+        boxes_, scores_, labels_, x_, y_, conf_ = out
 
+        if len(boxes_) == 0:
+            if tracker is not None:
+                tracker.update(j, None)
+            return result
+        result['detected'] = True
+
+        # back to the frame coordinates
+        with timer.stage('nms_decode', j):
+            x_ = (x_ * input_size[0] - dw) / ratio_x + x0
+            y_ = (y_ * input_size[1] - dh) / ratio_y + y0
+            boxes_[:, [0, 2]] = (boxes_[:, [0, 2]] - dw) / ratio_x + x0
+            boxes_[:, [1, 3]] = (boxes_[:, [1, 3]] - dh) / ratio_y + y0
+
+            if undistort_keypoints_only:
+                x_, y_ = camera.undistort_points(x_, y_)
+
+        with timer.stage('pnp', j):
+            rot, trans, transform = solve_pnp_candidates(x_, y_, conf_, gt_corners, intrinsics,
+                                                         method=args.pnp_method, refine=args.pnp_refine)
         if transform is not None:
-    #         print(trans)
-            bbox_3d = compute_projection(points, transform, intrinsics)
-            corners2D_pr = np.transpose(bbox_3d)
-
-    #         # print(corners2D_pr)
-            try:
-                img_ori = draw_demo_img_corners(img_ori, corners2D_pr, (0, 0, 255), nV=8, thickness=16)
-            except:
-                print("Something Went Wrong")
-
-                # rescale the coordinates to the original image
-            if args.letterbox_resize:
-                boxes_[:, [0, 2]] = (boxes_[:, [0, 2]] - dw) / resize_ratio
-                boxes_[:, [1, 3]] = (boxes_[:, [1, 3]] - dh) / resize_ratio
+            result['pose'] = (rot, trans)
+
+        if tracker is not None:
+            # the crop is taken in the frame seen by the network
+            if transform is not None:
+                target = np.transpose(camera.project(points, transform, distort=undistort_keypoints_only))
             else:
-                boxes_[:, [0, 2]] *= (width_ori / float(args.new_size[0]))
-                boxes_[:, [1, 3]] *= (height_ori / float(args.new_size[1]))
+                target = boxes_[0].reshape(2, 2)
+            tracker.update(j, target)
+
+        if undistort_keypoints_only and args.rectify_output:
+            boxes_[:, [0, 2]], boxes_[:, [1, 3]] = camera.undistort_points(boxes_[:, [0, 2]], boxes_[:, [1, 3]])
+        result['boxes'] = (boxes_, scores_, labels_)
+
+        return result
+
+    runner = PipelineRunner(preprocess, inference, postprocess, batch_size=args.batch_size,
+                            num_preprocess_threads=args.num_preprocess_threads,
+                            num_postprocess_threads=args.num_postprocess_threads,
+                            queue_size=args.queue_size)
+    if tracker is None:
+        results = runner.run(read_frames())
+    else:
+        # the crop, the difference gate and the scales of a frame need the target of the frame before it, which
+        # the pipeline has not post-processed yet: one frame at a time, read only once the last one is done
+        results = (postprocess(pre, inference([pre])[0]) for pre in map(preprocess, read_frames()))
+
+    pose_filter = PoseFilter() if args.filter else None
+    fps = video_fps if video_fps > 0 else 30
+    last_frame_id = None
+    last_pose = None
+    last_boxes = None
+    reused_count = 0
+    network_count = 0
+    rejected_count = 0
+    coarse_count = 0
+
+    # the frames come back in the order they were read, so the filter sees them in order
+    for result in tqdm(results, total=video_frame_cnt):
+        j = result['frame_id']
+        network_count += result['ran']
+        roi_count += result['cropped']
+        coarse_count += result['coarse']
+        if result['ran'] and not result['detected']:
+            error_count += 1
 
-        # print("Print Boxes", boxes_)
-        for i in range(len(boxes_)):
-            x0, y0, x1, y1 = boxes_[i]
-            plot_one_box(img_ori, [x0, y0, x1, y1],
-                         label=args.classes[labels_[i]] + ', {:.2f}%'.format(scores_[i] * 100), color=(0, 255, 0), line_thickness=16)
+        if pose_filter is not None:
+            if last_frame_id is not None:
+                pose_filter.predict((j - last_frame_id) / float(fps))
+            if result['pose'] is not None and not pose_filter.update(*result['pose']):
+                rejected_count += 1
+            pose = pose_filter.pose() if pose_filter.initialized else None
+        elif result['ran']:
+            pose = result['pose']
+        else:
+            # the network skipped this frame: keep the last pose
+            pose = last_pose
+        last_frame_id = j
+        if result['ran']:
+            last_pose = result['pose']
+            last_boxes = result['boxes']
+            boxes = result['boxes']
+        else:
+            # and the last boxes
+            boxes = last_boxes
+            if last_boxes is not None:
+                reused_count += 1
+
+        # as before, the frames where the network found nothing are not saved, unless the filter has a pose
+        if result['ran'] and not result['detected'] and pose is None:
+            timer.frame_done(j)
+            continue
 
+        img_ori = result['img']
+        # one draw sample per frame: the boxes, then the pose
+        with timer.stage('draw', j):
+            if boxes is not None:
+                draw_boxes(img_ori, *boxes)
+            if pose is not None:
+                transform = np.concatenate((pose[0], pose[1].reshape(3, 1)), 1)
+                bbox_3d = camera.project(points, transform,
+                                         distort=undistort_keypoints_only and not args.rectify_output)
+                corners2D_pr = np.transpose(bbox_3d)
+
+                try:
+                    img_ori = draw_demo_img_corners(img_ori, corners2D_pr, (0, 0, 255), nV=8, thickness=16)
+                except:
+                    print("Something Went Wrong")
 
         if args.save_video:
-            videoWriter.write(img_ori)
+            with timer.stage('encode', j):
+                videoWriter.write(img_ori)
+        timer.frame_done(j)
 
     vid.release()
     if args.save_video:
         videoWriter.release()
+    timer.report()
+    timer.close()
+
+    print('Frames run through the network: {}'.format(network_count))
+    print('Frames without detection: {}'.format(error_count))
+    if args.filter:
+        print('PnP poses rejected by the filter: {}'.format(rejected_count))
+    if gate is not None:
+        print('Frames skipped as static: {}'.format(gate.skipped))
+    print('Frames reusing the last network output: {}'.format(reused_count))
+    if args.track:
+        print('Frames run on a crop: {}'.format(roi_count))
+    if args.scale_skip:
+        print('Frames run without the 52x52 scale: {}'.format(coarse_count))
@@ -0,0 +1,163 @@
+# coding: utf-8
+# Same as test_video.py, but runs a graph frozen by freeze_graph.py through OpenCV's DNN module
+# and decodes it with NumPy, so TensorFlow is not needed at deployment time.
+
+from __future__ import division, print_function
+
+import numpy as np
+import argparse
+import cv2
+import time
+
+from utils.misc_utils import *
+from utils.calib_utils import get_camera
+from utils.dnn_utils import load_dnn_model, dnn_forward, predict
+from utils.plot_utils import get_color_table, plot_one_box, draw_demo_img_corners
+from utils.data_aug import letterbox_resize
+from utils.timing_utils import create_timer
+
+from tqdm import tqdm
+
+from utils.meshply import MeshPly
+
+parser = argparse.ArgumentParser(description="DeepURL: OpenCV DNN video test procedure.")
+parser.add_argument("--input_video", type=str,
+                    help="The path of the input video.", default='/media/bjoshi/data1/Gopro-hero7/GH010136.MP4')
+parser.add_argument("--frozen_model", type=str, default="./data/deepurl_frozen.pb",
+                    help="The path of the graph frozen by freeze_graph.py.")
+parser.add_argument("--anchor_path", type=str, default="./data/yolo_anchors.txt",
+                    help="The path of the anchor txt file.")
+parser.add_argument("--new_size", nargs='*', type=int, default=[416, 416],
+                    help="Resize the input image with `new_size`, size format: [width, height]. Must match the frozen graph.")
+parser.add_argument("--class_name_path", type=str, default="./data/aqua.names",
+                    help="The path of the class names.")
+parser.add_argument("--save_video", type=lambda x: (str(x).lower() == 'true'), default=True,
+                    help="Whether to save the video detection results.")
+parser.add_argument("--mesh_path", type=str, default='/home/bjoshi/singleshotv3-tf/aqua_glass_removed.ply',
+                    help="Aqua Mesh Model")
+parser.add_argument("--letterbox_resize", type=lambda x: (str(x).lower() == 'true'), default=True,
+                    help="Whether to use the letterbox resize.")
+parser.add_argument("--nV", type=int, default=8,
+                    help="Number of corner points used for PnP.")
+parser.add_argument("--rectify", type=lambda x: (str(x).lower() == 'true'), default=True,
+                    help="Rectify images")
+parser.add_argument("--camera", type=str, default="gopro_hero7",
+                    help="Name of the camera calibration in --calib_dir.")
+parser.add_argument("--calib_dir", type=str, default="./data/calibration",
+                    help="The directory of the camera calibration files.")
+parser.add_argument("--num_threads", type=int, default=0,
+                    help="Number of threads used by OpenCV for inference, resizing and PnP. 0 keeps the OpenCV default.")
+parser.add_argument("--timing", type=lambda x: (str(x).lower() == 'true'), default=False,
+                    help="Whether to time the stages of every frame and print their percentiles at the end.")
+parser.add_argument("--timing_file", type=str, default=None,
+                    help="With --timing, JSON lines file of the per-frame stage timings.")
+parser.add_argument("--metrics_port", type=int, default=0,
+                    help="With --timing, serve the running stage percentiles on http://127.0.0.1:port/metrics.")
+
+args = parser.parse_args()
+
+args.anchors = parse_anchors(args.anchor_path)
+args.classes = read_class_names(args.class_name_path)
+args.num_class = len(args.classes)
+
+color_table = get_color_table(args.num_class)
+
+net = load_dnn_model(args.frozen_model, num_threads=args.num_threads)
+
+vid = cv2.VideoCapture(args.input_video)
+video_frame_cnt = int(vid.get(7))
+video_width = int(vid.get(3))
+video_height = int(vid.get(4))
+video_fps = int(vid.get(5))
+
+mesh = MeshPly(args.mesh_path)
+vertices = mesh.points
+corners3D = get_3D_corners(vertices)
+gt_corners = np.array(np.transpose(corners3D[:3, :]), dtype='float32')
+points = np.concatenate((corners3D, np.array([0.0, 0.0, 0.0, 1.0]).reshape(4, 1)), axis=1)
+
+if args.save_video:
+    fourcc = cv2.VideoWriter_fourcc('m', 'p', '4', 'v')
+    videoWriter = cv2.VideoWriter('result_gopro_10136.mp4', fourcc, 30, (video_width, video_height))
+
+error_count = 0
+camera = get_camera(args.camera, (video_width, video_height), calib_dir=args.calib_dir)
+intrinsics = camera.K
+timer = create_timer(args.timing, args.timing_file, args.metrics_port)
+
+for j in tqdm(range(video_frame_cnt)):
+    with timer.stage('decode', j):
+        ret, img_ori = vid.read()
+    if img_ori is None:
+        continue
+
+    height_ori, width_ori = img_ori.shape[:2]
+
+    if args.rectify:
+        with timer.stage('rectify', j):
+            img_ori = camera.rectify(img_ori)
+
+    with timer.stage('letterbox', j):
+        if args.letterbox_resize:
+            img_resize, resize_ratio, dw, dh = letterbox_resize(img_ori, args.new_size[0], args.new_size[1])
+        else:
+            img_resize = cv2.resize(img_ori, tuple(args.new_size))
+
+    # the network stage, `sess_run` like in the TensorFlow scripts
+    with timer.stage('sess_run', j):
+        feature_maps = dnn_forward(net, img_resize)
+    with timer.stage('nms_decode', j):
+        boxes_, scores_, labels_, x_, y_, conf_, selected_ = predict(feature_maps, args.anchors,
+                                                                     [args.new_size[1], args.new_size[0]],
+                                                                     class_num=args.num_class, nV=args.nV,
+                                                                     score_thresh=0.3, nms_thresh=0.4)
+
+    if len(boxes_) == 0:
+        error_count += 1
+        timer.frame_done(j)
+        continue
+
+    if args.letterbox_resize:
+        x_ = (x_ * args.new_size[0] - dw) / resize_ratio
+        y_ = (y_ * args.new_size[1] - dh) / resize_ratio
+    else:
+        x_ = x_ * args.new_size[0]
+        y_ = y_ * args.new_size[1]
+
+    with timer.stage('pnp', j):
+        rot, trans, transform = solve_pnp(x_, y_, conf_, gt_corners, selected_, intrinsics, bestCnt=12, nV=args.nV)
+
+    draw_start = time.perf_counter()
+    if transform is not None:
+        bbox_3d = camera.project(points, transform)
+        corners2D_pr = np.transpose(bbox_3d)
+
+        try:
+            img_ori = draw_demo_img_corners(img_ori, corners2D_pr, (0, 0, 255), nV=8, thickness=16)
+        except:
+            print("Something Went Wrong")
+
+        # rescale the coordinates to the original image
+        if args.letterbox_resize:
+            boxes_[:, [0, 2]] = (boxes_[:, [0, 2]] - dw) / resize_ratio
+            boxes_[:, [1, 3]] = (boxes_[:, [1, 3]] - dh) / resize_ratio
+        else:
+            boxes_[:, [0, 2]] *= (width_ori / float(args.new_size[0]))
+            boxes_[:, [1, 3]] *= (height_ori / float(args.new_size[1]))
+
+    for i in range(len(boxes_)):
+        x0, y0, x1, y1 = boxes_[i]
+        plot_one_box(img_ori, [x0, y0, x1, y1],
+                     label=args.classes[labels_[i]] + ', {:.2f}%'.format(scores_[i] * 100), color=(0, 255, 0), line_thickness=16)
+    timer.add('draw', time.perf_counter() - draw_start, j)
+
+    if args.save_video:
+        with timer.stage('encode', j):
+            videoWriter.write(img_ori)
+    timer.frame_done(j)
+
+vid.release()
+if args.save_video:
+    videoWriter.release()
+timer.report()
+timer.close()
@@ -0,0 +1,194 @@
+# coding: utf-8
+# Camera calibrations, loaded from the OpenCV YAML files in data/calibration.
+# A `Camera` is a calibration at one image resolution. It holds everything derived from it
+# (inverse, rectification maps, ...), so scripts ask the registry once and then reuse it for every frame.
+
+from __future__ import division, print_function
+
+import os
+import glob
+import threading
+import numpy as np
+import cv2
+
+DEFAULT_CALIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'calibration')
+
+
+class Camera(object):
+    '''
+    Pinhole camera with (optional) distortion, for images of size (width, height).
+    K: [3, 3] float64, dist: [5] float64
+    '''
+
+    def __init__(self, name, K, dist, image_size):
+        self.name = name
+        self.K = np.asarray(K, np.float64).reshape(3, 3)
+        self.dist = np.asarray(dist, np.float64).reshape(-1)
+        self.image_size = (int(image_size[0]), int(image_size[1]))
+        self.K_inv = np.linalg.inv(self.K)
+        self.has_distortion = bool(np.any(self.dist != 0))
+        self._rectify_maps = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'Camera({}, {}x{})'.format(self.name, self.image_size[0], self.image_size[1])
+
+    def resized(self, image_size):
+        '''
+        The same camera for images resized to (width, height).
+        '''
+        sx = image_size[0] / float(self.image_size[0])
+        sy = image_size[1] / float(self.image_size[1])
+        # pixel centers: x' + 0.5 = (x + 0.5) * s
+        K = self.K.copy()
+        K[0] *= sx
+        K[1] *= sy
+        K[0, 2] += 0.5 * (sx - 1.)
+        K[1, 2] += 0.5 * (sy - 1.)
+        return Camera(self.name, K, self.dist, image_size)
+
+    def letterboxed(self, input_size, resize_ratio, dw, dh):
+        '''
+        The same camera for the network input of `letterbox_resize` (input_size (width, height)), with the
+        mapping of the scripts: input = image * resize_ratio + (dw, dh). The distortion is unchanged, it
+        applies to the normalized coordinates.
+        '''
+        K = self.K.copy()
+        K[:2] *= resize_ratio
+        K[0, 2] += dw
+        K[1, 2] += dh
+        return Camera(self.name, K, self.dist, input_size)
+
+    def image_pixels(self, camera, x, y):
+        '''
+        Pixel coordinates (x, y) in the image of `camera`, a `resized` or `letterboxed` version of this
+        camera, back to this camera's image.
+        '''
+        A = self.K.dot(camera.K_inv)
+        return A[0, 0] * x + A[0, 2], A[1, 1] * y + A[1, 2]
+
+    def projection_matrix(self, transformation):
+        '''
+        K.[R|t], [3, 4]
+        '''
+        return self.K.dot(transformation)
+
+    def project(self, points_3D, transformation, distort=False):
+        '''
+        Same as `compute_projection`; with distort=True the points are projected on the raw (distorted) image.
+        points_3D: [4, N] homogeneous, transformation: [3, 4]
+        return: [2, N] float32
+        '''
+        if distort and self.has_distortion:
+            rvec = cv2.Rodrigues(np.asarray(transformation[:, :3], np.float64))[0]
+            tvec = np.asarray(transformation[:, 3], np.float64)
+            proj, _ = cv2.projectPoints(np.asarray(points_3D[:3, :].T, np.float64), rvec, tvec, self.K, self.dist)
+            return np.transpose(proj.reshape(-1, 2)).astype('float32')
+        camera_projection = self.projection_matrix(transformation).dot(points_3D)
+        return (camera_projection[:2] / camera_projection[2:3]).astype('float32')
+
+    def undistort_points(self, x, y):
+        '''
+        Undistort pixel coordinates found on the raw image, so they can be fed to PnP with K and
+        no distortion, i.e. as if they had been found on the rectified image.
+        x, y: arrays of any shape
+        '''
+        if not self.has_distortion:
+            return x, y
+        pts = np.stack((x.reshape(-1), y.reshape(-1)), axis=1).astype(np.float64).reshape(-1, 1, 2)
+        pts = cv2.undistortPoints(pts, self.K, self.dist, P=self.K).reshape(-1, 2)
+        return pts[:, 0].reshape(x.shape), pts[:, 1].reshape(y.shape)
+
+    def rectify_maps(self):
+        '''
+        Maps for `cv2.remap`, built on the first call. The rectified image keeps K as camera matrix.
+        '''
+        with self._lock:
+            if self._rectify_maps is None:
+                self._rectify_maps = cv2.initUndistortRectifyMap(self.K, self.dist, None, self.K, self.image_size,
+                                                                 cv2.CV_16SC2)
+        return self._rectify_maps
+
+    def rectify(self, img):
+        if not self.has_distortion:
+            return img
+        assert (img.shape[1], img.shape[0]) == self.image_size, \
+            'Image of size {}x{} for {}'.format(img.shape[1], img.shape[0], self)
+        map1, map2 = self.rectify_maps()
+        return cv2.remap(img, map1, map2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+
+def load_camera(calib_file):
+    '''
+    Read an OpenCV calibration file (camera_name, image_width, image_height, camera_matrix,
+    distortion_coefficients).
+    '''
+    fs = cv2.FileStorage(calib_file, cv2.FILE_STORAGE_READ)
+    if not fs.isOpened():
+        raise IOError('Cannot read the calibration file {}'.format(calib_file))
+    name = fs.getNode('camera_name').string() or os.path.splitext(os.path.basename(calib_file))[0]
+    image_size = (int(fs.getNode('image_width').real()), int(fs.getNode('image_height').real()))
+    K = fs.getNode('camera_matrix').mat()
+    dist = fs.getNode('distortion_coefficients').mat()
+    fs.release()
+    if dist is None:
+        dist = np.zeros(5)
+    return Camera(name, K, dist, image_size)
+
+
+class CalibrationRegistry(object):
+    '''
+    All the calibrations of a directory, keyed by camera name and resolution.
+    `get` returns the same `Camera` object for the same key, so the derived state is shared by
+    everything that uses that camera.
+    '''
+
+    def __init__(self, calib_dir=DEFAULT_CALIB_DIR):
+        self.calib_dir = calib_dir
+        # name -> {(width, height): Camera}
+        self.cameras = {}
+        self._lock = threading.Lock()
+        for calib_file in sorted(glob.glob(os.path.join(calib_dir, '*.yaml')) +
+                                 glob.glob(os.path.join(calib_dir, '*.yml')) +
+                                 glob.glob(os.path.join(calib_dir, '*.xml'))):
+            self.add(load_camera(calib_file))
+
+    def add(self, camera):
+        self.cameras.setdefault(camera.name, {})[camera.image_size] = camera
+
+    def names(self):
+        return sorted(self.cameras.keys())
+
+    def get(self, name, image_size=None):
+        '''
+        The calibration of camera `name` for images of size (width, height). If that resolution was not
+        calibrated, the calibration with the closest aspect ratio is rescaled (and kept for the next calls).
+        image_size None: the (first) calibrated resolution.
+        '''
+        if name not in self.cameras:
+            raise KeyError('Unknown camera {}, known cameras: {}'.format(name, ', '.join(self.names())))
+        calibrations = self.cameras[name]
+        if image_size is None:
+            return calibrations[sorted(calibrations.keys())[0]]
+
+        image_size = (int(image_size[0]), int(image_size[1]))
+        with self._lock:
+            if image_size not in calibrations:
+                aspect = image_size[0] / float(image_size[1])
+                closest = min(calibrations.values(),
+                              key=lambda camera: abs(camera.image_size[0] / float(camera.image_size[1]) - aspect))
+                calibrations[image_size] = closest.resized(image_size)
+            return calibrations[image_size]
+
+
+_registries = {}
+
+
+def get_camera(name, image_size=None, calib_dir=DEFAULT_CALIB_DIR):
+    '''
+    Shortcut for `CalibrationRegistry(calib_dir).get(name, image_size)`, the registry of every
+    directory is only loaded once.
+    '''
+    if calib_dir not in _registries:
+        _registries[calib_dir] = CalibrationRegistry(calib_dir)
+    return _registries[calib_dir].get(name, image_size)
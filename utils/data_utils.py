@@ -122,6 +122,27 @@ def process_box(boxes, labels, img_size, class_num, anchors):
 
     return y_true_13, y_true_26, y_true_52
 
+
+def select_scales(box_size, anchors, margin=0.5):
+    '''
+    Scales of the heads able to host a target, with the anchor matching of `process_box`:
+    0: 13*13 grid for a 416*416 input (large targets), 1: 26*26, 2: 52*52 (small targets).
+    params:
+        box_size: (width, height) of the target in network input pixels, e.g. from the last frame.
+        anchors: [9, 2] shape.
+        margin: relative change of the target size allowed until it is seen again.
+    return: tuple of the scales, in increasing order
+    '''
+    anchors = np.asarray(anchors, np.float32)
+    scales = set()
+    for factor in (1. / (1. + margin), 1., 1. + margin):
+        box_w, box_h = box_size[0] * factor, box_size[1] * factor
+        inter = np.minimum(box_w, anchors[:, 0]) * np.minimum(box_h, anchors[:, 1])
+        iou = inter / (box_w * box_h + anchors[:, 0] * anchors[:, 1] - inter + 1e-10)
+        # idx: 0,1,2 ==> 2; 3,4,5 ==> 1; 6,7,8 ==> 0
+        scales.add(2 - int(np.argmax(iou)) // 3)
+    return tuple(sorted(scales))
+
 def get_bbox_mask(boxes, img_size , img=None):
 
     x1 = boxes[0, 0]
@@ -0,0 +1,226 @@
+# coding: utf-8
+# NumPy counterparts of the inference-time decoding done in the TensorFlow graph
+# (`yolov3.predict`, `gpu_nms` and `PoseRegressionLoss.predict`), so that a model frozen
+# with freeze_graph.py can be run through `cv2.dnn` without importing TensorFlow at all.
+
+from __future__ import division, print_function
+
+import numpy as np
+import cv2
+
+from utils.nms_utils import cpu_nms
+
+# cv2.dnn folds the `tf.identity` and `BiasAdd` nodes into the convolution, so the six
+# output feature maps are addressed by the names of their Conv2D nodes.
+# Order: [feature_map_1, feature_map_2, feature_map_3, feature_map_21, feature_map_22, feature_map_23]
+DNN_OUTPUT_LAYERS = ['yolov3/yolov3_head/Conv_6/Conv2D',
+                     'yolov3/yolov3_head/Conv_14/Conv2D',
+                     'yolov3/yolov3_head/Conv_22/Conv2D',
+                     'yolov3/yolov3_head_singleshot/Conv_6/Conv2D',
+                     'yolov3/yolov3_head_singleshot/Conv_14/Conv2D',
+                     'yolov3/yolov3_head_singleshot/Conv_22/Conv2D']
+
+
+def sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+def load_dnn_model(model_path, num_threads=0):
+    '''
+    Load a graph frozen by freeze_graph.py with OpenCV's DNN module.
+    num_threads: number of threads used by OpenCV (cv2.dnn, resize, PnP). 0 keeps the OpenCV default.
+    '''
+    if num_threads > 0:
+        cv2.setNumThreads(num_threads)
+    net = cv2.dnn.readNetFromTensorflow(model_path)
+    net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+    net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+    return net
+
+
+def dnn_forward(net, img_resize):
+    '''
+    Run the network on a resized/letterboxed BGR uint8 image.
+    return:
+        the six feature maps of `yolov3.forward` in NHWC layout.
+    '''
+    # same normalization as the TF scripts: BGR -> RGB, scaled to 0~1
+    blob = cv2.dnn.blobFromImage(img_resize, scalefactor=1. / 255., swapRB=True, crop=False)
+    net.setInput(blob)
+    feature_maps = net.forward(DNN_OUTPUT_LAYERS)
+    # cv2.dnn returns NCHW blobs
+    return [np.transpose(feature_map, [0, 2, 3, 1]) for feature_map in feature_maps]
+
+
+def reorg_layer(feature_map, anchors, img_size, class_num):
+    '''
+    NumPy version of `yolov3.reorg_layer`.
+    feature_map: [N, grid_h, grid_w, 3 * (5 + class_num)]
+    anchors: shape [3, 2], [w, h] format
+    img_size: the network input size, [h, w] format
+    '''
+    grid_size = feature_map.shape[1:3]
+    # the downscale ratio in height and weight
+    ratio = np.asarray(img_size, np.float32) / np.asarray(grid_size, np.float32)
+
+    feature_map = np.reshape(feature_map, [-1, grid_size[0], grid_size[1], 3, 5 + class_num])
+    box_centers, box_sizes, conf_logits, prob_logits = np.split(feature_map, [2, 4, 5], axis=-1)
+
+    # shape: [13, 13, 1, 2]
+    grid_x, grid_y = np.meshgrid(np.arange(grid_size[1]), np.arange(grid_size[0]))
+    x_y_offset = np.stack([grid_x, grid_y], axis=-1).reshape([grid_size[0], grid_size[1], 1, 2]).astype(np.float32)
+
+    # rescale to the original image scale
+    box_centers = (sigmoid(box_centers) + x_y_offset) * ratio[::-1]
+    # the anchors are rescaled to the feature map and back again in the graph, i.e. they stay in pixels
+    box_sizes = np.exp(box_sizes) * anchors
+
+    # shape: [N, 13, 13, 3, 4], last dimension: (center_x, center_y, w, h)
+    boxes = np.concatenate([box_centers, box_sizes], axis=-1)
+
+    return x_y_offset, boxes, conf_logits, prob_logits
+
+
+def yolo_predict(feature_maps, anchors, img_size, class_num=1):
+    '''
+    NumPy version of `yolov3.predict`.
+    feature_maps: [feature_map_1, feature_map_2, feature_map_3] in NHWC layout
+    return:
+        boxes: [N, (13*13+26*26+52*52)*3, 4], (x_min, y_min, x_max, y_max)
+        confs: [N, (13*13+26*26+52*52)*3, 1]
+        probs: [N, (13*13+26*26+52*52)*3, class_num]
+    '''
+    feature_map_anchors = [(feature_maps[0], anchors[6:9]),
+                           (feature_maps[1], anchors[3:6]),
+                           (feature_maps[2], anchors[0:3])]
+
+    boxes_list, confs_list, probs_list = [], [], []
+    for feature_map, anchor in feature_map_anchors:
+        _, boxes, conf_logits, prob_logits = reorg_layer(feature_map, anchor, img_size, class_num)
+        batch = boxes.shape[0]
+        boxes_list.append(boxes.reshape([batch, -1, 4]))
+        confs_list.append(sigmoid(conf_logits).reshape([batch, -1, 1]))
+        probs_list.append(sigmoid(prob_logits).reshape([batch, -1, class_num]))
+
+    boxes = np.concatenate(boxes_list, axis=1)
+    confs = np.concatenate(confs_list, axis=1)
+    probs = np.concatenate(probs_list, axis=1)
+
+    center_x, center_y, width, height = np.split(boxes, 4, axis=-1)
+    boxes = np.concatenate([center_x - width / 2, center_y - height / 2,
+                            center_x + width / 2, center_y + height / 2], axis=-1)
+
+    return boxes, confs, probs
+
+
+def pose_predict(feature_maps, nV=9):
+    '''
+    NumPy version of `PoseRegressionLoss.predict` for a single image.
+    feature_maps: [feature_map_21, feature_map_22, feature_map_23] in NHWC layout
+    return:
+        pred_x, pred_y: [13*13+26*26+52*52, nV], keypoints normalized to the network input size
+        pred_conf: [13*13+26*26+52*52, nV], the raw confidence logits, exactly as the graph returns them
+        selected: [13*13+26*26+52*52] bool, cells close to the most confident cell
+    '''
+    x_list, y_list, confs_list = [], [], []
+    for feature_map in feature_maps:
+        h, w = feature_map.shape[1:3]
+        output = feature_map[0]
+
+        grid_x, grid_y = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+        predx = (output[..., 0:nV] + grid_x[..., np.newaxis]) / w
+        predy = (output[..., nV:2 * nV] + grid_y[..., np.newaxis]) / h
+        conf = output[..., 2 * nV:3 * nV]
+
+        x_list.append(predx.reshape([h * w, nV]))
+        y_list.append(predy.reshape([h * w, nV]))
+        confs_list.append(conf.reshape([h * w, nV]))
+
+    pred_x = np.concatenate(x_list, axis=0)
+    pred_y = np.concatenate(y_list, axis=0)
+    pred_conf = np.concatenate(confs_list, axis=0)
+
+    selected = pose_select(pred_x, pred_y, pred_conf)
+
+    return pred_x, pred_y, pred_conf, selected
+
+
+def pose_select(pred_x, pred_y, pred_conf, gate=None, radius=0.3):
+    '''
+    NumPy version of `PoseRegressionLoss.select` for a single image.
+    pred_x, pred_y, pred_conf: [M, nV]
+    gate: [M] bool, only these cells are considered if given
+    return: selected, [M] bool
+    '''
+    center_xy = np.stack([pred_x.mean(axis=1), pred_y.mean(axis=1)], axis=1)
+    mean_conf = pred_conf.mean(axis=1)
+    if gate is not None:
+        mean_conf = np.where(gate, mean_conf, -np.inf)
+    max_conf_idx = np.argmax(mean_conf)
+    selected = np.linalg.norm(center_xy - center_xy[max_conf_idx], axis=1) < radius
+    if gate is not None:
+        selected &= gate
+    return selected
+
+
+def pose_box_gate(boxes, img_size, grid_sizes):
+    '''
+    NumPy version of `PoseRegressionLoss.box_gate` for a single image.
+    boxes: [B, 4], (x_min, y_min, x_max, y_max) in network input pixels
+    img_size: the network input size, [h, w] format
+    grid_sizes: [(h, w), ...] of the three scales, coarsest first
+    return: [13*13+26*26+52*52] bool, the cells inside one of the boxes
+    '''
+    gate_list = []
+    for h, w in grid_sizes:
+        stride_y = img_size[0] / float(h)
+        stride_x = img_size[1] / float(w)
+        # [B, 1]
+        x1 = np.floor(boxes[:, 0:1] / stride_x)
+        y1 = np.floor(boxes[:, 1:2] / stride_y)
+        x2 = np.floor(boxes[:, 2:3] / stride_x)
+        y2 = np.floor(boxes[:, 3:4] / stride_y)
+        cols = np.arange(w, dtype=np.float32)
+        rows = np.arange(h, dtype=np.float32)
+        # [B, h, w] ==> [h*w], union over the boxes
+        inside = ((rows >= y1) & (rows <= y2))[:, :, np.newaxis] & ((cols >= x1) & (cols <= x2))[:, np.newaxis, :]
+        gate_list.append(inside.any(axis=0).reshape(h * w))
+    return np.concatenate(gate_list)
+
+
+def pose_predict_topk(pred_x, pred_y, pred_conf, boxes, img_size, grid_sizes, k=12, radius=0.3):
+    '''
+    NumPy version of `PoseRegressionLoss.predict_topk` for a single image, from the [M, nV] keypoints
+    of every cell (`pose_predict`).
+    boxes: [B, 4] detected boxes in network input pixels
+    return: pred_x, pred_y, pred_conf: [k, nV], the unselected cells with a very low confidence
+    '''
+    gate = pose_box_gate(boxes, img_size, grid_sizes)
+    selected = pose_select(pred_x, pred_y, pred_conf, gate=gate, radius=radius)
+    pred_conf = np.where(selected[:, np.newaxis], pred_conf, -1e10)
+    order = np.argsort(-pred_conf, axis=0, kind='stable')[:k]
+    return (np.take_along_axis(pred_x, order, axis=0), np.take_along_axis(pred_y, order, axis=0),
+            np.take_along_axis(pred_conf, order, axis=0))
+
+
+def predict(feature_maps, anchors, img_size, class_num=1, nV=9, score_thresh=0.3, nms_thresh=0.4):
+    '''
+    Decode the six feature maps of `dnn_forward` into the top-1 box and the keypoint candidates.
+    Mirrors the `yolov3.predict` -> `gpu_nms(max_boxes=1)` -> `PoseRegressionLoss.predict` chain
+    of the TF test scripts.
+    img_size: the network input size, [h, w] format
+    return:
+        boxes, scores, labels: same as `gpu_nms`, empty arrays if nothing is detected
+        x, y, conf, selected: same as `PoseRegressionLoss.predict`
+    '''
+    pred_boxes, pred_confs, pred_probs = yolo_predict(feature_maps[:3], anchors, img_size, class_num)
+    boxes, scores, labels = cpu_nms(pred_boxes, pred_confs * pred_probs, class_num, max_boxes=1,
+                                    score_thresh=score_thresh, iou_thresh=nms_thresh)
+    if boxes is None:
+        boxes = np.zeros([0, 4], np.float32)
+        scores = np.zeros([0], np.float32)
+        labels = np.zeros([0], np.int32)
+
+    x, y, conf, selected = pose_predict(feature_maps[3:], nV=nV)
+
+    return boxes, scores, labels, x, y, conf, selected
@@ -0,0 +1,82 @@
+# coding: utf-8
+# The network inputs of an evaluation image list, decoded and letterboxed once into a memory-mapped uint8
+# array (a `PredictionStore` with the columns 'images' and 'letterbox'), so they can be fed to the network again
+# (e.g. for every checkpoint of a training) without decoding the images.
+
+from __future__ import division, print_function
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+
+from utils.data_utils import letterbox_resize
+from utils.prediction_store import PredictionStore
+
+
+def load_eval_image(path, image_size, input_size, letterbox=True):
+    '''
+    The image resized to image_size (width, height), then to the network input_size (width, height).
+    return: the RGB uint8 network input and its (resize ratio, dw, dh), all 0 without the letterbox resize
+    '''
+    img_ori = cv2.resize(cv2.imread(path), tuple(image_size))
+    if letterbox:
+        img_resize, resize_ratio, dw, dh = letterbox_resize(img_ori, input_size[0], input_size[1])
+    else:
+        img_resize = cv2.resize(img_ori, tuple(input_size))
+        resize_ratio, dw, dh = 0., 0., 0.
+    return cv2.cvtColor(img_resize, cv2.COLOR_BGR2RGB), (resize_ratio, dw, dh)
+
+
+def eval_cache_dir(image_list, input_size, letterbox=True):
+    '''
+    Default directory of the cache of an image list, next to it, one per network input size.
+    '''
+    return '{}_inputs_{}x{}{}'.format(os.path.splitext(image_list)[0], input_size[0], input_size[1],
+                                      '' if letterbox else '_resize')
+
+
+def open_eval_cache(directory, lines, image_size, input_size, letterbox=True, num_threads=4):
+    '''
+    The cache of the network inputs of `lines` (index path ...), created if it does not exist, was written
+    for other images or sizes, or was not completely written.
+    return: read-only `PredictionStore`: store['images'][i] [height, width, 3] RGB uint8 network input of line i,
+        store['letterbox'][i] its (resize ratio, dw, dh), all 0 without the letterbox resize
+    '''
+    meta = {'image_size': list(image_size), 'input_size': list(input_size), 'letterbox': bool(letterbox)}
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        store = PredictionStore(directory)
+        if sorted(store.columns) != ['images', 'letterbox']:
+            raise ValueError('{} is not a cache of network inputs'.format(directory))
+        if store.meta.get('complete') and store.lines == [line.strip() for line in lines] and \
+                all(store.meta.get(key) == value for key, value in meta.items()):
+            return store
+        # rewritten in place
+        del store
+
+    store = PredictionStore.create(directory, lines, {'images': ((input_size[1], input_size[0], 3), np.uint8),
+                                                      'letterbox': ((3,), np.float32)},
+                                   dict(meta, complete=False))
+
+    def load(i):
+        img, letterbox_params = load_eval_image(lines[i].strip().split(' ')[1], image_size, input_size, letterbox)
+        store.write(i, images=img, letterbox=letterbox_params)
+
+    with ThreadPoolExecutor(max_workers=num_threads) as pool:
+        list(pool.map(load, range(len(lines))))
+    store.close()
+    # only valid once every image is written
+    store.update_meta(complete=True)
+    return PredictionStore(directory)
+
+
+def to_image_pixels(x, y, letterbox_params, input_size, image_size):
+    '''
+    Keypoints relative to the network input (in [0, 1]) to image pixels.
+    letterbox_params: (resize ratio, dw, dh), a 0 ratio for a plain resize
+    '''
+    resize_ratio, dw, dh = letterbox_params
+    if resize_ratio > 0:
+        return (x * input_size[0] - dw) / resize_ratio, (y * input_size[1] - dh) / resize_ratio
+    return x * image_size[0], y * image_size[1]
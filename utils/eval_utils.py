@@ -2,13 +2,23 @@
 
 from __future__ import division, print_function
 
+import os
+import hashlib
+
 import numpy as np
 import cv2
 from collections import Counter
 
+try:
+    from scipy.spatial import ConvexHull
+except ImportError:
+    ConvexHull = None
+
 from utils.nms_utils import cpu_nms, gpu_nms
 from utils.data_utils import parse_line
+from utils.pnp_utils import pnp_from_candidates
 import math
+import time
 
 def calc_iou(pred_boxes, true_boxes):
     '''
@@ -485,7 +495,7 @@ def euler_from_rotation_matrix(rotation_matrix):
         angles = np.stack((theta_x, theta_y, theta_z), axis=-1)
         return angles
 
-    r20 = rotation_matrix[ 2, 0]
+    r20 = rotation_matrix[..., 2, 0]
     eps_addition = 2.0 * 1e-10
     general_solution = general_case(rotation_matrix, r20, eps_addition)
     gimbal_solution = gimbal_lock(rotation_matrix, r20, eps_addition)
@@ -505,12 +515,218 @@ def calcAngularDistance(gt_rot, pr_rot):
 def compute_transformation(points_3D, transformation):
 	return transformation.dot(points_3D)
 
-def calc_pts_diameter(pts):
-    diameter = -1
-    for pt_id in range(pts.shape[0]):
-        pt_dup = np.tile(np.array([pts[pt_id, :]]), [pts.shape[0] - pt_id, 1])
-        pts_diff = pt_dup - pts[pt_id:, :]
-        max_dist = math.sqrt((pts_diff * pts_diff).sum(axis=1).max())
-        if max_dist > diameter:
-            diameter = max_dist
+def calc_pts_diameter(pts, cell_points=256, block_size=1024):
+    '''
+    Largest distance between two of the [N, 3] points.
+    The two farthest points are vertices of the convex hull (with scipy). The points are binned in a grid of
+    about cell_points points per cell and only the pairs of cells whose bounding boxes can be farther apart than
+    the best distance found so far are compared, block_size points at a time. Without scipy, the pruning barely
+    helps on round point sets (most pairs of cells of a sphere are near the diameter): 200k points on a sphere
+    take tens of seconds, hence the cache of `mesh_diameter`.
+    '''
+    pts = np.asarray(pts, np.float64)
+    if len(pts) == 0:
+        return -1
+    if ConvexHull is not None and len(pts) > 4:
+        try:
+            pts = pts[ConvexHull(pts).vertices]
+        except Exception:
+            # flat or degenerate point sets, keep all the points
+            pass
+    extent = (pts.max(axis=0) - pts.min(axis=0)).max()
+    if extent == 0:
+        return 0.
+
+    grid = int(np.clip(round((len(pts) / cell_points) ** (1. / 3)), 1, 12))
+    cells = np.minimum(((pts - pts.min(axis=0)) / extent * grid).astype(np.int64), grid - 1)
+    cell_ids = (cells[:, 0] * grid + cells[:, 1]) * grid + cells[:, 2]
+    order = np.argsort(cell_ids, kind='stable')
+    pts = pts[order]
+    starts = np.flatnonzero(np.r_[True, np.diff(cell_ids[order]) != 0])
+    ends = np.r_[starts[1:], len(pts)]
+    box_min = np.minimum.reduceat(pts, starts, axis=0)
+    box_max = np.maximum.reduceat(pts, starts, axis=0)
+    centers = (box_min + box_max) / 2
+    radii = np.linalg.norm(box_max - box_min, axis=1) / 2
+    # upper bound of the distance between the points of two cells
+    upper = np.linalg.norm(centers[:, np.newaxis] - centers[np.newaxis], axis=2) + radii[:, np.newaxis] + radii
+
+    # the distance from the point farthest from the center to any point is a lower bound of the diameter
+    far = np.argmax(np.sum(np.square(pts - pts.mean(axis=0)), axis=1))
+    diameter_sq = np.sum(np.square(pts - pts[far]), axis=1).max()
+
+    first, second = np.nonzero(np.triu(upper >= math.sqrt(diameter_sq)))
+    for k in np.argsort(-upper[first, second], kind='stable'):
+        i, j = first[k], second[k]
+        if upper[i, j] ** 2 <= diameter_sq:
+            break
+        other = pts[starts[j]:ends[j]]
+        for start in range(starts[i], ends[i], block_size):
+            block = pts[start:min(start + block_size, ends[i])]
+            dist_sq = np.sum(np.square(block), axis=1)[:, np.newaxis] + np.sum(np.square(other), axis=1) - \
+                2 * block.dot(other.T)
+            diameter_sq = max(diameter_sq, dist_sq.max())
+    return math.sqrt(max(diameter_sq, 0.))
+
+
+def mesh_diameter(pts, cache_path=None):
+    '''
+    `calc_pts_diameter` of the mesh vertices, saved to and loaded from the .npz file cache_path if it was
+    computed for the same vertices.
+    '''
+    pts = np.ascontiguousarray(pts, np.float64)
+    key = hashlib.sha1(pts.tobytes()).hexdigest()
+    if cache_path and os.path.exists(cache_path):
+        cache = np.load(cache_path)
+        if str(cache['key']) == key:
+            return float(cache['diameter'])
+
+    diameter = calc_pts_diameter(pts)
+    if cache_path:
+        try:
+            np.savez(cache_path, key=key, diameter=diameter)
+        except IOError:
+            print('Could not write the mesh diameter cache {}'.format(cache_path))
     return diameter
+
+
+def evaluate_candidates(x, y, conf, ref_corners, intrinsics, **pnp_args):
+    '''
+    PnP on the [k, nV] keypoint candidates of one image (in image pixels), as a result dict of `PoseErrorStats`
+    with the pose 'R', 't' if one was found. The errors are computed afterwards for all the images at once,
+    see `utils.pose_eval_utils.PoseEvaluator`.
+    pnp_args: passed to `pnp_from_candidates` (conf_thresh, method, refine, reproj_thresh, ...)
+    '''
+    result = {'valid': False, 'corner_dist': None, 'errors': None, 'pnp': None, 'R': None, 't': None}
+    start = time.time()
+    rot, trans, transform, pnp_info = pnp_from_candidates(x, y, conf, ref_corners, intrinsics, **pnp_args)
+    pnp_info['time'] = time.time() - start
+    result['pnp'] = pnp_info
+    if transform is not None:
+        result['R'], result['t'] = rot, trans
+        result['valid'] = True
+    return result
+
+
+class PoseErrorStats(object):
+    '''
+    Collects the results of the pose evaluation and prints the statistics of test_image_list.py:
+        add(result): one image without errors, a dict with
+            valid: whether a pose was found
+            corner_dist, errors: None
+            pnp: the `pnp_from_candidates` info with the PnP 'time', None if PnP did not run
+        add_pnp(info), extend(errors): the PnP info and the errors of the images with a pose,
+            see `utils.pose_eval_utils.batch_pose_errors`
+    '''
+
+    def __init__(self):
+        self.errs_corner2D = []
+        self.errs_trans = []
+        self.errs_angle = []
+        self.errs_2d = []
+        self.errs_3d = []
+        self.errs_angles = []
+        self.error_count = 0
+        self.pnp_times = []
+        self.pnp_iterations = []
+        self.pnp_inliers = []
+        self.bounds_2d = []
+        self.bounds_3d = []
+
+    def add_pnp(self, info):
+        self.pnp_times.append(info['time'])
+        self.pnp_inliers.append(info['inliers'])
+        if info['iterations'] is not None:
+            self.pnp_iterations.append(info['iterations'])
+
+    def add(self, result):
+        if result['pnp'] is not None:
+            self.add_pnp(result['pnp'])
+
+        if result['corner_dist'] is not None:
+            self.errs_corner2D.append(result['corner_dist'])
+
+        if not result['valid']:
+            self.error_count += 1
+            return
+
+        errors = result['errors']
+        if errors is not None:
+            self.errs_trans.append(errors['trans'])
+            self.errs_angle.append(errors['angle'])
+            self.errs_2d.append(errors['2d'])
+            self.errs_3d.append(errors['3d'])
+            self.errs_angles.append(errors['angles'])
+
+    def extend(self, errors):
+        '''
+        The errors of a batch of images with a pose, see `utils.pose_eval_utils.batch_pose_errors`.
+        '''
+        valid = errors['valid']
+        self.errs_corner2D.extend(errors['corner_dist'])
+        self.error_count += int(np.sum(~valid))
+        self.errs_trans.extend(errors['trans'][valid])
+        self.errs_angle.extend(errors['angle'][valid])
+        self.errs_2d.extend(errors['2d'][valid])
+        self.errs_3d.extend(errors['3d'][valid])
+        self.errs_angles.extend(errors['angles'][valid])
+        self.bounds_2d.extend(errors['bound_2d'][valid])
+        self.bounds_3d.extend(errors['bound_3d'][valid])
+
+    def summary(self, num_images, diam, px_threshold=10, eps=1e-5):
+        '''
+        return: dict of the accuracies (in %) and the mean errors
+        '''
+        errs_2d = np.array(self.errs_2d)
+        errs_trans = np.array(self.errs_trans)
+        errs_angle = np.array(self.errs_angle)
+        count = len(errs_2d)
+        angles = np.array(self.errs_angles).reshape(-1, 3)
+        mean = lambda values: np.mean(values) if len(values) else float('nan')
+        return {'acc{}'.format(px_threshold): np.sum(errs_2d <= px_threshold) * 100. / num_images,
+                'acc15': np.sum(errs_2d <= 15) * 100. / num_images,
+                'acc20': np.sum(errs_2d <= 20) * 100. / num_images,
+                'acc3d10': np.sum(np.array(self.errs_3d) <= diam * 0.1) * 100. / (num_images + eps),
+                'acc5cm5deg': np.sum((errs_trans <= 0.05) & (errs_angle <= 5)) * 100. / (len(errs_trans) + eps),
+                'corner_acc': np.sum(np.array(self.errs_corner2D) <= px_threshold) * 100. / (num_images + eps),
+                'mean_2d': mean(errs_2d), 'mean_3d': mean(self.errs_3d), 'mean_corner': mean(self.errs_corner2D),
+                'trans': mean(errs_trans), 'angle': mean(errs_angle),
+                'roll': mean(angles[:, 0]), 'pitch': mean(angles[:, 1]), 'yaw': mean(angles[:, 2]),
+                'count': count, 'correct': count / num_images, 'errors': self.error_count,
+                'pnp_time': mean(self.pnp_times) * 1000, 'pnp_inliers': mean(self.pnp_inliers),
+                'pnp_iterations': mean(self.pnp_iterations),
+                # bounds of the difference of mean_2d and mean_3d to their value on the full mesh
+                'bound_2d': mean(self.bounds_2d), 'bound_3d': mean(self.bounds_3d)}
+
+    def report(self, num_images, diam, print_fn, px_threshold=10):
+        s = self.summary(num_images, diam, px_threshold=px_threshold)
+        # Print test statistics
+        print_fn('Correct Predictions: %d' % s['count'])
+        print_fn('Results of {}'.format('Aqua'))
+        print_fn('   Acc using {} px 2D Projection = {:.4f}%'.format(px_threshold, s['acc{}'.format(px_threshold)]))
+        print_fn('   Acc using {} px 2D Projection = {:.4f}%'.format(15, s['acc15']))
+        print_fn('   Acc using {} px 2D Projection = {:.4f}%'.format(20, s['acc20']))
+
+        print_fn('   Acc using 10% threshold - {} vx 3D Transformation = {:.4f}%'.format(diam * 0.1, s['acc3d10']))
+        print_fn('   Acc using 5 cm 5 degree metric = {:.4f}%'.format(s['acc5cm5deg']))
+        print_fn("   Mean 2D pixel error is %f, Mean vertex error is %f, mean corner error is %f" % (
+            s['mean_2d'], s['mean_3d'], s['mean_corner']))
+        print_fn('   Translation error: %f m, angle error: %f degree, pixel error: % f pix' % (
+            s['trans'], s['angle'], s['mean_2d']))
+        if np.any(self.bounds_2d):
+            print_fn('   Decimated mesh: mean 2D pixel error within %f pix, mean vertex error within %f of the '
+                     'full mesh' % (s['bound_2d'], s['bound_3d']))
+        print_fn('Correct prediction: %f' % s['correct'])
+        print_fn('Roll error: %f' % s['roll'])
+        print_fn('Pitch error: %f' % s['pitch'])
+        print_fn('Yaw error: %f' % s['yaw'])
+
+        print('Total errors: ', s['errors'])
+
+    def report_pnp(self, method, print_fn):
+        if not self.pnp_times:
+            return
+        print_fn('PnP (%s): mean time %f ms, mean inliers %f' % (method, np.mean(self.pnp_times) * 1000,
+                                                              np.mean(self.pnp_inliers)))
+        if self.pnp_iterations:
+            print_fn('PnP mean iterations: %f' % np.mean(self.pnp_iterations))
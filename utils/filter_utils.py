@@ -0,0 +1,139 @@
+# coding: utf-8
+# Temporal filtering of the PnP poses of a video: a constant-velocity model on SE(3), as an (error state)
+# extended Kalman filter. It predicts the pose between two network runs, so the network can run below
+# the camera frame rate, and rejects the PnP outliers with a Mahalanobis distance gate.
+
+from __future__ import division, print_function
+
+import numpy as np
+import cv2
+
+# 99% quantile of the chi-square distribution with 6 degrees of freedom
+CHI2_6DOF_99 = 16.812
+
+
+def so3_exp(omega):
+    return cv2.Rodrigues(np.asarray(omega, np.float64).reshape(3, 1))[0]
+
+
+def so3_log(R):
+    return cv2.Rodrigues(np.asarray(R, np.float64))[0].reshape(3)
+
+
+class PoseFilter(object):
+    '''
+    State: translation t, translational velocity v, rotation R and angular velocity w of the object in the
+    camera frame. The rotation error is a left perturbation: R = exp(dtheta) R_est.
+    trans_noise, rot_noise: standard deviation of the PnP translation (m, per axis) and rotation (rad)
+    accel_noise, ang_accel_noise: standard deviation of the (white) accelerations of the model
+    gate_threshold: squared Mahalanobis distance above which a measurement is rejected
+    max_rejections: consecutive rejections after which the filter is restarted on the next measurement
+    '''
+
+    def __init__(self, trans_noise=(0.02, 0.02, 0.1), rot_noise=0.05, accel_noise=1.0, ang_accel_noise=1.0,
+                 gate_threshold=CHI2_6DOF_99, max_rejections=5):
+        self.meas_cov = np.diag(np.concatenate((np.square(np.broadcast_to(trans_noise, 3)),
+                                                np.square(np.broadcast_to(rot_noise, 3)))))
+        self.accel_noise = accel_noise
+        self.ang_accel_noise = ang_accel_noise
+        self.gate_threshold = gate_threshold
+        self.max_rejections = max_rejections
+
+        # [t, v, theta, w] ==> [t, theta]
+        self.H = np.zeros((6, 12))
+        self.H[0:3, 0:3] = np.eye(3)
+        self.H[3:6, 6:9] = np.eye(3)
+        self.reset()
+
+    def reset(self):
+        self.initialized = False
+        self.t = np.zeros(3)
+        self.v = np.zeros(3)
+        self.R = np.eye(3)
+        self.w = np.zeros(3)
+        self.P = np.eye(12)
+        self.rejections = 0
+        self.last_distance = None
+
+    def initialize(self, R, t):
+        self.t = np.asarray(t, np.float64).reshape(3)
+        self.v = np.zeros(3)
+        self.R = np.asarray(R, np.float64)
+        self.w = np.zeros(3)
+        P = np.zeros((12, 12))
+        P[0:3, 0:3] = self.meas_cov[0:3, 0:3]
+        P[3:6, 3:6] = np.eye(3)  # (1 m/s)^2
+        P[6:9, 6:9] = self.meas_cov[3:6, 3:6]
+        P[9:12, 9:12] = np.eye(3)  # (1 rad/s)^2
+        self.P = P
+        self.rejections = 0
+        self.initialized = True
+
+    def predict(self, dt):
+        '''
+        Propagate the state by dt seconds.
+        '''
+        if not self.initialized or dt <= 0:
+            return
+        rot_step = so3_exp(self.w * dt)
+        self.t = self.t + self.v * dt
+        self.R = rot_step.dot(self.R)
+
+        F = np.eye(12)
+        F[0:3, 3:6] = dt * np.eye(3)
+        F[6:9, 6:9] = rot_step
+        F[6:9, 9:12] = dt * np.eye(3)
+
+        # white acceleration, discretized per axis
+        q = np.array([[dt ** 3 / 3., dt ** 2 / 2.], [dt ** 2 / 2., dt]])
+        Q = np.zeros((12, 12))
+        for offset, noise in ((0, self.accel_noise), (6, self.ang_accel_noise)):
+            for block_i in range(2):
+                for block_j in range(2):
+                    Q[offset + 3 * block_i:offset + 3 * block_i + 3, offset + 3 * block_j:offset + 3 * block_j + 3] = \
+                        q[block_i, block_j] * noise ** 2 * np.eye(3)
+
+        self.P = F.dot(self.P).dot(F.T) + Q
+
+    def update(self, R, t):
+        '''
+        Fuse a PnP pose.
+        return: True if the measurement was used, False if it was rejected by the gate.
+        '''
+        if not self.initialized:
+            self.initialize(R, t)
+            return True
+
+        innovation = np.concatenate((np.asarray(t, np.float64).reshape(3) - self.t,
+                                     so3_log(np.asarray(R, np.float64).dot(self.R.T))))
+        S = self.H.dot(self.P).dot(self.H.T) + self.meas_cov
+        S_inv = np.linalg.inv(S)
+        self.last_distance = innovation.dot(S_inv).dot(innovation)
+
+        if self.last_distance > self.gate_threshold:
+            self.rejections += 1
+            if self.rejections >= self.max_rejections:
+                # the filter lost the target (or the target moved unlike the model): start over
+                self.initialize(R, t)
+                return True
+            return False
+        self.rejections = 0
+
+        K = self.P.dot(self.H.T).dot(S_inv)
+        dx = K.dot(innovation)
+        self.t = self.t + dx[0:3]
+        self.v = self.v + dx[3:6]
+        self.R = so3_exp(dx[6:9]).dot(self.R)
+        self.w = self.w + dx[9:12]
+        self.P = (np.eye(12) - K.dot(self.H)).dot(self.P)
+        # keep it symmetric
+        self.P = (self.P + self.P.T) / 2.
+        return True
+
+    def pose(self):
+        '''
+        return: R [3, 3], t [3, 1], None, None if not initialized
+        '''
+        if not self.initialized:
+            return None, None
+        return self.R.copy(), self.t.reshape(3, 1).copy()
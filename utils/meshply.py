@@ -1,51 +1,233 @@
-# Class to read
+# coding: utf-8
+# Class to read PLY meshes (ASCII, binary little and big endian) into NumPy arrays.
+# The arrays are cached next to the mesh (`<mesh>_mesh.npz`) and reloaded while the mesh file is unchanged.
+
+from __future__ import division, print_function
+
+import os
+
+import numpy as np
+
+PLY_TYPES = {'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+             'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+             'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+             'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'}
+PLY_FORMATS = {'ascii': None, 'binary_little_endian': '<', 'binary_big_endian': '>'}
+
+
+def read_ply_header(f):
+    '''
+    f: file opened in binary mode, left at the start of the data.
+    return: format ('ascii', 'binary_little_endian' or 'binary_big_endian') and the list of elements
+        (name, count, properties), a property being (name, type) or (name, count type, item type) for lists
+    '''
+    if f.readline().strip() != b'ply':
+        raise ValueError('Not a PLY file')
+    ply_format = None
+    elements = []
+    for line in iter(f.readline, b''):
+        words = line.decode('ascii').split()
+        if not words or words[0] in ('comment', 'obj_info'):
+            continue
+        if words[0] == 'format':
+            ply_format = words[1]
+        elif words[0] == 'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == 'property':
+            if words[1] == 'list':
+                elements[-1][2].append((words[4], PLY_TYPES[words[2]], PLY_TYPES[words[3]]))
+            else:
+                elements[-1][2].append((words[2], PLY_TYPES[words[1]]))
+        elif words[0] == 'end_header':
+            break
+    if ply_format not in PLY_FORMATS:
+        raise ValueError('Unknown PLY format {}'.format(ply_format))
+    return ply_format, elements
+
+
+def _list_length(properties, first_row):
+    '''
+    The length of the lists of the first row, for the elements with a single list property.
+    '''
+    lists = [prop for prop in properties if len(prop) == 3]
+    if len(lists) != 1:
+        return None
+    return int(first_row[lists[0][0] + '_count'])
+
+
+def _binary_dtype(properties, endian, list_length=None):
+    '''
+    Structured dtype of an element, its lists as a count field and a fixed length sub-array.
+    '''
+    fields = []
+    for prop in properties:
+        if len(prop) == 3:
+            fields.append((prop[0] + '_count', endian + prop[1]))
+            if list_length is not None:
+                fields.append((prop[0], endian + prop[2], (list_length,)))
+        else:
+            fields.append((prop[0], endian + prop[1]))
+    return np.dtype(fields)
 
-class MeshPly:
-    def __init__(self, filename, color=[0., 0., 0.]):
 
-        f = open(filename, 'r')
-        self.vertices = []
-        self.colors = []
-        self.indices = []
-        self.normals = []
+def _read_binary_rows(f, properties, count, endian):
+    '''
+    Slow path for lists of different lengths: one row at a time.
+    '''
+    rows = dict((prop[0], []) for prop in properties)
+    for _ in range(count):
+        for prop in properties:
+            if len(prop) == 3:
+                length = int(np.fromfile(f, endian + prop[1], 1)[0])
+                rows[prop[0]].append(np.fromfile(f, endian + prop[2], length))
+            else:
+                rows[prop[0]].append(np.fromfile(f, endian + prop[1], 1)[0])
+    return rows
 
-        vertex_mode = False
-        face_mode = False
 
-        nb_vertices = 0
-        nb_faces = 0
+def read_binary_element(f, properties, count, endian):
+    '''
+    return: dict of the properties of the element, [count] arrays or [count, length] arrays for lists
+        (lists of arrays if their lengths differ)
+    '''
+    if count == 0:
+        return dict((prop[0], np.zeros(0)) for prop in properties)
+    if all(len(prop) == 2 for prop in properties):
+        data = np.fromfile(f, _binary_dtype(properties, endian), count)
+        return dict((name, data[name]) for name in data.dtype.names)
 
-        idx = 0
+    # the lists of meshes are usually all of the same length (triangles): read the first row to find it
+    start = f.tell()
+    head = np.fromfile(f, _binary_dtype(properties, endian), 1)
+    f.seek(start)
+    length = _list_length(properties, head[0])
+    if length is not None:
+        data = np.fromfile(f, _binary_dtype(properties, endian, length), count)
+        list_name = [prop[0] for prop in properties if len(prop) == 3][0]
+        if len(data) == count and np.all(data[list_name + '_count'] == length):
+            return dict((name, data[name]) for name in data.dtype.names if not name.endswith('_count'))
+        f.seek(start)
+    return _read_binary_rows(f, properties, count, endian)
 
-        with f as open_file_object:
-            for line in open_file_object:
-                elements = line.split()
-                if vertex_mode:
-                    self.vertices.append([float(i) for i in elements[:3]])
-                    self.normals.append([float(i) for i in elements[3:6]])
 
-                    if elements[6:9]:
-                        self.colors.append([float(i) / 255. for i in elements[6:9]])
+def read_ascii_element(values, pos, properties, count):
+    '''
+    values: all the numbers after the header, pos: index of the first number of the element
+    return: dict of the properties (see `read_binary_element`) and the index after the element
+    '''
+    if all(len(prop) == 2 for prop in properties):
+        width = len(properties)
+        data = values[pos:pos + count * width].reshape(count, width)
+        return dict((prop[0], data[:, i].astype(prop[1])) for i, prop in enumerate(properties)), pos + count * width
+
+    lists = [i for i, prop in enumerate(properties) if len(prop) == 3]
+    if len(lists) == 1 and count > 0:
+        before = lists[0]
+        length = int(values[pos + before])
+        width = len(properties) + length
+        rows = values[pos:pos + count * width]
+        if len(rows) == count * width:
+            rows = rows.reshape(count, width)
+            if np.all(rows[:, before] == length):
+                data = {}
+                for i, prop in enumerate(properties):
+                    column = i if i < before else i + length
+                    if i == before:
+                        data[prop[0]] = rows[:, before + 1:before + 1 + length].astype(prop[2])
                     else:
-                        self.colors.append([float(i) / 255. for i in color])
-
-                    idx += 1
-                    if idx == nb_vertices:
-                        vertex_mode = False
-                        face_mode = True
-                        idx = 0
-                elif face_mode:
-                    self.indices.append([float(i) for i in elements[1:4]])
-                    idx += 1
-                    if idx == nb_faces:
-                        face_mode = False
-                elif elements[0] == 'element':
-                    if elements[1] == 'vertex':
-                        nb_vertices = int(elements[2])
-                    elif elements[1] == 'face':
-                        nb_faces = int(elements[2])
-                elif elements[0] == 'end_header':
-                    vertex_mode = True
+                        data[prop[0]] = rows[:, column].astype(prop[1])
+                return data, pos + count * width
+
+    # lists of different lengths: one row at a time
+    data = dict((prop[0], []) for prop in properties)
+    for _ in range(count):
+        for prop in properties:
+            if len(prop) == 3:
+                length = int(values[pos])
+                data[prop[0]].append(values[pos + 1:pos + 1 + length].astype(prop[2]))
+                pos += 1 + length
+            else:
+                data[prop[0]].append(values[pos])
+                pos += 1
+    return data, pos
+
+
+def read_ply(filename):
+    '''
+    return: dict of the elements of the PLY file, each a dict of its properties
+    '''
+    with open(filename, 'rb') as f:
+        ply_format, elements = read_ply_header(f)
+        endian = PLY_FORMATS[ply_format]
+        data = {}
+        if endian is None:
+            values = np.fromfile(f, np.float64, sep=' ')
+            pos = 0
+            for name, count, properties in elements:
+                data[name], pos = read_ascii_element(values, pos, properties, count)
+        else:
+            for name, count, properties in elements:
+                data[name] = read_binary_element(f, properties, count, endian)
+    return data
+
+
+class MeshPly:
+    '''
+    mesh = MeshPly('aqua_glass_removed.ply')
+    mesh.vertices [V, 3], mesh.normals [V, 3] ([V, 0] without normals), mesh.colors [V, 3] in [0, 1],
+    mesh.indices [F, 3] (the first 3 vertices of every face), mesh.points [4, V] homogeneous vertices
+    cache: whether to save the arrays to, and load them from, `<mesh>_mesh.npz`
+    '''
+
+    def __init__(self, filename, color=[0., 0., 0.], cache=True):
+        stat = os.stat(filename)
+        # the cache is only valid for the same mesh file
+        key = '{}:{}'.format(stat.st_size, int(stat.st_mtime * 1e6))
+        cache_path = os.path.splitext(filename)[0] + '_mesh.npz'
+        arrays = None
+        if cache and os.path.exists(cache_path):
+            npz = np.load(cache_path)
+            if str(npz['key']) == key:
+                arrays = dict((name, npz[name]) for name in npz.files)
+        if arrays is None:
+            arrays = self.load(filename)
+            if cache:
+                try:
+                    np.savez(cache_path, key=key, **arrays)
+                except IOError:
+                    print('Could not write the mesh cache {}'.format(cache_path))
+
+        self.vertices = arrays['vertices']
+        self.normals = arrays['normals']
+        self.indices = arrays['indices']
+        if arrays['colors'].size:
+            self.colors = arrays['colors']
+        else:
+            self.colors = np.tile(np.array(color, np.float64) / 255., (len(self.vertices), 1))
+        self.points = np.ascontiguousarray(np.c_[self.vertices, np.ones((len(self.vertices), 1))].transpose())
+
+    @staticmethod
+    def load(filename):
+        '''
+        return: dict of the contiguous arrays of the mesh, colors is empty if the vertices have none
+        '''
+        data = read_ply(filename)
+        vertex = data['vertex']
+        stack = lambda names, dtype: np.ascontiguousarray(np.stack([vertex[name] for name in names], axis=1),
+                                                          dtype)
+        num_vertices = len(vertex['x'])
+        vertices = stack(('x', 'y', 'z'), np.float64)
+        normals = stack(('nx', 'ny', 'nz'), np.float64) if 'nx' in vertex else np.zeros((num_vertices, 0))
+        colors = stack(('red', 'green', 'blue'), np.float64) / 255. if 'red' in vertex else np.zeros((0, 3))
+
+        face = data.get('face', {})
+        faces = face.get('vertex_indices', face.get('vertex_index', []))
+        if isinstance(faces, np.ndarray) and faces.ndim == 2:
+            indices = faces[:, :3]
+        else:
+            indices = np.array([row[:3] for row in faces]).reshape(-1, 3)
+        return {'vertices': vertices, 'normals': normals, 'colors': colors,
+                'indices': np.ascontiguousarray(indices, np.int64)}
 
 
 if __name__ == '__main__':
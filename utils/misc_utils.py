@@ -1,12 +1,19 @@
 # coding: utf-8
 
 import numpy as np
-import tensorflow as tf
 import random
-
-from tensorflow.core.framework import summary_pb2
 import cv2
 
+from utils.pnp_utils import select_candidates, pnp_from_candidates
+
+try:
+    import tensorflow as tf
+    from tensorflow.core.framework import summary_pb2
+except ImportError:
+    # TensorFlow is only needed for training and the TF inference graph.
+    # The OpenCV DNN path (test_video_dnn.py) uses the NumPy helpers below without it.
+    tf = None
+
 def make_summary(name, val):
     return summary_pb2.Summary(value=[summary_pb2.Summary.Value(tag=name, simple_value=val)])
 
@@ -228,28 +235,6 @@ def get_3D_corners(vertices):
     corners = np.concatenate((np.transpose(corners), np.ones((1, 8))), axis=0)
     return corners
 
-def get_camera_intrinsic():
-	K = np.array([[569.31671203, 0.0, 360.09063137],
-	              [0.0, 569.387306625, 301.45327471],
-	              [0.0, 0.0, 1.0]])
-	return K
-
-def get_old_pool_intrinsics():
-	K = np.array([[569.416384877, 0.0, 354.086468692],
-	              [0.0, 569.797349037, 308.564486913],
-	              [0.0, 0.0, 1.0]])
-	return K
-
-def get_gopro_instrinsic():
-    K = np.array([2586.879545, 0.0, 1872.584540,
-                  0.0, 2608.959850, 1076.479199
-                 , 0.0, 0.0, 1.0]).astype(np.float32).reshape(3, 3)
-    return K
-
-def get_gopro_distortion():
-    dist = np.array([-0.104073, 0.112306, 0.000425, -0.004504, 0.0]).astype(np.float32)
-    return dist
-
 def compute_projection(points_3D, transformation, internal_calibration):
     projections_2d = np.zeros((2, points_3D.shape[1]), dtype='float32')
     camera_projection = (internal_calibration.dot(transformation)).dot(points_3D)
@@ -257,45 +242,18 @@ def compute_projection(points_3D, transformation, internal_calibration):
     projections_2d[1, :] = camera_projection[1, :] / camera_projection[2, :]
     return projections_2d
 
-def solve_pnp(x, y, conf, gt_corners, selected, intrinsics, bestCnt=12, nV=9):
-    xsi = x[selected]
-    ysi = y[selected]
-    dsi = conf[selected]
-
-    gridCnt = len(xsi)
-    assert (gridCnt > 0)
-    # choose best N count
-    p2d = None
-    p3d = None
-    candiBestCnt = min(gridCnt, bestCnt)
-
-    for i in range(candiBestCnt):
-        bestGrids = dsi.argmax(axis=0)
-        validmask = dsi[bestGrids, list(range(nV))] > 0.5
-        xsb = xsi[bestGrids, list(range(nV))][validmask]
-        ysb = ysi[bestGrids, list(range(nV))][validmask]
-        t2d = np.concatenate((xsb.reshape(-1, 1), ysb.reshape(-1, 1)), 1)
-        t3d = gt_corners[validmask]
-        if p2d is None:
-            p2d = t2d
-            p3d = t3d
-        else:
-            p2d = np.concatenate((p2d, t2d), 0)
-            p3d = np.concatenate((p3d, t3d), 0)
-        dsi[bestGrids, list(range(nV))] = 0
-
-    if(len(p3d)) < 6:
-        #will need to select the best one may be but not sure
-        print("Not enough points for Ransac")
-        return None, None, None
-    retval, rot, trans, inliers = cv2.solvePnPRansac(p3d, p2d, intrinsics, None, flags=cv2.SOLVEPNP_EPNP)
-
-    if not retval:
-        print("Ransac did not converge")
-        return None, None, None
-
-    R = cv2.Rodrigues(rot)[0]  # convert to rotation matrix
-    T = trans.reshape(-1, 1)
-    rt = np.concatenate((R, T), 1)
+def solve_pnp(x, y, conf, gt_corners, selected, intrinsics, bestCnt=12, nV=9, method='ransac', refine=False):
+    # choose best N count of every keypoint
+    x, y, conf = select_candidates(x, y, conf, selected, bestCnt=bestCnt)
+    return solve_pnp_candidates(x, y, conf, gt_corners, intrinsics, method=method, refine=refine)
+
 
+def solve_pnp_candidates(x, y, conf, gt_corners, intrinsics, conf_thresh=0.5, method='ransac', refine=False):
+    '''
+    Same as `solve_pnp`, for the [k, nV] candidates returned by `PoseRegressionLoss.predict_topk`,
+    which already are the k most confident selected cells of every keypoint.
+    See `utils.pnp_utils.pnp_from_candidates` for `method` and `refine`.
+    '''
+    R, T, rt, _ = pnp_from_candidates(x, y, conf, gt_corners, intrinsics, conf_thresh=conf_thresh,
+                                      method=method, refine=refine)
     return R, T, rt
@@ -0,0 +1,65 @@
+# coding: utf-8
+# Frame-difference gate: the network is skipped on frames that barely differ from the last frame it ran on.
+
+from __future__ import division, print_function
+
+import numpy as np
+import cv2
+
+
+class FrameDifferenceGate(object):
+    '''
+    Compares a small grayscale version of every frame with the one of the last frame the network ran on.
+    width: width of the grayscale thumbnails, the height keeps the aspect ratio of the frames
+    threshold: mean absolute difference (0-255 gray levels) below which a frame is considered static
+    max_skip: the network runs at least every max_skip frames (0: no limit)
+    '''
+
+    def __init__(self, width=160, threshold=2.0, max_skip=30):
+        self.width = width
+        self.threshold = threshold
+        self.max_skip = max_skip
+
+        self.reference = None
+        self.reference_id = None
+        self.last_difference = None
+        self.skipped = 0
+
+    def thumbnail(self, img):
+        height = max(1, int(round(img.shape[0] * self.width / float(img.shape[1]))))
+        # resize before the color conversion, on a 4K frame that is much cheaper
+        small = cv2.resize(img, (self.width, height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+    def difference(self, thumb, roi=None, frame_size=None):
+        '''
+        Mean absolute difference with the reference, in the roi (x0, y0, x1, y1) of a frame of size
+        frame_size (width, height) if given.
+        '''
+        diff = np.abs(thumb - self.reference)
+        if roi is not None:
+            scale = thumb.shape[1] / float(frame_size[0])
+            x0, y0 = int(np.floor(roi[0] * scale)), int(np.floor(roi[1] * scale))
+            x1, y1 = int(np.ceil(roi[2] * scale)), int(np.ceil(roi[3] * scale))
+            diff = diff[max(y0, 0):y1, max(x0, 0):x1]
+            if diff.size == 0:
+                return np.inf
+        return diff.mean()
+
+    def should_run(self, img, frame_id, roi=None):
+        '''
+        Whether the network has to run on frame `frame_id`. If so, it becomes the new reference.
+        roi: optional (x0, y0, x1, y1) in frame pixels, e.g. the tracked crop, to only look at the target.
+        '''
+        thumb = self.thumbnail(img)
+        run = self.reference is None or (self.max_skip > 0 and frame_id - self.reference_id >= self.max_skip)
+        if not run:
+            self.last_difference = self.difference(thumb, roi, (img.shape[1], img.shape[0]))
+            run = self.last_difference >= self.threshold
+
+        if run:
+            self.reference = thumb
+            self.reference_id = frame_id
+        else:
+            self.skipped += 1
+        return run
@@ -3,7 +3,12 @@
 from __future__ import division, print_function
 
 import numpy as np
-import tensorflow as tf
+
+try:
+    import tensorflow as tf
+except ImportError:
+    # only `gpu_nms` needs TensorFlow, `py_nms` and `cpu_nms` are pure NumPy
+    tf = None
 
 def gpu_nms(boxes, scores, num_classes, max_boxes=50, score_thresh=0.5, nms_thresh=0.5):
     """
@@ -72,6 +77,9 @@ def py_nms(boxes, scores, max_boxes=50, iou_thresh=0.5):
     while order.size > 0:
         i = order[0]
         keep.append(i)
+        # no need to suppress the rest once we have enough boxes
+        if len(keep) >= max_boxes:
+            break
         xx1 = np.maximum(x1[i], x1[order[1:]])
         yy1 = np.maximum(y1[i], y1[order[1:]])
         xx2 = np.minimum(x2[i], x2[order[1:]])
@@ -120,4 +128,33 @@ def cpu_nms(boxes, scores, num_classes, max_boxes=50, score_thresh=0.5, iou_thre
     score = np.concatenate(picked_score, axis=0)
     label = np.concatenate(picked_label, axis=0)
 
-    return boxes, score, label
\ No newline at end of file
+    return boxes, score, label
+
+def batch_nms(boxes, scores, max_boxes=50, score_thresh=0.5, nms_thresh=0.5):
+    """
+    Perform NMS on a batch of images at once using TensorFlow's combined NMS.
+    Unlike `gpu_nms`, the batch dimension is kept.
+
+    params:
+        boxes: tensor of shape [N, 10647, 4] # 10647=(13*13+26*26+52*52)*3, for input 416*416 image
+        scores: tensor of shape [N, 10647, num_classes], score=conf*prob
+        max_boxes: integer, maximum number of predicted boxes per image
+        score_thresh: boxes with a score below score_thresh are dropped
+        nms_thresh: real value, "intersection over union" threshold used for NMS filtering
+    return:
+        boxes: [N, max_boxes, 4], scores: [N, max_boxes], labels: [N, max_boxes],
+        num_boxes: [N], only the first num_boxes[i] entries of image i are valid.
+    """
+    # [N, 10647, 1, 4]: the same box is shared by all classes
+    boxes = tf.expand_dims(boxes, axis=2)
+    boxes, score, label, num_boxes = tf.image.combined_non_max_suppression(boxes=boxes,
+                                                                           scores=scores,
+                                                                           max_output_size_per_class=max_boxes,
+                                                                           max_total_size=max_boxes,
+                                                                           iou_threshold=nms_thresh,
+                                                                           score_threshold=score_thresh,
+                                                                           clip_boxes=False,
+                                                                           name='batch_nms')
+    label = tf.cast(label, tf.int32)
+
+    return boxes, score, label, num_boxes
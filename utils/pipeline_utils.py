@@ -0,0 +1,190 @@
+# coding: utf-8
+# A small multi-stage runner that overlaps image decoding/preprocessing, the network and the
+# post-processing (PnP, metrics, drawing) of consecutive frames, while keeping the frame order.
+# `MicroBatcher` does the batching for requests coming from concurrent threads (e.g. a server).
+
+from __future__ import division, print_function
+
+import sys
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+_END = object()
+
+
+class PipelineRunner(object):
+    '''
+    Runs `items` through three stages connected by bounded queues:
+        preprocess_fn(item) -> pre                  (thread pool, e.g. imread, resize, letterbox)
+        inference_fn([pre, ...]) -> [out, ...]      (single thread, one sess.run per batch)
+        postprocess_fn(pre, out) -> result          (thread pool, e.g. solve_pnp, metrics, drawing)
+    `run` yields the results in the same order as `items`. OpenCV, NumPy and TensorFlow release
+    the GIL in their heavy calls, so the throughput approaches the one of the slowest stage.
+    '''
+
+    def __init__(self, preprocess_fn, inference_fn, postprocess_fn, batch_size=1,
+                 num_preprocess_threads=4, num_postprocess_threads=4, queue_size=16):
+        self.preprocess_fn = preprocess_fn
+        self.inference_fn = inference_fn
+        self.postprocess_fn = postprocess_fn
+        self.batch_size = batch_size
+        self.num_preprocess_threads = num_preprocess_threads
+        self.num_postprocess_threads = num_postprocess_threads
+        self.queue_size = queue_size
+
+    def run(self, items):
+        # both queues hold futures in submission order, which is how the frame order is kept
+        pre_queue = queue.Queue(maxsize=self.queue_size)
+        post_queue = queue.Queue(maxsize=self.queue_size)
+        stop_event = threading.Event()
+        errors = []
+
+        pre_pool = ThreadPoolExecutor(max_workers=self.num_preprocess_threads)
+        post_pool = ThreadPoolExecutor(max_workers=self.num_postprocess_threads)
+
+        def put(q, value):
+            # do not block forever on a full queue if the consumer went away
+            while not stop_event.is_set():
+                try:
+                    q.put(value, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q):
+            while not stop_event.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _END
+
+        def feed():
+            try:
+                for item in items:
+                    if not put(pre_queue, pre_pool.submit(self.preprocess_fn, item)):
+                        return
+            except Exception:
+                errors.append(sys.exc_info())
+            put(pre_queue, _END)
+
+        def infer():
+            try:
+                finished = False
+                while not finished:
+                    future = get(pre_queue)
+                    if future is _END:
+                        break
+                    batch = [future.result()]
+                    # grab whatever is already queued, up to batch_size
+                    while len(batch) < self.batch_size:
+                        try:
+                            future = pre_queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if future is _END:
+                            finished = True
+                            break
+                        batch.append(future.result())
+
+                    outputs = self.inference_fn(batch)
+                    for pre, out in zip(batch, outputs):
+                        if not put(post_queue, post_pool.submit(self.postprocess_fn, pre, out)):
+                            return
+            except Exception:
+                errors.append(sys.exc_info())
+            put(post_queue, _END)
+
+        threads = [threading.Thread(target=feed), threading.Thread(target=infer)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            while True:
+                future = post_queue.get()
+                if future is _END:
+                    break
+                yield future.result()
+            if errors:
+                exc_type, exc_value, exc_tb = errors[0]
+                raise exc_value.with_traceback(exc_tb)
+        finally:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+            pre_pool.shutdown(wait=True)
+            post_pool.shutdown(wait=True)
+
+
+class MicroBatcher(object):
+    '''
+    Gathers the items submitted by concurrent threads into batches for
+        process_fn([item, ...]) -> [result, ...]    (single worker thread, one sess.run per batch)
+    A batch is closed when it holds `max_batch_size` items, or when its first item has waited
+    `max_latency` seconds, so a lone request is never delayed by more than that.
+    '''
+
+    def __init__(self, process_fn, max_batch_size=8, max_latency=0.005):
+        self.process_fn = process_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+
+        self.batch_count = 0
+        self.item_count = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, item):
+        '''
+        return: a Future of the result of `item`
+        '''
+        if self._closed:
+            raise RuntimeError('MicroBatcher is closed')
+        future = Future()
+        self._queue.put((item, future, time.time()))
+        return future
+
+    def close(self):
+        '''
+        Process the pending items and stop the worker thread.
+        '''
+        self._closed = True
+        self._queue.put(_END)
+        self._thread.join()
+
+    def _loop(self):
+        finished = False
+        while not finished:
+            entry = self._queue.get()
+            if entry is _END:
+                break
+            batch = [entry]
+            deadline = entry[2] + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.time()
+                try:
+                    entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _END:
+                    finished = True
+                    break
+                batch.append(entry)
+
+            try:
+                results = self.process_fn([item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self.batch_count += 1
+            self.item_count += len(batch)
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,213 @@
+# coding: utf-8
+# Building the 2D-3D correspondences from the keypoint candidates and solving the PnP.
+# Besides OpenCV's RANSAC, a confidence-ordered sampler (PROSAC, Chum & Matas, CVPR 2005) is provided:
+# the candidates come with a confidence, so the hypotheses are drawn from the most confident
+# correspondences first and the loop stops as soon as the inlier ratio is high enough.
+
+from __future__ import division, print_function
+
+import math
+import numpy as np
+import cv2
+
+
+def select_candidates(x, y, conf, selected, bestCnt=12):
+    '''
+    Keep the bestCnt most confident selected cells of every keypoint.
+    Host version of `PoseRegressionLoss.predict_topk`.
+    x, y, conf: [M, nV]
+    selected: [M] bool
+    return: x, y, conf, each [min(bestCnt, selected.sum()), nV], sorted by descending confidence.
+    '''
+    xsi = x[selected]
+    ysi = y[selected]
+    dsi = conf[selected]
+    assert len(dsi) > 0
+
+    # stable sort, so ties are broken like the argmax loop did
+    order = np.argsort(-dsi, axis=0, kind='stable')[:bestCnt]
+    return (np.take_along_axis(xsi, order, axis=0),
+            np.take_along_axis(ysi, order, axis=0),
+            np.take_along_axis(dsi, order, axis=0))
+
+
+def build_correspondences(x, y, conf, gt_corners, conf_thresh=0.5):
+    '''
+    x, y, conf: [k, nV] keypoint candidates in image pixels
+    gt_corners: [nV, 3] 3D keypoints of the object model
+    return:
+        p3d: [P, 3], p2d: [P, 2], weights: [P], the candidates with conf > conf_thresh.
+        The order is row-major, i.e. the best candidate of every keypoint comes first.
+    '''
+    validmask = conf > conf_thresh
+    p2d = np.stack((x[validmask], y[validmask]), axis=1)
+    p3d = np.tile(gt_corners[np.newaxis], [len(conf), 1, 1])[validmask]
+    weights = conf[validmask]
+    return p3d, p2d, weights
+
+
+def reprojection_errors(p3d, p2d, rvec, tvec, intrinsics):
+    R = cv2.Rodrigues(rvec)[0]
+    cam = p3d.dot(R.T) + tvec.reshape(1, 3)
+    proj = cam.dot(np.asarray(intrinsics, np.float64).T)
+    # points behind the camera are never inliers
+    z = np.where(cam[:, 2] > 1e-8, proj[:, 2], np.nan)
+    uv = proj[:, :2] / z[:, np.newaxis]
+    err = np.linalg.norm(uv - p2d, axis=1)
+    return np.where(np.isnan(err), np.inf, err)
+
+
+def ransac_pnp(p3d, p2d, intrinsics, reproj_thresh=8.0, max_iters=100, confidence=0.99, flags=cv2.SOLVEPNP_EPNP):
+    '''
+    OpenCV's RANSAC PnP.
+    return: rvec, tvec, inliers (indices), iterations. rvec is None if it did not converge.
+    '''
+    retval, rvec, tvec, inliers = cv2.solvePnPRansac(p3d, p2d, intrinsics, None, iterationsCount=max_iters,
+                                                     reprojectionError=reproj_thresh, confidence=confidence,
+                                                     flags=flags)
+    if not retval or inliers is None:
+        return None, None, None, None
+    # OpenCV does not report the number of iterations it ran
+    return rvec, tvec, inliers.reshape(-1), None
+
+
+def prosac_pnp(p3d, p2d, weights, intrinsics, reproj_thresh=8.0, max_iters=100, confidence=0.99,
+               flags=cv2.SOLVEPNP_EPNP, random_state=None):
+    '''
+    PnP with progressive sample consensus: minimal samples are drawn from the n most confident
+    correspondences, n growing with the iterations. The loop stops as soon as, for some top-n set,
+    enough samples were drawn to hit an all-inlier one with `confidence`. Like cv2.solvePnPRansac,
+    the pose is finally re-estimated on all inliers of the best hypothesis.
+    return: rvec, tvec, inliers (indices), iterations. rvec is None if no hypothesis was found.
+    '''
+    random_state = np.random if random_state is None else random_state
+    # EPnP (like OpenCV's RANSAC) uses 5 points per hypothesis, P3P variants use 4
+    m = 4 if flags in (cv2.SOLVEPNP_P3P, cv2.SOLVEPNP_AP3P) else 5
+
+    order = np.argsort(-weights, kind='stable')
+    p3d = np.ascontiguousarray(p3d[order], np.float64)
+    p2d = np.ascontiguousarray(p2d[order], np.float64)
+    N = len(p3d)
+    intrinsics = np.asarray(intrinsics, np.float64)
+    # the top-n sets used for the termination must be larger than a sample, otherwise the sample
+    # itself makes them look inlier-only
+    set_sizes = np.arange(min(2 * m, N), N + 1)
+
+    # growth function of the sampling set, see Chum & Matas, section 2.3
+    n = m
+    T_n = float(max_iters)
+    for i in range(m):
+        T_n *= (n - i) / float(N - i)
+    T_n_prime = 1
+
+    best_rvec, best_tvec, best_inliers = None, None, None
+    stop_iters = max_iters
+    t = 0
+    while t < stop_iters:
+        t += 1
+        if t > T_n_prime and n < N:
+            T_n_next = T_n * (n + 1) / float(n + 1 - m)
+            T_n_prime += int(math.ceil(T_n_next - T_n))
+            T_n = T_n_next
+            n += 1
+
+        if T_n_prime < t:
+            sample = np.argpartition(random_state.rand(n), m - 1)[:m]
+        else:
+            # the newest point of the set is always part of the sample
+            sample = np.append(np.argpartition(random_state.rand(n - 1), m - 2)[:m - 1], n - 1)
+
+        try:
+            ok, rvec, tvec = cv2.solvePnP(p3d[sample], p2d[sample], intrinsics, None, flags=flags)
+        except cv2.error:
+            ok = False
+        if not ok:
+            continue
+
+        inlier_mask = reprojection_errors(p3d, p2d, rvec, tvec, intrinsics) < reproj_thresh
+        if best_inliers is None or inlier_mask.sum() > len(best_inliers):
+            best_rvec, best_tvec, best_inliers = rvec, tvec, np.where(inlier_mask)[0]
+
+            # inlier ratio of every top-n set and the number of samples needed to hit
+            # an all-inlier one in it with `confidence`
+            inlier_ratio = np.cumsum(inlier_mask)[set_sizes - 1] / set_sizes.astype(np.float64)
+            if inlier_ratio.max() >= 1.:
+                break
+            inlier_ratio = inlier_ratio[inlier_ratio > 0]
+            if len(inlier_ratio) > 0:
+                needed = np.log(1. - confidence) / np.log(1. - inlier_ratio ** m)
+                stop_iters = min(stop_iters, int(math.ceil(needed.min())))
+
+    if best_rvec is None:
+        return None, None, None, t
+
+    rvec, tvec = best_rvec, best_tvec
+    if len(best_inliers) > m:
+        try:
+            ok, rvec, tvec = cv2.solvePnP(p3d[best_inliers], p2d[best_inliers], intrinsics, None, flags=flags)
+        except cv2.error:
+            ok = False
+        if not ok:
+            rvec, tvec = best_rvec, best_tvec
+
+    return rvec, tvec, order[best_inliers], t
+
+
+def refine_pnp(p3d, p2d, rvec, tvec, intrinsics):
+    '''
+    Levenberg-Marquardt refinement of the pose on the inliers.
+    '''
+    p3d = np.ascontiguousarray(p3d, np.float64)
+    p2d = np.ascontiguousarray(p2d, np.float64)
+    intrinsics = np.asarray(intrinsics, np.float64)
+    if hasattr(cv2, 'solvePnPRefineLM'):
+        return cv2.solvePnPRefineLM(p3d, p2d, intrinsics, None, rvec.copy(), tvec.copy())
+    # OpenCV < 4.1: the iterative solver is a LM on the reprojection error as well
+    _, rvec, tvec = cv2.solvePnP(p3d, p2d, intrinsics, None, rvec.copy(), tvec.copy(),
+                                 useExtrinsicGuess=True, flags=cv2.SOLVEPNP_ITERATIVE)
+    return rvec, tvec
+
+
+def pnp_from_candidates(x, y, conf, gt_corners, intrinsics, conf_thresh=0.5, method='ransac', refine=False,
+                        reproj_thresh=8.0, max_iters=100, confidence=0.99, flags=cv2.SOLVEPNP_EPNP,
+                        random_state=None):
+    '''
+    Solve the pose from the [k, nV] keypoint candidates.
+    method: 'ransac' (cv2.solvePnPRansac) or 'prosac' (confidence-ordered sampling)
+    refine: refine the pose with LM on the inliers
+    return:
+        R: [3, 3], T: [3, 1], rt: [3, 4], None if the pose could not be solved
+        info: dict with the number of correspondences, iterations (None for 'ransac') and inliers
+    '''
+    p3d, p2d, weights = build_correspondences(x, y, conf, gt_corners, conf_thresh=conf_thresh)
+    info = {'points': len(p3d), 'iterations': None, 'inliers': 0}
+
+    if len(p3d) < 6:
+        #will need to select the best one may be but not sure
+        print("Not enough points for Ransac")
+        return None, None, None, info
+
+    if method == 'ransac':
+        rvec, tvec, inliers, iterations = ransac_pnp(p3d, p2d, intrinsics, reproj_thresh=reproj_thresh,
+                                                     max_iters=max_iters, confidence=confidence, flags=flags)
+    elif method == 'prosac':
+        rvec, tvec, inliers, iterations = prosac_pnp(p3d, p2d, weights, intrinsics, reproj_thresh=reproj_thresh,
+                                                     max_iters=max_iters, confidence=confidence, flags=flags,
+                                                     random_state=random_state)
+    else:
+        raise ValueError('Unsupported PnP method: {}'.format(method))
+    info['iterations'] = iterations
+
+    if rvec is None:
+        print("Ransac did not converge")
+        return None, None, None, info
+    info['inliers'] = len(inliers)
+
+    if refine and len(inliers) >= 4:
+        rvec, tvec = refine_pnp(p3d[inliers], p2d[inliers], rvec, tvec, intrinsics)
+
+    R = cv2.Rodrigues(rvec)[0]  # convert to rotation matrix
+    T = tvec.reshape(-1, 1)
+    rt = np.concatenate((R, T), 1)
+
+    return R, T, rt, info
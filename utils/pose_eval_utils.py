@@ -0,0 +1,245 @@
+# coding: utf-8
+# Pose metrics of a whole test set at once: the predicted and ground truth poses are stacked as
+# R [N, 3, 3], t [N, 3, 1] and every metric of test_image_list.py is computed with batched NumPy operations.
+# The ground truth poses (PnP on the ground truth keypoints) are cached per test file.
+# The vertex metrics (2D projection and 3D distance) can use a farthest point sampling of the mesh, weighted by
+# the number of vertices closest to every sample, with a bound on the difference to the full mesh metrics.
+
+from __future__ import division, print_function
+
+import os
+import hashlib
+
+import numpy as np
+
+from utils.eval_utils import pnp, euler_from_rotation_matrix
+
+
+def keypoints_from_lines(lines, nV=8):
+    '''
+    Ground truth keypoints of pool_test.txt lines (index path width height label x1 y1 ...).
+    return: [N, nV, 2]
+    '''
+    return np.array([[float(v) for v in line.strip().split(' ')[5:nV * 2 + 5]] for line in lines],
+                    np.float64).reshape(-1, nV, 2)
+
+
+def gt_poses(box_gt, ref_corners, K, cache_path=None):
+    '''
+    Ground truth poses solved by PnP from the ground truth keypoints box_gt [N, nV, 2].
+    cache_path: .npz file the poses are saved to, and loaded from if it was computed for the same keypoints,
+        model corners and camera matrix.
+    return: R [N, 3, 3], t [N, 3, 1]
+    '''
+    ref_corners = np.array(ref_corners, dtype='float32')
+    key = hashlib.sha1(np.ascontiguousarray(box_gt, np.float64).tobytes() + ref_corners.tobytes() +
+                       np.asarray(K, np.float64).tobytes()).hexdigest()
+    if cache_path and os.path.exists(cache_path):
+        cache = np.load(cache_path)
+        if str(cache['key']) == key:
+            return cache['R'], cache['t']
+
+    R = np.empty((len(box_gt), 3, 3))
+    t = np.empty((len(box_gt), 3, 1))
+    for i in range(len(box_gt)):
+        R[i], t[i] = pnp(ref_corners, box_gt[i], K)
+
+    if cache_path:
+        try:
+            np.savez(cache_path, key=key, R=R, t=t)
+        except IOError:
+            print('Could not write the ground truth pose cache {}'.format(cache_path))
+    return R, t
+
+
+def farthest_point_sampling(points, num_samples):
+    '''
+    points: [V, 3]
+    return: indices [num_samples] of the samples, labels [V] the sample closest to every point, and the covering
+        radius: the largest distance of a point to its sample
+    '''
+    num_samples = min(num_samples, len(points))
+    indices = np.zeros(num_samples, np.int64)
+    labels = np.zeros(len(points), np.int64)
+    # start from the point farthest from the centroid
+    indices[0] = np.argmax(np.sum(np.square(points - points.mean(axis=0)), axis=1))
+    min_dist = np.sum(np.square(points - points[indices[0]]), axis=1)
+    for i in range(1, num_samples):
+        indices[i] = np.argmax(min_dist)
+        dist = np.sum(np.square(points - points[indices[i]]), axis=1)
+        closer = dist < min_dist
+        labels[closer] = i
+        min_dist[closer] = dist[closer]
+    return indices, labels, float(np.sqrt(min_dist.max()))
+
+
+def decimate_vertices(vertices, num_samples, cache_path=None):
+    '''
+    Subset of the [4, V] homogeneous vertices for the vertex metrics.
+    The weighted mean of a function over the samples is the mean over all the vertices of the function at their
+    closest sample, so it differs from the full mean by at most the Lipschitz constant times the covering radius.
+    cache_path: .npz file the sampling is saved to, and loaded from if it was computed for the same vertices.
+    return: vertices [4, num_samples], weights [num_samples] (summing to 1), covering radius
+    '''
+    points = np.ascontiguousarray(vertices[:3].T, np.float64)
+    key = hashlib.sha1(points.tobytes() + str(num_samples).encode()).hexdigest()
+    if cache_path and os.path.exists(cache_path):
+        cache = np.load(cache_path)
+        if str(cache['key']) == key:
+            return vertices[:, cache['indices']], cache['weights'], float(cache['radius'])
+
+    indices, labels, radius = farthest_point_sampling(points, num_samples)
+    weights = np.bincount(labels, minlength=len(indices)) / len(points)
+    if cache_path:
+        try:
+            np.savez(cache_path, key=key, indices=indices, weights=weights, radius=radius)
+        except IOError:
+            print('Could not write the decimated vertices cache {}'.format(cache_path))
+    return vertices[:, indices], weights, radius
+
+
+def transform_points(points, R, t):
+    '''
+    points: [3, V] (or [4, V] homogeneous), R: [N, 3, 3], t: [N, 3, 1]
+    return: [N, 3, V], the points in the camera frame of every pose
+    '''
+    return np.einsum('nij,jv->niv', R, points[:3]) + t
+
+
+def project_points(points, R, t, K):
+    '''
+    Pinhole projection of the points with every pose, same as `compute_projection`.
+    return: [N, 2, V]
+    '''
+    return project_camera_points(transform_points(points, R, t), K)
+
+
+def project_camera_points(camera_points, K):
+    '''
+    camera_points: [N, 3, V] points in the camera frame
+    return: [N, 2, V]
+    '''
+    image_points = np.einsum('ij,njv->niv', K, camera_points)
+    return image_points[:, :2] / image_points[:, 2:3]
+
+
+def projection_jacobian(camera_points, K):
+    '''
+    Jacobian of the pinhole projection at the [N, 3, V] camera frame points.
+    return: [N, V, 2, 3]
+    '''
+    x, y, z = camera_points[:, 0], camera_points[:, 1], camera_points[:, 2]
+    zeros = np.zeros_like(z)
+    return np.stack((np.stack((K[0, 0] / z, zeros, -K[0, 0] * x / z ** 2), axis=-1),
+                     np.stack((zeros, K[1, 1] / z, -K[1, 1] * y / z ** 2), axis=-1)), axis=-2)
+
+
+def projection_curvature(camera_points, K, radius):
+    '''
+    Bound of the second derivative of the projection within `radius` of the [N, 3, V] camera frame points,
+    inf if that region reaches the image plane.
+    return: [N]
+    '''
+    z_min = camera_points[:, 2].min(axis=1) - radius
+    xy_max = np.linalg.norm(camera_points[:, :2], axis=1).max(axis=1) + radius
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # the second derivatives of x / z are 1 / z^2 (twice) and 2 x / z^3
+        curvature = max(K[0, 0], K[1, 1]) * np.sqrt(2) * (np.sqrt(2) + 2 * xy_max / z_min) / z_min ** 2
+    return np.where(z_min > 0, curvature, np.inf)
+
+
+def rotation_errors(R_gt, R_pr):
+    '''
+    return: angle [N], the angle of R_gt.R_pr^T in degrees (`calcAngularDistancetrace`), and angles [N, 3], the
+        absolute differences of the Euler angles (roll, pitch, yaw) in degrees (`calcAngularDistance`)
+    '''
+    # trace(A.B^T) = sum(A * B)
+    trace = np.einsum('nij,nij->n', R_gt, R_pr)
+    angle = np.rad2deg(np.arccos(np.clip((trace - 1.0) / 2.0, -1., 1.)))
+    pr_eul = euler_from_rotation_matrix(R_pr.astype(np.float32))
+    gt_eul = euler_from_rotation_matrix(R_gt.astype(np.float32))
+    return angle, np.rad2deg(np.abs(pr_eul - gt_eul))
+
+
+def batch_pose_errors(R_pr, t_pr, R_gt, t_gt, box_gt, corners3D, vertices, K, max_corner_dist=100, chunk_size=256,
+                      weights=None, radius=0.):
+    '''
+    All the errors of test_image_list.py for N images with a predicted pose.
+    R_pr, R_gt: [N, 3, 3], t_pr, t_gt: [N, 3, 1], box_gt: [N, nV, 2]
+    corners3D: [4, 8], vertices: [4, V] homogeneous points of the object model
+    weights, radius: weights of the vertices and covering radius of a `decimate_vertices` subset
+    The vertex metrics are computed `chunk_size` images at a time, to bound the memory to chunk_size * V.
+    return: dict of [N] arrays:
+        corner_dist: mean distance between box_gt and the projected corners
+        trans (m), angle (degrees), angles [N, 3] (roll, pitch, yaw differences in degrees)
+        2d: mean distance of the projected vertices, 3d: mean distance of the transformed vertices
+        bound_2d, bound_3d: bounds of the difference of 2d and 3d to their value on the full mesh
+        valid: corner_dist <= max_corner_dist, the other errors are only meaningful for these
+    '''
+    # the 8 corners, without the center of the 9 keypoints labels
+    corners2D_pr = np.transpose(project_points(corners3D, R_pr, t_pr, K), [0, 2, 1])
+    corner_dist = np.linalg.norm(box_gt[:, :8] - corners2D_pr, axis=2).mean(axis=1)
+    trans = np.linalg.norm((t_gt - t_pr)[..., 0], axis=1)
+    angle, angles = rotation_errors(R_gt, R_pr)
+
+    pixel_dist = np.empty(len(R_pr))
+    vertex_dist = np.empty(len(R_pr))
+    bound_2d = np.zeros(len(R_pr))
+    for start in range(0, len(R_pr), chunk_size):
+        s = slice(start, start + chunk_size)
+        points_gt = transform_points(vertices, R_gt[s], t_gt[s])
+        points_pr = transform_points(vertices, R_pr[s], t_pr[s])
+        pixel_norm = np.linalg.norm(project_camera_points(points_gt, K) - project_camera_points(points_pr, K), axis=1)
+        pixel_dist[s] = np.average(pixel_norm, axis=1, weights=weights)
+        vertex_dist[s] = np.average(np.linalg.norm(points_gt - points_pr, axis=1), axis=1, weights=weights)
+        if radius > 0:
+            # Taylor expansion of the difference of the projections around every sample
+            jacobian = np.einsum('nvij,njk->nvik', projection_jacobian(points_gt, K), R_gt[s]) - \
+                       np.einsum('nvij,njk->nvik', projection_jacobian(points_pr, K), R_pr[s])
+            bound_2d[s] = radius * np.linalg.norm(jacobian, axis=(2, 3)).max(axis=1) + 0.5 * radius ** 2 * (
+                projection_curvature(points_gt, K, radius) + projection_curvature(points_pr, K, radius))
+
+    # the 3D difference is Lipschitz with the norm of R_gt - R_pr: 2 sin(angle / 2)
+    bound_3d = radius * 2 * np.sin(np.deg2rad(angle) / 2)
+    return {'corner_dist': corner_dist, 'trans': trans, 'angle': angle, 'angles': angles, '2d': pixel_dist,
+            '3d': vertex_dist, 'bound_2d': bound_2d, 'bound_3d': bound_3d, 'valid': corner_dist <= max_corner_dist}
+
+
+class PoseEvaluator(object):
+    '''
+    The ground truth of a test file and the object model, to score the predicted poses of any subset of its
+    images in one call:
+        evaluator = PoseEvaluator(box_gt, ref_corners, corners3D, vertices, K, gt_cache='pool_test_gt_poses.npz')
+        stats.extend(evaluator.errors(R_pr, t_pr, rows))
+    num_vertices: number of vertices of the vertex metrics (see `decimate_vertices`), all of them if None or 0.
+    vertex_cache: .npz cache of the decimation.
+    '''
+
+    def __init__(self, box_gt, ref_corners, corners3D, vertices, K, gt_cache=None, max_corner_dist=100,
+                 num_vertices=None, vertex_cache=None):
+        self.box_gt = np.asarray(box_gt, np.float64)
+        self.corners3D = corners3D
+        self.num_mesh_vertices = vertices.shape[1]
+        self.weights, self.radius = None, 0.
+        if num_vertices and num_vertices < self.num_mesh_vertices:
+            vertices, self.weights, self.radius = decimate_vertices(vertices, num_vertices, cache_path=vertex_cache)
+        self.vertices = vertices
+        self.K = np.asarray(K, np.float64)
+        self.max_corner_dist = max_corner_dist
+        self.R_gt, self.t_gt = gt_poses(self.box_gt, ref_corners, self.K, cache_path=gt_cache)
+
+    def describe(self):
+        if self.weights is None:
+            return 'Vertex metrics on the {} vertices of the mesh'.format(self.num_mesh_vertices)
+        return 'Vertex metrics on {} of the {} vertices of the mesh, covering radius {:f}'.format(
+            self.vertices.shape[1], self.num_mesh_vertices, self.radius)
+
+    def errors(self, R_pr, t_pr, rows):
+        '''
+        R_pr: [M, 3, 3], t_pr: [M, 3, 1], the poses predicted for the images `rows` of the test file.
+        '''
+        rows = np.asarray(rows, np.int64)
+        return batch_pose_errors(np.asarray(R_pr, np.float64).reshape(-1, 3, 3),
+                                 np.asarray(t_pr, np.float64).reshape(-1, 3, 1), self.R_gt[rows], self.t_gt[rows],
+                                 self.box_gt[rows], self.corners3D, self.vertices, self.K,
+                                 max_corner_dist=self.max_corner_dist, weights=self.weights, radius=self.radius)
@@ -0,0 +1,110 @@
+# coding: utf-8
+# Columnar store of the network outputs of an image list, so PnP and the metrics can be recomputed
+# (and their parameters tuned) without running the network again. One .npy file per column, row i is the
+# i-th image of the list, opened memory-mapped: only the rows and columns used are read from the disk.
+
+from __future__ import division, print_function
+
+import os
+import json
+
+import numpy as np
+
+META_FILE = 'meta.json'
+LINES_FILE = 'lines.txt'
+
+
+def topk_columns(num_boxes, k, nV):
+    '''
+    The outputs of the test graph: the boxes after NMS, in image pixels, and the [k, nV] keypoint
+    candidates of `PoseRegressionLoss.predict_topk`, in image pixels.
+    '''
+    return {'num_boxes': ((), np.int32),
+            'boxes': ((num_boxes, 4), np.float32),
+            'scores': ((num_boxes,), np.float32),
+            'labels': ((num_boxes,), np.int32),
+            'x': ((k, nV), np.float32),
+            'y': ((k, nV), np.float32),
+            'conf': ((k, nV), np.float32),
+            # network input -> image pixels: (x - dw) / ratio
+            'letterbox': ((3,), np.float32)}
+
+
+def raw_columns(num_cells_det, num_cells_pose, class_num, nV):
+    '''
+    The outputs of the network before NMS and keypoint selection, in network input coordinates:
+    `yolov3.predict` boxes and scores and the keypoints of every cell (`PoseRegressionLoss.reorg`).
+    '''
+    return {'raw_boxes': ((num_cells_det, 4), np.float32),
+            'raw_scores': ((num_cells_det, class_num), np.float32),
+            'raw_x': ((num_cells_pose, nV), np.float32),
+            'raw_y': ((num_cells_pose, nV), np.float32),
+            'raw_conf': ((num_cells_pose, nV), np.float32)}
+
+
+class PredictionStore(object):
+    '''
+    store = PredictionStore.create(directory, lines, columns, meta)   # columns: {name: (row shape, dtype)}
+    store.write(i, x=..., y=...)
+    store.close()
+
+    store = PredictionStore(directory)
+    store['x'][i], store.lines[i], store.meta['nV']
+    '''
+
+    def __init__(self, directory, mode='r'):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE)) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(directory, LINES_FILE)) as f:
+            self.lines = f.read().splitlines()
+        self.columns = dict((name, np.load(os.path.join(directory, name + '.npy'), mmap_mode=mode))
+                            for name in self.meta['columns'])
+
+    @classmethod
+    def create(cls, directory, lines, columns, meta=None):
+        '''
+        Allocates the columns for len(lines) images. `meta` is saved with the store (sizes, thresholds, ...).
+        '''
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        num_images = len(lines)
+        for name, (shape, dtype) in columns.items():
+            column = np.lib.format.open_memmap(os.path.join(directory, name + '.npy'), mode='w+', dtype=dtype,
+                                               shape=(num_images,) + tuple(shape))
+            del column
+        meta = dict(meta or {})
+        meta['columns'] = sorted(columns)
+        meta['num_images'] = num_images
+        with open(os.path.join(directory, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+        with open(os.path.join(directory, LINES_FILE), 'w') as f:
+            f.write('\n'.join(line.strip() for line in lines) + '\n')
+        return cls(directory, mode='r+')
+
+    def __len__(self):
+        return self.meta['num_images']
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def update_meta(self, **values):
+        '''
+        Adds `values` to the saved meta.
+        '''
+        self.meta.update(values)
+        with open(os.path.join(self.directory, META_FILE), 'w') as f:
+            json.dump(self.meta, f, indent=2, sort_keys=True)
+
+    def write(self, i, **values):
+        for name, value in values.items():
+            self.columns[name][i] = value
+
+    def close(self):
+        for column in self.columns.values():
+            if isinstance(column, np.memmap) and column.mode != 'r':
+                column.flush()
+        self.columns = {}
@@ -0,0 +1,158 @@
+# coding: utf-8
+# Several video files or camera streams sharing one network: every stream is decoded by its own thread
+# into a small buffer, and the scheduler takes the frames of the network batches from the streams in turn.
+
+from __future__ import division, print_function
+
+import time
+import threading
+import collections
+
+import cv2
+
+
+class VideoStream(object):
+    '''
+    Decodes `source` (a video file, a stream URL or a camera index) in a background thread.
+    max_pending: number of decoded frames waiting for the network. When the buffer is full, the oldest frame
+        is dropped if `realtime`, otherwise the reader waits (no frame of a video file is lost).
+    realtime: a video file is read at its frame rate, like a live camera.
+    '''
+
+    def __init__(self, name, source, max_pending=2, realtime=False):
+        self.name = name
+        self.source = source
+        self.max_pending = max_pending
+        self.realtime = realtime
+
+        self.capture = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+        if not self.capture.isOpened():
+            raise IOError('Could not open the video stream {}'.format(source))
+        self.width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps > 0 else 30
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        self.read_count = 0
+        self.dropped = 0
+        self.processed = 0
+        self.condition = None
+        self._frames = collections.deque()
+        self._done = False
+        self._stop = False
+        self._thread = None
+
+    def start(self, condition):
+        '''
+        condition: shared with the scheduler, notified for every new frame and at the end of the stream.
+        '''
+        self.condition = condition
+        self._thread = threading.Thread(target=self._read)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self.condition:
+            self._stop = True
+            self.condition.notify_all()
+        self._thread.join()
+        self.capture.release()
+
+    def pending(self):
+        return len(self._frames)
+
+    def finished(self):
+        return self._done and not self._frames
+
+    def pop(self):
+        '''
+        return: the oldest pending (frame_id, frame), to be called with the condition held.
+        '''
+        frame = self._frames.popleft()
+        self.processed += 1
+        # room for the reader again
+        self.condition.notify_all()
+        return frame
+
+    def _read(self):
+        frame_id = 0
+        start = time.time()
+        while True:
+            ret, frame = self.capture.read()
+            if not ret:
+                break
+            with self.condition:
+                while not self.realtime and len(self._frames) >= self.max_pending and not self._stop:
+                    self.condition.wait()
+                if self._stop:
+                    break
+                if len(self._frames) >= self.max_pending:
+                    # overloaded: the network only sees the most recent frames
+                    self._frames.popleft()
+                    self.dropped += 1
+                self._frames.append((frame_id, frame))
+                self.read_count += 1
+                self.condition.notify_all()
+            frame_id += 1
+            if self.realtime:
+                delay = start + frame_id / float(self.fps) - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+        with self.condition:
+            self._done = True
+            self.condition.notify_all()
+
+
+class StreamScheduler(object):
+    '''
+    Builds the network batches from the pending frames of `streams`, one frame per stream per round,
+    starting after the stream served last. Every stream with frames waiting gets the same share of the
+    network, whatever its frame rate; the streams falling behind drop frames on their own (see `VideoStream`).
+    '''
+
+    def __init__(self, streams, batch_size=4):
+        self.streams = streams
+        self.batch_size = batch_size
+        self.condition = threading.Condition()
+        self._next = 0
+
+    def start(self):
+        for stream in self.streams:
+            stream.start(self.condition)
+
+    def stop(self):
+        for stream in self.streams:
+            stream.stop()
+
+    def next_batch(self):
+        '''
+        Waits for at least one frame.
+        return: list of (stream_index, frame_id, frame), empty once all the streams are finished.
+        '''
+        with self.condition:
+            while not any(stream.pending() for stream in self.streams):
+                if all(stream.finished() for stream in self.streams):
+                    return []
+                self.condition.wait()
+
+            batch = []
+            num_streams = len(self.streams)
+            while len(batch) < self.batch_size:
+                served = False
+                for offset in range(num_streams):
+                    index = (self._next + offset) % num_streams
+                    stream = self.streams[index]
+                    if stream.pending() == 0:
+                        continue
+                    frame_id, frame = stream.pop()
+                    batch.append((index, frame_id, frame))
+                    served = True
+                    if len(batch) == self.batch_size:
+                        self._next = (index + 1) % num_streams
+                        break
+                else:
+                    self._next = (self._next + 1) % num_streams
+                if not served:
+                    break
+            return batch
@@ -0,0 +1,132 @@
+# coding: utf-8
+# Post-processing parameter sweeps over a prediction store (see `utils.prediction_store`): every worker
+# process opens the store memory-mapped and evaluates (configuration, chunk of images) tasks.
+
+from __future__ import division, print_function
+
+import os
+import itertools
+
+import numpy as np
+import cv2
+
+from utils.misc_utils import get_3D_corners
+from utils.calib_utils import get_camera
+from utils.nms_utils import cpu_nms
+from utils.dnn_utils import pose_predict_topk
+from utils.eval_utils import evaluate_candidates
+from utils.pose_eval_utils import PoseEvaluator, keypoints_from_lines
+from utils.prediction_store import PredictionStore
+
+from utils.meshply import MeshPly
+
+PNP_FLAGS = {'epnp': cv2.SOLVEPNP_EPNP, 'iterative': cv2.SOLVEPNP_ITERATIVE, 'ap3p': cv2.SOLVEPNP_AP3P}
+if hasattr(cv2, 'SOLVEPNP_SQPNP'):
+    PNP_FLAGS['sqpnp'] = cv2.SOLVEPNP_SQPNP
+
+# the parameters which need the raw outputs of the network (`test_image_list.py --dump_raw True`)
+RAW_PARAMS = ('score_thresh', 'nms_thresh', 'max_boxes', 'radius')
+
+_worker = {}
+
+
+def parameter_grid(params):
+    '''
+    params: list of (name, values)
+    return: list of dicts, every combination of the values
+    '''
+    names = [name for name, _ in params]
+    return [dict(zip(names, values)) for values in itertools.product(*[values for _, values in params])]
+
+
+def init_worker(store_dir, mesh_path, camera_name, calib_dir, metric_vertices=None):
+    '''
+    Opens the store and the model in a worker process. Also called once in the main process before the pool
+    is started, so the ground truth poses (`gt_poses.npz` of the store) and the decimated vertices are cached
+    before the workers load them.
+    return: the `PoseEvaluator`
+    '''
+    # one OpenCV thread per process, the pool already uses all the cores
+    cv2.setNumThreads(1)
+    store = PredictionStore(store_dir)
+    mesh = MeshPly(mesh_path)
+    vertices = mesh.points
+    corners3D = get_3D_corners(vertices)
+    ref_corners = np.array(np.transpose(corners3D[:3, :]), dtype='float32')
+    camera = get_camera(camera_name or store.meta['camera'], store.meta['image_size'], calib_dir=calib_dir)
+    evaluator = PoseEvaluator(keypoints_from_lines(store.lines, store.meta['nV']), ref_corners, corners3D, vertices,
+                              camera.K, gt_cache=os.path.join(store_dir, 'gt_poses.npz'), num_vertices=metric_vertices,
+                              vertex_cache=os.path.splitext(mesh_path)[0] + '_metric_vertices.npz')
+    _worker.update({'store': store, 'ref_corners': ref_corners, 'camera': camera, 'evaluator': evaluator})
+    return evaluator
+
+
+def decode_raw(store, i, config):
+    '''
+    NMS and keypoint selection of image i from the raw columns of the store, with the thresholds of `config`.
+    return: x, y, conf [best_cnt, nV] in image pixels, None if no box is detected
+    '''
+    meta = store.meta
+    new_w, new_h = meta['new_size']
+    boxes, _, _ = cpu_nms(store['raw_boxes'][i][np.newaxis], store['raw_scores'][i][np.newaxis],
+                          store['raw_scores'].shape[-1], max_boxes=config['max_boxes'],
+                          score_thresh=config['score_thresh'], iou_thresh=config['nms_thresh'])
+    if boxes is None:
+        return None
+    grid_sizes = [(new_h // stride, new_w // stride) for stride in (32, 16, 8)]
+    x, y, conf = pose_predict_topk(store['raw_x'][i], store['raw_y'][i], store['raw_conf'][i], boxes,
+                                   [new_h, new_w], grid_sizes, k=config['best_cnt'], radius=config['radius'])
+    if not meta['letterbox_resize']:
+        # the letterbox column is all 0, same mapping as `test_image_list.py` postprocess
+        return x * new_w, y * new_h, conf
+    ratio, dw, dh = store['letterbox'][i]
+    return (x * new_w - dw) / ratio, (y * new_h - dh) / ratio, conf
+
+
+def evaluate_chunk(task):
+    '''
+    task: (config index, config, image rows)
+    return: config index and, for `PoseErrorStats`: the results of the rows without a pose, the PnP infos and
+        the batched errors of the rows with a pose (None if there is none)
+    '''
+    index, config, rows = task
+    store = _worker['store']
+    raw = any(name in config for name in RAW_PARAMS)
+    failures, pnp_infos = [], []
+    pose_rows, R_pr, t_pr = [], [], []
+    for i in rows:
+        if raw:
+            candidates = decode_raw(store, i, config)
+        elif store['num_boxes'][i] > 0:
+            best_cnt = config['best_cnt']
+            candidates = store['x'][i, :best_cnt], store['y'][i, :best_cnt], store['conf'][i, :best_cnt]
+        else:
+            candidates = None
+        if candidates is None:
+            failures.append({'valid': False, 'corner_dist': None, 'errors': None, 'pnp': None})
+            continue
+
+        result = evaluate_candidates(candidates[0], candidates[1], candidates[2], _worker['ref_corners'],
+                                     _worker['camera'].K, conf_thresh=config['conf_thresh'],
+                                     method=config['pnp_method'], refine=config['pnp_refine'],
+                                     flags=PNP_FLAGS[config['pnp_flags']], reproj_thresh=config['reproj_thresh'])
+        if not result['valid']:
+            failures.append({'valid': False, 'corner_dist': None, 'errors': None, 'pnp': result['pnp']})
+            continue
+        pnp_infos.append(result['pnp'])
+        pose_rows.append(i)
+        R_pr.append(result['R'])
+        t_pr.append(result['t'])
+    errors = _worker['evaluator'].errors(R_pr, t_pr, pose_rows) if pose_rows else None
+    return index, failures, pnp_infos, errors
+
+
+def pareto_front(accuracy, cost):
+    '''
+    return: bool mask of the points no other point beats on both axes (higher accuracy, lower cost)
+    '''
+    accuracy = np.asarray(accuracy, np.float64)
+    cost = np.asarray(cost, np.float64)
+    dominated = ((accuracy[np.newaxis] >= accuracy[:, np.newaxis]) & (cost[np.newaxis] <= cost[:, np.newaxis]) &
+                 ((accuracy[np.newaxis] > accuracy[:, np.newaxis]) | (cost[np.newaxis] < cost[:, np.newaxis])))
+    return ~dominated.any(axis=1)
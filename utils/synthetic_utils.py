@@ -0,0 +1,203 @@
+# coding: utf-8
+# Synthetic pose data: random camera intrinsics and object poses, and simple renderings of the object
+# (a textured box or the silhouette of a mesh) with the label lines of final_train.txt / pool_test.txt.
+
+from __future__ import division, print_function
+
+import numpy as np
+import cv2
+
+from utils.misc_utils import get_3D_corners, compute_projection
+
+# corners of `get_3D_corners`, the index bits are (x is max, y is max, z is max)
+BOX_FACES = [[0, 1, 3, 2], [4, 6, 7, 5], [0, 4, 5, 1], [2, 3, 7, 6], [0, 2, 6, 4], [1, 5, 7, 3]]
+
+
+def rotation_from_euler(roll, pitch, yaw):
+    '''
+    R = Rz(yaw) * Ry(pitch) * Rx(roll), angles in radians.
+    Same convention as `utils.eval_utils.euler_from_rotation_matrix`.
+    '''
+    cr, sr = np.cos(roll), np.sin(roll)
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    Rx = np.array([[1, 0, 0], [0, cr, -sr], [0, sr, cr]])
+    Ry = np.array([[cp, 0, sp], [0, 1, 0], [-sp, 0, cp]])
+    Rz = np.array([[cy, -sy, 0], [sy, cy, 0], [0, 0, 1]])
+    return Rz.dot(Ry).dot(Rx)
+
+
+def box_vertices(size):
+    '''
+    The 8 corners of a box of size (x, y, z) centered on the origin, [4, 8] homogeneous.
+    '''
+    half = np.asarray(size, np.float64) / 2.
+    return get_3D_corners(np.array([-half, half]).transpose())
+
+
+def write_box_ply(path, size):
+    '''
+    ASCII PLY of the box (vertices with normals, triangles), readable by `MeshPly`.
+    '''
+    corners = box_vertices(size)[:3].transpose()
+    # the normal of a corner points away from the center
+    normals = corners / np.linalg.norm(corners, axis=1, keepdims=True)
+    triangles = []
+    for a, b, c, d in BOX_FACES:
+        triangles += [[a, b, c], [a, c, d]]
+    with open(path, 'w') as f:
+        f.write('ply\nformat ascii 1.0\n')
+        f.write('element vertex {}\n'.format(len(corners)))
+        f.write('property float x\nproperty float y\nproperty float z\n')
+        f.write('property float nx\nproperty float ny\nproperty float nz\n')
+        f.write('element face {}\n'.format(len(triangles)))
+        f.write('property list uchar int vertex_indices\nend_header\n')
+        for corner, normal in zip(corners, normals):
+            f.write('{:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f}\n'.format(*(list(corner) + list(normal))))
+        for triangle in triangles:
+            f.write('3 {} {} {}\n'.format(*triangle))
+
+
+def keypoints_3d(vertices, nV=9):
+    '''
+    The keypoints of the label files: the 8 corners of the 3D bounding box of `vertices` ([4, N] homogeneous),
+    then the origin of the object model if nV is 9.
+    return: [4, nV] homogeneous
+    '''
+    corners = get_3D_corners(vertices)
+    if nV == 9:
+        corners = np.c_[corners, [0., 0., 0., 1.]]
+    return corners
+
+
+def sample_intrinsics(K, rng, focal_jitter=0., center_jitter=0.):
+    '''
+    K with the focal lengths scaled by 1 + U(-focal_jitter, focal_jitter) and the principal point moved by
+    U(-center_jitter, center_jitter) times the image size (2 * cx, 2 * cy).
+    '''
+    K = np.array(K, np.float64)
+    scale = 1. + rng.uniform(-focal_jitter, focal_jitter)
+    K[0, 0] *= scale
+    K[1, 1] *= scale
+    K[0, 2] += rng.uniform(-center_jitter, center_jitter) * 2 * K[0, 2]
+    K[1, 2] += rng.uniform(-center_jitter, center_jitter) * 2 * K[1, 2]
+    return K
+
+
+def sample_pose(rng, K, image_size, distance=(1.5, 6.), roll=(-30., 30.), pitch=(-30., 30.), yaw=(-180., 180.),
+                margin=0.1):
+    '''
+    Random object pose: Euler angles uniform in the given ranges (degrees), distance uniform in `distance`
+    (meters), and the object center projected uniformly in the image, at least `margin` times the image
+    size away from the borders.
+    return: rt [3, 4]
+    '''
+    width, height = image_size
+    R = rotation_from_euler(*np.deg2rad([rng.uniform(*roll), rng.uniform(*pitch), rng.uniform(*yaw)]))
+    z = rng.uniform(*distance)
+    u = rng.uniform(margin * width, (1 - margin) * width)
+    v = rng.uniform(margin * height, (1 - margin) * height)
+    t = z * np.linalg.inv(K).dot([u, v, 1.])
+    return np.c_[R, t]
+
+
+def render_background(rng, width, height):
+    '''
+    Underwater-like background: a blue-green vertical gradient with low-frequency blobs and noise.
+    '''
+    top = np.array([rng.uniform(120, 220), rng.uniform(100, 200), rng.uniform(20, 80)])
+    bottom = top * rng.uniform(0.3, 0.7)
+    alpha = np.linspace(0, 1, height)[:, np.newaxis, np.newaxis]
+    img = (1 - alpha) * top + alpha * bottom
+    blobs = cv2.resize(rng.normal(0, 25, (6, 8, 3)), (width, height), interpolation=cv2.INTER_CUBIC)
+    img = img + blobs + rng.normal(0, 4, (height, width, 3))
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def random_texture(rng, size=64):
+    '''
+    Checkerboard of two random colors with noise, uint8 [size, size, 3].
+    '''
+    cells = rng.randint(2, 8)
+    colors = rng.randint(0, 256, (2, 3))
+    ij = np.arange(size) * cells // size
+    checker = (ij[:, np.newaxis] + ij[np.newaxis]) % 2
+    texture = colors[checker] + rng.normal(0, 10, (size, size, 3))
+    return np.clip(texture, 0, 255).astype(np.uint8)
+
+
+def render_box(img, vertices, rt, K, rng):
+    '''
+    Draw the faces of the box `vertices` ([4, 8], see `box_vertices`) which face the camera, each one
+    with its own random texture warped on it and a Lambertian shading.
+    '''
+    height, width = img.shape[:2]
+    corners_cam = rt.dot(vertices)
+    proj = compute_projection(vertices, rt, K)
+    center = corners_cam.mean(axis=1)
+    for face in BOX_FACES:
+        face_center = corners_cam[:, face].mean(axis=1)
+        normal = face_center - center
+        normal /= np.linalg.norm(normal)
+        cos_view = -normal.dot(face_center) / np.linalg.norm(face_center)
+        if cos_view <= 0:
+            continue
+        texture = random_texture(rng)
+        size = texture.shape[0]
+        src = np.float32([[0, 0], [size, 0], [size, size], [0, size]])
+        dst = np.float32(proj[:, face].transpose())
+        H = cv2.getPerspectiveTransform(src, dst)
+        warped = cv2.warpPerspective(texture, H, (width, height))
+        mask = np.zeros((height, width), np.uint8)
+        cv2.fillConvexPoly(mask, np.round(dst).astype(np.int32), 255)
+        shade = 0.4 + 0.6 * cos_view
+        img[mask > 0] = (warped[mask > 0] * shade).astype(np.uint8)
+    return img
+
+
+def render_silhouette(img, vertices, triangles, rt, K, rng):
+    '''
+    Fill the projected triangles of a mesh (vertices [4, N] homogeneous, triangles [T, 3] vertex indices)
+    with one random textured color.
+    '''
+    height, width = img.shape[:2]
+    proj = compute_projection(vertices, rt, K).transpose()
+    polygons = np.round(proj[np.asarray(triangles, np.int64)]).astype(np.int32)
+    mask = np.zeros((height, width), np.uint8)
+    cv2.fillPoly(mask, list(polygons), 255)
+    texture = cv2.resize(random_texture(rng), (width, height), interpolation=cv2.INTER_NEAREST)
+    img[mask > 0] = texture[mask > 0]
+    return img
+
+
+def projected_bbox(vertices, rt, K, image_size):
+    '''
+    2D box (x_min, y_min, x_max, y_max) of the projected `vertices`, clipped to the image.
+    '''
+    proj = compute_projection(vertices, rt, K)
+    x_min, y_min = np.maximum(proj.min(axis=1), 0)
+    x_max = min(proj[0].max(), image_size[0] - 1)
+    y_max = min(proj[1].max(), image_size[1] - 1)
+    return x_min, y_min, x_max, y_max
+
+
+def keypoints_visible(keypoints, rt, K, image_size):
+    '''
+    Whether all the keypoints ([4, nV] homogeneous) are in front of the camera and in the image.
+    '''
+    if np.any(rt.dot(keypoints)[2] <= 0.1):
+        return False
+    proj = compute_projection(keypoints, rt, K)
+    return bool(np.all(proj >= 0) and np.all(proj[0] < image_size[0]) and np.all(proj[1] < image_size[1]))
+
+
+def label_line(index, path, image_size, bbox, keypoints_2d, label=0, with_bbox=True):
+    '''
+    A line of final_train.txt (`with_bbox`) or pool_test.txt:
+        index path width height label [x_min y_min x_max y_max] x1 y1 ... xnV ynV
+    '''
+    fields = [str(index), path, str(image_size[0]), str(image_size[1]), str(label)]
+    if with_bbox:
+        fields += ['{:.0f}'.format(v) for v in bbox]
+    fields += ['{:.2f}'.format(v) for v in np.asarray(keypoints_2d).transpose().reshape(-1)]
+    return ' '.join(fields)
@@ -0,0 +1,227 @@
+# coding: utf-8
+# Wall time of the stages of the inference scripts (decode, letterbox, sess.run, PnP, ...), with percentiles
+# and throughput at the end of a run. The per-frame timings can be exported to a JSON lines file or read
+# from a local metrics endpoint while the run goes on.
+
+from __future__ import division, print_function
+
+import json
+import time
+import array
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# in pipeline order, for the report
+STAGES = ('decode', 'rectify', 'letterbox', 'feed', 'sess_run', 'nms_decode', 'pnp', 'metrics', 'draw', 'encode')
+
+
+class _Stage(object):
+    __slots__ = ('timer', 'name', 'frame_id', 'start')
+
+    def __init__(self, timer, name, frame_id):
+        self.timer = timer
+        self.name = name
+        self.frame_id = frame_id
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.add(self.name, time.perf_counter() - self.start, self.frame_id)
+        return False
+
+
+class _NoStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class StageTimer(object):
+    '''
+    Thread-safe: the stages of one frame may run in different threads.
+        with timer.stage('pnp', frame_id):
+            ...
+        timer.frame_done(frame_id)    # exports the timings of the frame
+    A disabled timer does nothing, so the calls can stay in the scripts.
+    '''
+
+    def __init__(self, enabled=True, exporters=None):
+        self.enabled = enabled
+        self.exporters = [] if exporters is None else list(exporters)
+        self._lock = threading.Lock()
+        # stage -> samples in seconds, as compact arrays for long runs
+        self._samples = {}
+        self._frames = {}
+        self._frame_count = 0
+        self._start = None
+        self._end = None
+
+    def stage(self, name, frame_id=None):
+        if not self.enabled:
+            return _NO_STAGE
+        return _Stage(self, name, frame_id)
+
+    def add(self, name, seconds, frame_ids=None):
+        '''
+        Record `seconds` for stage `name`. For a batched stage, `frame_ids` is the list of the frames of the
+        batch: every frame is charged its share.
+        '''
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if isinstance(frame_ids, (list, tuple)):
+            shares = [(frame_id, seconds / len(frame_ids)) for frame_id in frame_ids]
+        else:
+            shares = [(frame_ids, seconds)]
+        with self._lock:
+            if self._start is None:
+                self._start = now - seconds
+            samples = self._samples.setdefault(name, array.array('d'))
+            for frame_id, share in shares:
+                samples.append(share)
+                if frame_id is not None:
+                    timings = self._frames.setdefault(frame_id, {})
+                    timings[name] = timings.get(name, 0.) + share
+
+    def frame_done(self, frame_id):
+        if not self.enabled:
+            return
+        with self._lock:
+            timings = self._frames.pop(frame_id, {})
+            self._frame_count += 1
+            self._end = time.perf_counter()
+        timings = dict((name, seconds * 1000) for name, seconds in timings.items())
+        for exporter in self.exporters:
+            exporter.export(frame_id, timings)
+
+    def summary(self):
+        '''
+        return: {'frames', 'wall', 'throughput', 'stages': {stage: {'count', 'mean', 'p50', 'p95', 'p99', 'total'}}}
+            times in ms, wall time in s, throughput in frames per second
+        '''
+        with self._lock:
+            samples = dict((name, np.frombuffer(values, np.float64).copy()) for name, values in self._samples.items())
+            frame_count = self._frame_count
+            wall = (self._end - self._start) if self._start is not None and self._end is not None else 0.
+
+        stages = {}
+        for name, values in samples.items():
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+            stages[name] = {'count': len(values), 'mean': values.mean() * 1000, 'p50': p50, 'p95': p95,
+                            'p99': p99, 'total': values.sum() * 1000}
+        return {'frames': frame_count, 'wall': wall, 'throughput': frame_count / wall if wall > 0 else 0.,
+                'stages': stages}
+
+    def report(self, print_fn=print):
+        if not self.enabled:
+            return
+        summary = self.summary()
+        print_fn('{:<12}{:>8}{:>10}{:>10}{:>10}{:>10}'.format('stage (ms)', 'count', 'mean', 'p50', 'p95', 'p99'))
+        names = [name for name in STAGES if name in summary['stages']] + \
+                sorted(name for name in summary['stages'] if name not in STAGES)
+        for name in names:
+            stats = summary['stages'][name]
+            print_fn('{:<12}{:>8}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}'.format(
+                name, stats['count'], stats['mean'], stats['p50'], stats['p95'], stats['p99']))
+        print_fn('{} frames in {:.2f} s: {:.2f} frames/s'.format(summary['frames'], summary['wall'],
+                                                                 summary['throughput']))
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+
+
+class JsonLinesExporter(object):
+    '''
+    One line per frame: {"frame": frame_id, "decode": ms, ...}
+    '''
+
+    def __init__(self, path):
+        self._file = open(path, 'w')
+        self._lock = threading.Lock()
+
+    def export(self, frame_id, timings):
+        record = {'frame': frame_id}
+        record.update(timings)
+        line = json.dumps(record)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+class MetricsEndpoint(object):
+    '''
+    Serves the summary of `timer` at http://host:port/metrics, in the Prometheus text format.
+    The percentiles are only computed when the endpoint is read.
+    '''
+
+    def __init__(self, timer, port, host='127.0.0.1'):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = endpoint.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.timer = timer
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def render(self):
+        summary = self.timer.summary()
+        lines = ['deepurl_frames_total {}'.format(summary['frames']),
+                 'deepurl_throughput_fps {:.4f}'.format(summary['throughput'])]
+        for name, stats in sorted(summary['stages'].items()):
+            for quantile in ('p50', 'p95', 'p99'):
+                lines.append('deepurl_stage_ms{{stage="{}",quantile="0.{}"}} {:.4f}'.format(
+                    name, quantile[1:], stats[quantile]))
+            lines.append('deepurl_stage_ms_sum{{stage="{}"}} {:.4f}'.format(name, stats['total']))
+            lines.append('deepurl_stage_ms_count{{stage="{}"}} {}'.format(name, stats['count']))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, frame_id, timings):
+        pass
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def create_timer(enabled=True, timing_file=None, metrics_port=0):
+    '''
+    A StageTimer exporting to `timing_file` (JSON lines) and serving the summary on `metrics_port`, if given.
+    '''
+    timer = StageTimer(enabled=enabled)
+    if enabled and timing_file:
+        timer.exporters.append(JsonLinesExporter(timing_file))
+    if enabled and metrics_port:
+        timer.exporters.append(MetricsEndpoint(timer, metrics_port))
+    return timer
@@ -0,0 +1,108 @@
+# coding: utf-8
+# Region of interest tracking for video sequences: the target found in the last frames gives a padded
+# crop of the next ones, so the network sees the AUV at a higher resolution than in the whole frame.
+
+from __future__ import division, print_function
+
+import threading
+import numpy as np
+
+
+class RoiTracker(object):
+    '''
+    frame_size: (width, height) of the frames
+    input_size: (width, height) of the network input the crop is letterboxed to. The crop has the
+        same aspect ratio, so the letterbox does not waste input pixels.
+    padding: margin added around the target on every side, relative to the target size
+    min_size: minimum crop width in pixels, by default the input width (the crop is never upsampled)
+    max_coverage: above this fraction of the frame width or height, the whole frame is used
+    '''
+
+    def __init__(self, frame_size, input_size, padding=0.5, min_size=None, max_coverage=0.8):
+        self.frame_size = (int(frame_size[0]), int(frame_size[1]))
+        self.input_size = (int(input_size[0]), int(input_size[1]))
+        self.padding = padding
+        self.min_size = self.input_size[0] if min_size is None else min_size
+        self.max_coverage = max_coverage
+
+        self._lock = threading.Lock()
+        self._roi = None
+        self._target_size = None
+        self._last_frame = -1
+
+    def reset(self):
+        with self._lock:
+            self._roi = None
+            self._target_size = None
+            self._last_frame = -1
+
+    def update(self, frame_id, points=None):
+        '''
+        points: [N, 2] pixel coordinates of the target in frame `frame_id` (projected 3D corners or
+            box corners), None if it was lost.
+        Results of older frames than the last update are ignored, they may come back out of order.
+        '''
+        roi = None if points is None else self.compute_roi(points)
+        target_size = None
+        if points is not None:
+            points = np.asarray(points, np.float64).reshape(-1, 2)
+            target_size = tuple(points.max(axis=0) - points.min(axis=0))
+        with self._lock:
+            if frame_id < self._last_frame:
+                return
+            self._last_frame = frame_id
+            self._roi = roi
+            self._target_size = target_size
+
+    def roi(self):
+        '''
+        return: the crop (x0, y0, x1, y1) for the next frame, None for the whole frame.
+        '''
+        with self._lock:
+            return self._roi
+
+    def target_size(self):
+        '''
+        return: (width, height) of the target in the last frame, in frame pixels, None if it was lost.
+        '''
+        with self._lock:
+            return self._target_size
+
+    def compute_roi(self, points):
+        return compute_roi(points, self.frame_size, self.input_size, padding=self.padding, min_size=self.min_size,
+                           max_coverage=self.max_coverage)
+
+
+def compute_roi(points, frame_size, input_size, padding=0.5, min_size=0, max_coverage=0.8):
+    '''
+    Padded crop around `points` ([N, 2] pixel coordinates), with the aspect ratio of `input_size`.
+    See `RoiTracker` for the parameters.
+    return: (x0, y0, x1, y1), None if the target is out of the frame or the crop would cover most of it.
+    '''
+    points = np.asarray(points, np.float64).reshape(-1, 2)
+    if not np.all(np.isfinite(points)):
+        return None
+    frame_w, frame_h = frame_size
+    x_min, y_min = points.min(axis=0)
+    x_max, y_max = points.max(axis=0)
+    # only keep the target when it is (partly) in the frame
+    if x_max < 0 or y_max < 0 or x_min >= frame_w or y_min >= frame_h:
+        return None
+
+    center_x = (x_min + x_max) / 2.
+    center_y = (y_min + y_max) / 2.
+    width = (x_max - x_min) * (1. + 2. * padding)
+    height = (y_max - y_min) * (1. + 2. * padding)
+
+    # same aspect ratio as the network input
+    aspect = input_size[0] / float(input_size[1])
+    width = max(width, height * aspect, min_size)
+    height = width / aspect
+
+    if width >= max_coverage * frame_w or height >= max_coverage * frame_h:
+        return None
+
+    # shift the crop inside the frame rather than shrinking it
+    x0 = int(round(min(max(center_x - width / 2., 0), frame_w - width)))
+    y0 = int(round(min(max(center_y - height / 2., 0), frame_h - height)))
+    return x0, y0, x0 + int(round(width)), y0 + int(round(height))